@@ -4,6 +4,9 @@
 
 __author__ = 'Lex Darlog (DRL)'
 
+from ._broken_stories import BrokenStoryDetector
 from ._data_objects import Category, ShortStoryMeta, Story
 from ._dataset_db import DataSetDB
 from ._dataset_loader import DataSetLoader, PathLike
+from ._keyword_groups import KeywordGroups
+from ._story_index import StoriesView
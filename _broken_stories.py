@@ -0,0 +1,148 @@
+# encoding: utf-8
+"""
+Detection of broken stories: the ones with a scraped mess of HTML/JS instead of the actual text.
+"""
+
+import typing as _t
+
+from attrs import define, field
+
+from functools import partial
+import re
+
+from ._data_objects import Story
+from ._parallel import map_batches_in_workers
+from ._text_store import TextRef
+
+# Case-insensitive:
+_html_js_markers = (
+	'<script', '</script>', '<div', '</div>', '<iframe', '<!doctype html', '<meta ', '<link rel=',
+	'function(', 'document.getelementby', 'document.write(', 'window.location', 'javascript:', 'googletag.',
+)
+_default_suffixes = ("COVID-19 RESOURCES", )
+_default_markup_chars = '<>{}'
+_strict_max_markup_density = 0.01
+
+# Trailing whitespace longer than that is unlikely. Checking only the tail avoids copying the whole text:
+_suffix_tail_slack = 256
+
+
+@define(frozen=True, eq=False)
+class BrokenStoryDetector:
+	"""
+	Checks a story text for several signs of garbage, in the order of how cheap they are:
+	- one of the known suffixes (like the COVID-19 resources block at the end of scraped pages);
+	- markup density: the share of HTML/JS-specific characters (regular prose barely has any);
+	- known HTML/JS markers, all of them searched for in a single pass;
+	- any extra custom checks.
+
+	By default, only the suffix is checked, exactly as it always was. The other heuristics are opt-in
+	(see `strict()`): they catch more garbage, but can also flag a legit story which happens to quote some code.
+
+	Verdicts for lazily loaded texts are cached within the detector (see `are_broken()`),
+	so repeated checks don't read them from disk again. That's why it's immutable:
+	create a new detector to check with different settings.
+	To use it in parallel, custom checks have to be picklable: module-level functions.
+	"""
+	markers: _t.Tuple[str, ...] = field(default=tuple(), converter=tuple)
+	# The text is broken if at least this many markers are found:
+	min_marker_hits: int = field(default=3)
+	suffixes: _t.Tuple[str, ...] = field(default=_default_suffixes, converter=tuple)
+	markup_chars: str = field(default=_default_markup_chars)
+	# The text is broken if markup characters make at least this share of it (None - don't check the density)...
+	max_markup_density: _t.Optional[float] = field(default=None)
+	# ... and there are at least this many of them (to not flag a short story with a couple of emoticons):
+	min_markup_chars: int = field(default=50)
+	extra_checks: _t.Tuple[_t.Callable[[str], bool], ...] = field(default=tuple(), converter=tuple)
+
+	_markers_re: _t.Optional[re.Pattern] = field(init=False, repr=False)
+	_verdicts_cache: _t.Dict[TextRef, bool] = field(init=False, factory=dict, repr=False)
+
+	@classmethod
+	def strict(cls, **kwargs) -> 'BrokenStoryDetector':
+		"""
+		A detector with all the heuristics enabled: the known HTML/JS markers and markup density,
+		in addition to the suffixes. Any of the settings can still be overridden with keyword arguments.
+		"""
+		kwargs.setdefault('markers', _html_js_markers)
+		kwargs.setdefault('max_markup_density', _strict_max_markup_density)
+		return cls(**kwargs)
+
+	@_markers_re.default
+	def _markers_re_default(self):
+		if not self.markers:
+			return None
+		return re.compile('|'.join(map(re.escape, self.markers)), re.IGNORECASE)
+
+	def __reduce__(self):
+		# Sent to worker processes without the cache:
+		return partial(BrokenStoryDetector, **{
+			x: getattr(self, x) for x in (
+				'markers', 'min_marker_hits', 'suffixes', 'markup_chars', 'max_markup_density', 'min_markup_chars',
+				'extra_checks',
+			)
+		}), tuple()
+
+	def _has_suffix(self, text: str) -> bool:
+		if not self.suffixes:
+			return False
+		max_suffix_len = max(map(len, self.suffixes))
+		tail_size = max_suffix_len + _suffix_tail_slack
+		tail = text[-tail_size:].rstrip()
+		if len(tail) < max_suffix_len and len(text) > tail_size:
+			# Even longer trailing whitespace. Rare, so it's OK to strip the whole text:
+			tail = text.rstrip()
+		return tail.endswith(self.suffixes)
+
+	def _is_markup_dense(self, text: str) -> bool:
+		if self.max_markup_density is None or not text:
+			return False
+		n_markup_chars = sum(map(text.count, self.markup_chars))
+		return n_markup_chars >= self.min_markup_chars and n_markup_chars >= len(text) * self.max_markup_density
+
+	def _has_markers(self, text: str) -> bool:
+		markers_re = self._markers_re
+		if markers_re is None:
+			return False
+		min_hits = self.min_marker_hits
+		for n_hits, _ in enumerate(markers_re.finditer(text), start=1):
+			if n_hits >= min_hits:
+				return True
+		return False
+
+	def is_broken_text(self, text: str) -> bool:
+		"""A single check, without the cache."""
+		return (
+			self._has_suffix(text) or self._is_markup_dense(text) or self._has_markers(text)
+			or any(check_f(text) for check_f in self.extra_checks)
+		)
+
+	def _are_broken_texts(self, texts: _t.List[_t.Union[str, TextRef]]) -> _t.List[bool]:
+		"""Executed in worker processes."""
+		is_broken_f = self.is_broken_text
+		return [is_broken_f(text.resolve() if isinstance(text, TextRef) else text) for text in texts]
+
+	def are_broken(self, stories: _t.List[Story], workers: _t.Optional[int] = 1) -> _t.List[bool]:
+		"""
+		Verdict for each story. The stories which aren't cached yet are checked in `workers` processes
+		(0 or less - as many as CPU cores). When enabled on Windows, make sure your main script is guarded
+		with `if __name__ == '__main__':`
+
+		Only the verdicts for lazily loaded texts are cached, by their handles. Texts already in memory are cheap
+		to check again, and identifying them by anything short of the whole text (like its hash) isn't reliable.
+		"""
+		cache = self._verdicts_cache
+		texts = [story.text_or_ref for story in stories]
+		verdicts: _t.List[_t.Optional[bool]] = [
+			cache.get(text) if isinstance(text, TextRef) else None for text in texts
+		]
+
+		unknown = [i for i, verdict in enumerate(verdicts) if verdict is None]
+		if unknown:
+			unknown_verdicts = map_batches_in_workers(self._are_broken_texts, [texts[i] for i in unknown], workers)
+			for i, verdict in zip(unknown, unknown_verdicts):
+				verdicts[i] = verdict
+				text = texts[i]
+				if isinstance(text, TextRef):
+					cache[text] = verdict
+		return verdicts
@@ -4,7 +4,19 @@
 
 import typing as _t
 
-from attrs import define, field, validators as v
+from attrs import define, field, fields, validators as v
+from operator import itemgetter
+from sys import intern
+
+from ._text_store import TextRef
+
+
+def _resolved_text(text: _t.Union[str, TextRef]) -> str:
+	return text.resolve() if isinstance(text, TextRef) else text
+
+
+def _interned_ids(ids: _t.Iterable[str]) -> _t.Set[str]:
+	return set(map(intern, ids))
 
 
 @define
@@ -23,17 +35,30 @@ class Category:
 	def keywords(self):
 		return list(self.stories_by_keyword.keys())
 
-	@property
-	def _json_basename(self) -> str:
-		return self.category.replace("/", " & ")
+	def compact(self) -> 'Category':
+		"""
+		In-place. Intern all the story IDs and keywords, so that the same strings aren't duplicated in memory
+		across categories and stories. Returns the category itself, for chaining.
+		"""
+		self.stories = _interned_ids(self.stories)
+		self.stories_by_keyword = {
+			intern(k): _interned_ids(v) for k, v in self.stories_by_keyword.items()
+		}
+		return self
+
+	@staticmethod
+	def json_filenames_of(category: str) -> _t.Tuple[str, str]:
+		"""Names of the category's keywords and stories files, by the category name alone."""
+		basename = category.replace("/", " & ")
+		return f"{basename}_keywords_top.json", f"{basename}_stories.json"
 
 	@property
 	def json_keywords_filename(self) -> str:
-		return f"{self._json_basename}_keywords_top.json"
+		return self.json_filenames_of(self.category)[0]
 
 	@property
 	def json_stories_filename(self) -> str:
-		return f"{self._json_basename}_stories.json"
+		return self.json_filenames_of(self.category)[1]
 
 	@staticmethod
 	def deserialize_json_dict(**kwargs):
@@ -85,8 +110,11 @@ class Story:
 	category: str = field()
 	rating: float = field()
 	description: str = field()
-	keywords: _t.Set[str] = field(factory=set)
-	text: str = field(default='')
+	# A set, or a sorted tuple of interned strings - if the story is `compact()`. Both are considered equal:
+	keywords: _t.Union[_t.Set[str], _t.Tuple[str, ...]] = field(factory=set, eq=frozenset)
+	# Either the text itself or a lazy handle to it (when the dataset is loaded with `lazy_text`).
+	# Compared by actual text, so the storage type doesn't affect equality:
+	_text: _t.Union[str, TextRef] = field(default='', eq=_resolved_text)
 	page_count: int = field(
 		default=1,
 		validator=[v.instance_of(int), v.gt(0)]
@@ -97,6 +125,50 @@ class Story:
 	)
 	author: str = field(default='')
 	date_approved: str = field(default='')
+	# See `is_text_original`:
+	_text_is_original: bool = field(default=False, init=False, eq=False, repr=False)
+
+	@property
+	def text(self) -> str:
+		"""Story text. If it's stored lazily, it's read from disk on each access (and not kept in memory)."""
+		return _resolved_text(self._text)
+
+	@text.setter
+	def text(self, value: _t.Union[str, TextRef]):
+		self._text = value
+		self._text_is_original = False
+
+	@property
+	def is_text_original(self) -> bool:
+		"""
+		Whether the text is exactly the one loaded from the dataset files - so anything precomputed from them
+		(text indexes, near-duplicate signatures) is valid for it. Assigning a new text resets it,
+		and a story created by any other means doesn't have it in the first place.
+		"""
+		return self._text_is_original
+
+	@property
+	def is_text_loaded(self) -> bool:
+		return not isinstance(self._text, TextRef)
+
+	@property
+	def text_or_ref(self) -> _t.Union[str, TextRef]:
+		"""The text as it's stored: either the text itself or a lazy handle to it. Cheap to pass to a worker process."""
+		return self._text
+
+	def compact(self) -> 'Story':
+		"""
+		In-place. Reduce the memory footprint of the story metadata:
+		- intern the strings which are shared between many stories (id, category, author, keywords);
+		- replace the set of keywords with a sorted tuple, which is several times smaller.
+
+		Returns the story itself, for chaining.
+		"""
+		self.id = intern(self.id)
+		self.category = intern(self.category)
+		self.author = intern(self.author)
+		self.keywords = tuple(sorted(set(map(intern, self.keywords))))
+		return self
 
 	@staticmethod
 	def deserialize_json_dict(**kwargs):
@@ -104,6 +176,26 @@ def deserialize_json_dict(**kwargs):
 			kwargs['keywords'] = set(kwargs['keywords'])
 		return Story(**kwargs)
 
+	@staticmethod
+	def deserialize_json_dicts(raw_json_data: _t.Dict[str, dict]) -> _t.Dict[str, 'Story']:
+		"""
+		Bulk version of `deserialize_json_dict()`, used for loading the dataset.
+		The given dict is consumed: each raw story dict is removed from it right when the story is created.
+
+		Each story dict is checked with a few plain comparisons, the same ones `Story` validators do.
+		The valid ones with all the fields present are built bypassing `__init__()` and per-field validators.
+		Only an invalid one is built the regular way - to raise the usual error.
+		"""
+		trusted_f = _deserialize_story_json_dict_trusted
+		validated_f = _deserialize_story_json_dict_validated
+		is_valid_f = _is_valid_story_dict
+
+		stories: _t.Dict[str, Story] = dict()
+		for x_id in list(raw_json_data.keys()):
+			x_dict = raw_json_data.pop(x_id)
+			stories[x_id] = trusted_f(x_dict) if is_valid_f(x_dict) else validated_f(x_dict)
+		return stories
+
 	def serialize_to_dict(self):
 		return dict(
 			id=self.id,
@@ -120,8 +212,59 @@ def serialize_to_dict(self):
 			date_approved=self.date_approved
 		)
 
-	def dumped_as_output_text(self) -> str:
+	@staticmethod
+	def output_text_of(title: str, keywords: _t.Iterable[str], text: str) -> str:
+		"""The same as `dumped_as_output_text()`, from the story's parts."""
 		# Template from: https://tapwavezodiac.github.io/novelaiUKB/The-Rabbit-Hole.html
-		tags = ', '.join(self.keywords)
-		header = f"[ Title: {self.title.strip()};\nTags: {tags} ]"
-		return f"{header}\n***\n{self.text.strip()}"
+		tags = ', '.join(keywords)
+		header = f"[ Title: {title.strip()};\nTags: {tags} ]"
+		return f"{header}\n***\n{text.strip()}"
+
+	def dumped_as_output_text(self) -> str:
+		return self.output_text_of(self.title, self.keywords, self.text)
+
+
+# Trusted construction of stories.
+# Slotted attrs class stores each field in a slot descriptor, so we can assign them directly:
+_story_fields = tuple(x for x in fields(Story) if x.init)
+_story_json_keys = frozenset(x.name.lstrip('_') for x in _story_fields)
+_story_json_values_getter = itemgetter(*(x.name.lstrip('_') for x in _story_fields))
+_story_slot_setters = tuple(getattr(Story, x.name).__set__ for x in _story_fields)
+_story_text_is_original_setter = Story._text_is_original.__set__
+_story_new = Story.__new__
+
+
+def mark_original_texts(stories: _t.Iterable[Story]):
+	"""Used by the loader: the stories' texts are just loaded from the dataset files (see `Story.is_text_original`)."""
+	for story in stories:
+		_story_text_is_original_setter(story, True)
+
+
+def _is_valid_story_dict(story_dict: dict) -> bool:
+	"""The same checks which are done by `Story` validators."""
+	story_id = story_dict.get('id')
+	if not (isinstance(story_id, str) and story_id):
+		return False
+	for count_key in ('page_count', 'word_count'):
+		if count_key not in story_dict:
+			continue
+		count = story_dict[count_key]
+		if not (isinstance(count, int) and count > 0):
+			return False
+	return True
+
+
+def _deserialize_story_json_dict_validated(story_dict: dict) -> Story:
+	return Story.deserialize_json_dict(**story_dict)
+
+
+def _deserialize_story_json_dict_trusted(story_dict: dict) -> Story:
+	if story_dict.keys() != _story_json_keys:
+		# Some fields are missing (defaults are needed) or there are unknown ones (error is needed):
+		return Story.deserialize_json_dict(**story_dict)
+	story_dict['keywords'] = set(story_dict['keywords'])
+	story = _story_new(Story)
+	for setter, value in zip(_story_slot_setters, _story_json_values_getter(story_dict)):
+		setter(story, value)
+	_story_text_is_original_setter(story, False)
+	return story
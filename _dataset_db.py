@@ -5,15 +5,48 @@
 import typing as _t
 
 from attrs import define, field
-from itertools import chain, islice
+from functools import partial
+from itertools import accumulate, chain, compress, islice
+import json
+from math import ceil, floor
+from operator import eq
 from os import getcwd
 from os.path import isabs
 from pathlib import Path
+import re
 
+from ._broken_stories import BrokenStoryDetector
 from ._data_objects import Category, Story
 from ._dataset_loader import DataSetLoader as _DataSetLoader, PathLike as _PathLike
+from ._keyword_groups import KeywordGroups
+from ._query_plan import (
+	FilterStep as _FilterStep, SortStep as _SortStep, ExtractStep as _ExtractStep, SelectStep as _SelectStep,
+	LimitStep as _LimitStep,
+	PlanStep as _PlanStep,
+	execute_plan as _execute_plan, split_trailing_sorts as _split_trailing_sorts,
+	cost_keyword_bits as _cost_keyword_bits, cost_column_bits as _cost_column_bits,
+	cost_text_index_bits as _cost_text_index_bits, cost_text_scan as _cost_text_scan,
+)
+from ._near_dups import minhash_signature, near_duplicate_representatives
+from ._parallel import map_batches_in_workers, map_in_workers, workers_number
+from ._story_index import (
+	StoriesView, StoryIndex as _StoryIndex, counter_at_least, bits_from_ordinals, ordinals_from_bits,
+	values_at, values_range_bits,
+)
+from ._text_index import (
+	TextIndex as _TextIndex, TextIndexBuilder as _TextIndexBuilder,
+	TrigramIndex as _TrigramIndex, TrigramIndexBuilder as _TrigramIndexBuilder, regex_trigrams,
+)
+from ._text_store import TextRef
 
 _default_out_file = 'combined.txt'
+_KeywordGroupsArg = _t.Union[KeywordGroups, _t.Dict[_t.Iterable[str], _t.Union[int, float]]]
+# Shared by all the DBs, to share the cached verdicts, too:
+_default_broken_story_detector = BrokenStoryDetector()
+_out_file_encoding = 'utf-8'
+_out_file_buffer_size = 1 << 20
+_output_stories_separator = "\n\n----\n\n"
+_shards_manifest_suffix = '.manifest.json'
 
 
 def _get_full_file_path(file_name: _t.Optional[_PathLike] = None, default_filename='file', file_print_name='File') -> Path:
@@ -34,15 +67,292 @@ def _get_full_file_path(file_name: _t.Optional[_PathLike] = None, default_filena
 	return file_path.absolute()
 
 
+def _output_text_pieces(formatted_stories: _t.Iterable[str]) -> _t.Iterator[str]:
+	"""Formatted stories, each one except the first prefixed with the separator."""
+	separator = ''
+	for formatted in formatted_stories:
+		yield f"{separator}{formatted}"
+		separator = _output_stories_separator
+
+
+# What's needed to format a story (see `Story.output_text_of()`), cheap to pass to a worker process:
+# a lazy text stays a tiny handle, and keywords are frozen in their current order
+# (a set might iterate in a different one, once it's unpickled there).
+_OutputParts = _t.Tuple[str, _t.Tuple[str, ...], _t.Union[str, TextRef]]
+
+
+def _output_parts(story: Story) -> _OutputParts:
+	return story.title, tuple(story.keywords), story.text_or_ref
+
+
+def _formatted_output(parts: _OutputParts) -> str:
+	title, keywords, text = parts
+	return Story.output_text_of(title, keywords, text.resolve() if isinstance(text, TextRef) else text)
+
+
+def _write_output_shard(file_path: Path, stories_parts: _t.List[_OutputParts]) -> int:
+	"""Executed in worker processes: write a single shard file, return its size in bytes."""
+	with open(
+		file_path, 'w', encoding=_out_file_encoding, newline='\n', buffering=_out_file_buffer_size
+	) as file_handle:
+		file_handle.writelines(_output_text_pieces(map(_formatted_output, stories_parts)))
+	return file_path.stat().st_size
+
+
+def _output_sizes(stories_parts: _t.List[_OutputParts]) -> _t.List[int]:
+	"""Executed in worker processes: exact size (in bytes) of each formatted story, without the separator."""
+	return [len(_formatted_output(x).encode(_out_file_encoding)) for x in stories_parts]
+
+
+def _split_to_n_shards(stories: _t.List[Story], n_shards: int) -> _t.List[_t.List[Story]]:
+	"""
+	Split the stories (keeping the order) into the given number of shards of roughly equal size.
+	The size is estimated by story's word count, which is known without formatting (or even loading) the text.
+	"""
+	n_shards = max(1, min(n_shards, len(stories)))
+	# `max()` to keep stories with no word count from collapsing into the same position:
+	cumulative = list(accumulate(max(story.word_count, 1) for story in stories))
+	total = cumulative[-1] if cumulative else 0
+	shards = [list() for _ in range(n_shards)]
+	for story, before in zip(stories, chain([0], cumulative)):
+		shards[min(before * n_shards // total, n_shards - 1)].append(story)
+	return [x for x in shards if x]
+
+
+def _split_to_capped_shards(stories: _t.List[Story], sizes: _t.List[int], max_shard_bytes: int) -> _t.List[_t.List[Story]]:
+	"""
+	Split the stories (keeping the order) into shards not exceeding the given size.
+	A single story bigger than the limit gets a shard of its own.
+	"""
+	separator_size = len(_output_stories_separator.encode(_out_file_encoding))
+	shards: _t.List[_t.List[Story]] = list()
+	shard: _t.List[Story] = list()
+	shard_size = 0
+	for story, size in zip(stories, sizes):
+		if shard and shard_size + separator_size + size > max_shard_bytes:
+			shards.append(shard)
+			shard = list()
+		if shard:
+			shard_size += separator_size + size
+		else:
+			shard_size = size
+		shard.append(story)
+	if shard:
+		shards.append(shard)
+	return shards
+
+
+def _regex_matches_in_texts(pattern: str, flags: int, texts: _t.List[_t.Union[str, TextRef]]) -> _t.List[bool]:
+	"""Executed in worker processes: whether the regex is found in each text (which might be a lazy handle)."""
+	search_f = re.compile(pattern, flags).search
+	return [
+		search_f(text.resolve() if isinstance(text, TextRef) else text) is not None
+		for text in texts
+	]
+
+
+def _unindexed_text_ordinals(
+	is_indexed_f: _t.Callable[[str, Story], bool], index: _StoryIndex, ordinals: _t.Iterable[int]
+) -> _t.List[int]:
+	"""Stories which aren't in the trigram index as they are: either new ones or the ones with a modified text."""
+	story_id_f = index.story_id
+	story_f = index.story
+	return [x for x in ordinals if not is_indexed_f(story_id_f(x), story_f(x))]
+
+
+def _own_view(stories: _t.Union[_t.Dict[str, Story], StoriesView]) -> _t.Union[_t.Dict[str, Story], StoriesView]:
+	"""A view is copied (cheaply), so that modifying it through one DB doesn't affect another one sharing it."""
+	return stories.copy() if isinstance(stories, StoriesView) else stories
+
+
 @define
 class DataSetDB:
 	"""
 	The main class to perform custom filtering/sorting on the dataset.
+
+	By default, each filtering/sorting method executes immediately. Call `lazy()` to get a DB in lazy mode instead:
+	there, the methods just accumulate a query plan, which is executed only when the result is actually needed
+	(on `stories` / `broken_stories` access or dumping). The entire plan is executed at once, with all the filters
+	fused together and the cheaper ones (indexed) going first.
+
+	Filtered/sorted DBs don't copy the stories: each one is just a view over the index shared by all of them
+	(see `StoriesView`). Its `stories` can still be modified like a dict: the view copies its ordinals on the first
+	modification, so the other DBs aren't affected. A new/replaced story is registered in the shared index.
 	"""
 
 	categories: _t.Dict[str, Category]
-	stories: _t.Dict[str, Story]
-	broken_stories: _t.Dict[str, Story] = field(factory=dict)
+	# Either a plain dict (given to the constructor or `materialized()`) or a view over the index, owned by this DB:
+	_stories: _t.Union[_t.Dict[str, Story], StoriesView] = field(converter=_own_view)
+	_broken_stories: _t.Union[_t.Dict[str, Story], StoriesView] = field(factory=dict, converter=_own_view)
+	# Shared by all the DBs derived from this one:
+	_index: _StoryIndex = field(factory=_StoryIndex, eq=False, repr=False)
+	_is_lazy: bool = field(default=False, repr=False)
+	# Not yet executed steps (lazy mode only):
+	_plan: _t.Tuple[_PlanStep, ...] = field(default=tuple(), repr=False)
+	# The loader this DB (or the one it's derived from) is loaded with. Provides the full-text index:
+	_loader: _t.Optional[_DataSetLoader] = field(default=None, eq=False, repr=False)
+	# Aggregated stats of the stories (like `keyword_hits`):
+	# {name: (stories view they're computed for, its `n_changes` then, stats)}.
+	_stats_cache: _t.Dict[_t.Hashable, _t.Tuple[StoriesView, int, _t.Any]] = field(
+		factory=dict, init=False, eq=False, repr=False
+	)
+
+	def __views(self) -> _t.Tuple[StoriesView, StoriesView]:
+		"""Stories (before the plan is executed) as views over the index. Stories from plain dicts are registered."""
+		index = self._index
+		return index.view(self._stories), index.view(self._broken_stories)
+
+	def __execute_plan(self, keep_sorts=False):
+		"""
+		With `keep_sorts`, the sorts at the end of the plan are left pending (see `split_trailing_sorts()`),
+		so that they can still be combined with a limit.
+		"""
+		plan, pending_sorts = self._plan, tuple()
+		if keep_sorts:
+			plan, pending_sorts = _split_trailing_sorts(plan)
+		if plan:
+			self._stories, self._broken_stories = _execute_plan(*self.__views(), plan)
+		self._plan = pending_sorts
+
+	@property
+	def stories(self) -> _t.Mapping[str, Story]:
+		"""
+		`{story_id: story}` mapping. It's a plain dict only if it's given as such to the constructor
+		(or the DB is `materialized()`), and a `StoriesView` otherwise. Either one can be modified in place.
+		"""
+		self.__execute_plan()
+		return self._stories
+
+	@stories.setter
+	def stories(self, value: _t.Dict[str, Story]):
+		self.__execute_plan()
+		self._stories = value
+
+	@property
+	def broken_stories(self) -> _t.Mapping[str, Story]:
+		self.__execute_plan()
+		return self._broken_stories
+
+	@broken_stories.setter
+	def broken_stories(self, value: _t.Dict[str, Story]):
+		self.__execute_plan()
+		self._broken_stories = value
+
+	@property
+	def is_lazy(self) -> bool:
+		return self._is_lazy
+
+	def lazy(self) -> 'DataSetDB':
+		"""A version of the DB in lazy mode: any following filtering/sorting is deferred until the result is needed."""
+		self.__execute_plan()
+		stories, broken_stories = self.__views()
+		return DataSetDB(
+			dict(self.categories), stories, broken_stories=broken_stories, index=self._index,
+			is_lazy=True, loader=self._loader,
+		)
+
+	def eager(self) -> 'DataSetDB':
+		"""A version of the DB in the regular (eager) mode. If this one is lazy, its plan gets executed."""
+		self.__execute_plan()
+		stories, broken_stories = self.__views()
+		return DataSetDB(
+			dict(self.categories), stories, broken_stories=broken_stories, index=self._index, loader=self._loader,
+		)
+
+	def materialized(self) -> 'DataSetDB':
+		"""
+		A version of the DB with its own `stories` and `broken_stories` dicts, which can be modified in place.
+		Any DB derived from it (by filtering/sorting) is a lightweight view again, taking the stories as they are then.
+		"""
+		return DataSetDB(
+			dict(self.categories), dict(self.stories.items()), broken_stories=dict(self.broken_stories.items()),
+			index=self._index, is_lazy=self._is_lazy, loader=self._loader,
+		)
+
+	def __combined(
+		self, others: _t.Iterable['DataSetDB'],
+		stories_f: _t.Callable[[StoriesView, StoriesView], StoriesView],
+		broken_stories_f: _t.Callable[[StoriesView, StoriesView], StoriesView],
+	) -> 'DataSetDB':
+		"""
+		Base method for set operations. The pending plans of all the DBs are executed,
+		and their stories are combined as bitsets over the shared index.
+		Stories of a DB derived from another dataset load are registered in this DB's index first.
+		"""
+		index = self._index
+		self.__execute_plan()
+		stories, broken_stories = self.__views()
+		categories = dict(self.categories)
+		for other in others:
+			stories = stories_f(stories, index.view(other.stories))
+			broken_stories = broken_stories_f(broken_stories, index.view(other.broken_stories))
+			for category_id, category in other.categories.items():
+				categories.setdefault(category_id, category)
+		return DataSetDB(
+			categories, stories, broken_stories=broken_stories, index=index, is_lazy=self._is_lazy, loader=self._loader,
+		)
+
+	def union(self, *others: 'DataSetDB') -> 'DataSetDB':
+		"""
+		A version of the DB with the stories from the other DBs added: all the stories of this one (in their order),
+		followed by the new ones from each other DB (in its order). Stories are matched by ID,
+		and the one from this DB is kept. `broken_stories` are combined the same way.
+
+		Also available as `db | other`.
+		"""
+		return self.__combined(others, StoriesView.union, StoriesView.union)
+
+	def intersection(self, *others: 'DataSetDB') -> 'DataSetDB':
+		"""
+		A version of the DB with only the stories which are in all the other DBs, too. The order is kept.
+		`broken_stories` are combined from all the DBs (as in `union()`): a story extracted as broken from any of them
+		is still known to be such.
+
+		Also available as `db & other`.
+		"""
+		return self.__combined(others, StoriesView.intersection, StoriesView.union)
+
+	def difference(self, *others: 'DataSetDB') -> 'DataSetDB':
+		"""
+		A version of the DB without any stories which are in the other DBs. The order is kept.
+		`broken_stories` are this DB's only.
+
+		Also available as `db - other`.
+		"""
+		return self.__combined(others, StoriesView.difference, lambda broken_stories, other: broken_stories)
+
+	def __or__(self, other: 'DataSetDB') -> 'DataSetDB':
+		if not isinstance(other, DataSetDB):
+			return NotImplemented
+		return self.union(other)
+
+	def __and__(self, other: 'DataSetDB') -> 'DataSetDB':
+		if not isinstance(other, DataSetDB):
+			return NotImplemented
+		return self.intersection(other)
+
+	def __sub__(self, other: 'DataSetDB') -> 'DataSetDB':
+		if not isinstance(other, DataSetDB):
+			return NotImplemented
+		return self.difference(other)
+
+	def __with_steps(self, *steps: _PlanStep) -> 'DataSetDB':
+		"""
+		Base method to build a filtered/sorted version of DB. In eager mode, all the given steps are executed together.
+		The only thing that's changed is the `.stories` view (and `.broken_stories` - for extraction steps).
+		Each DB gets its own view object, sharing the ordinals with the other ones until modified.
+		For bug-prevention, `categories` dict is a shallow copy.
+		"""
+		stories, broken_stories = self.__views()
+		if not self._is_lazy:
+			stories, broken_stories = _execute_plan(stories, broken_stories, steps)
+			return DataSetDB(
+				dict(self.categories), stories, broken_stories=broken_stories, index=self._index, loader=self._loader
+			)
+		return DataSetDB(
+			dict(self.categories), stories, broken_stories=broken_stories, index=self._index,
+			is_lazy=True, plan=self._plan + steps, loader=self._loader,
+		)
 
 	@staticmethod
 	def load(**dataset_loader_kwargs):
@@ -50,40 +360,93 @@ def load(**dataset_loader_kwargs):
 		Constructor method.
 		Builds an instance with `categories` and `stories` field contents loaded from the underlying dataset.
 		The dataset itself well be auto-downloaded if necessary.
+		After the first load, the parsed dataset is cached as a binary snapshot (see `DataSetLoader.use_snapshot`).
+		Pass `lazy_text=True` to keep only story metadata in memory, with texts read from disk on access.
+		Pass `compact=True` to reduce memory taken by metadata (keywords become sorted tuples, see `Story.compact()`).
+		Pass `categories=[...]` to extract and load only the given categories (see `DataSetLoader.categories`).
+		Such a DB has only these categories: the other ones aren't loaded into it later, even if they're requested.
+		Pass `read_from_archive=True` to parse JSON files straight from the archive, without unpacking it to disk.
 
 		`broken_stories` field is intentionally not populated. Such stories should be manually extracted from the main pool
 		at the very end, with explicit call to `filter_out_broken_stories()` method.
+
+		The loaded stories are registered in the index right away, and the DB is a view over it,
+		like any other DB derived from it. Its `stories` can still be modified like a dict (see `StoriesView`).
 		"""
-		categories, stories = _DataSetLoader(**dataset_loader_kwargs).load_all()
-		return DataSetDB(categories=categories, stories=stories)
+		loader = _DataSetLoader(**dataset_loader_kwargs)
+		categories, stories = loader.load_all()
+		index = _StoryIndex()
+		return DataSetDB(categories=categories, stories=index.view(stories), index=index, loader=loader)
 
 	def category_keywords(self, category: str):
 		return self.categories[category].keywords
 
+	def __cached_stats(self, name: _t.Hashable, stats_f: _t.Callable[[StoriesView], _t.Any]):
+		"""
+		Stats are computed once per DB, unless its stories are modified. For a materialized DB (with a plain dict
+		of stories, which can't tell if it's modified), they're computed for a new view each time.
+		"""
+		stories = self._index.view(self.stories)
+		cached = self._stats_cache.get(name)
+		if cached is not None and cached[0] is stories and cached[1] == stories.n_changes:
+			return cached[2]
+		stats = stats_f(stories)
+		self._stats_cache[name] = (stories, stories.n_changes, stats)
+		return stats
+
+	def __value_hits(self, attr_name: str) -> _t.Dict[str, int]:
+		"""
+		Number of stories per value of the attribute, the most frequent first
+		(equally frequent - in the order of their first appearance in the stories).
+		"""
+		return dict(self.__cached_stats(attr_name, lambda stories: dict(sorted(
+			self._index.value_counts(attr_name, stories).items(), key=lambda k_v: k_v[1], reverse=True
+		))))
+
 	@property
 	def keyword_hits(self) -> _t.Dict[str, int]:
 		"""
 		Get ALL the keywords min the pool (including unpopular ones) and count how many times each keyword gets referenced.
+
+		It's computed once per DB. For a filtered one, from the index: without going through each story's keywords.
 		"""
-		all_keywords: _t.Dict[str, int] = dict()
-		for story in self.stories.values():
-			for kw in story.keywords:
-				all_keywords[kw] = all_keywords.get(kw, 0) + 1
-		return dict(sorted(
-			all_keywords.items(), key=lambda k_v: k_v[1], reverse=True
-		))
+		return self.__value_hits('keywords')
+
+	@property
+	def author_hits(self) -> _t.Dict[str, int]:
+		"""Number of stories per author, the most prolific first. Cached the same way as `keyword_hits`."""
+		return self.__value_hits('author')
+
+	@property
+	def category_hits(self) -> _t.Dict[str, int]:
+		"""Number of stories per category, the biggest first. Cached the same way as `keyword_hits`."""
+		return self.__value_hits('category')
+
+	def rating_hits(self, step: _t.Union[int, float] = 1) -> _t.Dict[_t.Union[int, float], int]:
+		"""
+		Number of stories per rating bucket, the highest rating first: `{bucket_min_rating: count}`.
+		Buckets are `step` wide: with the default one, 4 is for ratings from 4 (inclusive) to 5 (exclusive).
+		Cached the same way as `keyword_hits`.
+		"""
+		if step <= 0:
+			raise ValueError(f"Rating step has to be positive. Got: {step}")
+		counts: _t.Dict[int, int] = self.__cached_stats(
+			('rating', step), lambda stories: self._index.column_value_counts('rating', stories.ordinals, step)
+		)
+		return {bucket * step: counts[bucket] for bucket in sorted(counts, reverse=True)}
 
 	def __filtered(self, ok_f: _t.Callable[[Story], bool]) -> 'DataSetDB':
+		"""Base method to build a filtered version of DB, with a function called for each story."""
+		return self.__with_steps(_FilterStep(ok_f=ok_f))
+
+	def __filtered_indexed(
+		self, matching_bits_f: _t.Callable[[_StoryIndex, int], int], cost=_cost_keyword_bits
+	) -> 'DataSetDB':
 		"""
-		Base method to build a filtered version of DB.
-		The only thing that's changed is the `.stories` dict.
-		For bug-prevention, other fields have a shallow (not deep) copy: the dict itself is a copy, it's members are references.
+		Same as `__filtered()`, but the stories to keep are selected as a bitset, with set operations on the index.
+		The given function receives the index and the bitset of all the stories in this DB.
 		"""
-		stories = {
-			k: v for k, v in self.stories.items()
-			if ok_f(v)
-		}
-		return DataSetDB(dict(self.categories), stories, broken_stories=dict(self.broken_stories))
+		return self.__with_steps(_FilterStep(bits_f=matching_bits_f, cost=cost))
 
 	def with_authors(self, *authors: str):
 		"""A filtered version of the DB: only with stories from the given author(s)."""
@@ -122,9 +485,9 @@ def with_keywords_from_categories(self, *categories: str):
 		keywords_from_categories = set(chain(
 			*(self.categories[cat_id].keywords for cat_id in categories)
 		))
-		def ok_filter(story: Story):
-			return any(kw in keywords_from_categories for kw in story.keywords)
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.any_keyword_bits(keywords_from_categories)
+		)
 
 	def not_keywords_from_categories(self, *categories: str):
 		"""
@@ -136,73 +499,40 @@ def not_keywords_from_categories(self, *categories: str):
 		keywords_from_categories = set(chain(
 			*(self.categories[cat_id].keywords for cat_id in categories)
 		))
-		def ok_filter(story: Story):
-			return not any(kw in keywords_from_categories for kw in story.keywords)
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: full_bits & ~index.any_keyword_bits(keywords_from_categories)
+		)
 
 	def with_keywords(self, *keywords: str):
 		"""A filtered version of the DB: only with stories marked with the given keywords."""
-		def ok_filter(story: Story):
-			story_keywords = story.keywords
-			return all(kw in story_keywords for kw in keywords)
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.all_keywords_bits(keywords, full_bits)
+		)
 
 	def not_keywords(self, *keywords: str):
 		"""A filtered version of the DB, which no longer contains any stories marked with the given keywords."""
-		def ok_filter(story: Story):
-			story_keywords = story.keywords
-			return not any(kw in story_keywords for kw in keywords)
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: full_bits & ~index.any_keyword_bits(keywords)
+		)
 
 	@staticmethod
-	def __keyword_group_hits_sorting_key_func(keyword_synonym_groups: _t.Tuple[_t.Iterable[str], ...]):
-		"""Factory. Generates a function to produce sorting hit-weight for the given keyword groups."""
-		group_name_by_keyword: _t.Dict[str, str] = dict()  # kw -> kw_group
-		for kw_group_iter in keyword_synonym_groups:
-			if isinstance(kw_group_iter, str):
-				kw_group_iter = [kw_group_iter]
-			kw_group_iter = list(kw_group_iter)
-			group_name = kw_group_iter[0]
-			for kw in kw_group_iter:
-				group_name_by_keyword[kw] = group_name
-
-		def n_group_hits_f(story: Story):
-			group_hits: _t.Set[str] = set()
-			for kw in story.keywords:
-				if kw in group_name_by_keyword:
-					gr_name = group_name_by_keyword[kw]
-					group_hits.add(gr_name)
-			return len(group_hits)
-
-		return n_group_hits_f
+	def __compiled_keyword_groups(
+		keyword_synonym_groups: _t.Union[_KeywordGroupsArg, _t.Tuple[_t.Union[KeywordGroups, _t.Iterable[str]], ...]]
+	) -> KeywordGroups:
+		"""
+		The groups as they're given to any of keyword-group methods, compiled. If they're already compiled
+		(passed as a single `KeywordGroups`), it's reused as is - together with the scores it has already memoized.
+		"""
+		if isinstance(keyword_synonym_groups, KeywordGroups):
+			return keyword_synonym_groups
+		if (
+			isinstance(keyword_synonym_groups, tuple) and len(keyword_synonym_groups) == 1
+			and isinstance(keyword_synonym_groups[0], KeywordGroups)
+		):
+			return keyword_synonym_groups[0]
+		return KeywordGroups(keyword_synonym_groups)
 
-	@staticmethod
-	def __keyword_group_weighted_hits_sorting_key_func(
-		wights_by_keyword_synonym_groups: _t.Dict[_t.Iterable[str], _t.Union[int, float]]
-	):
-		"""Factory. Similarly to `__keyword_group_hits_sorting_key_func()`, detects not just hits but WEIGHTED hits."""
-		group_name_by_keyword: _t.Dict[str, str] = dict()  # kw -> kw_group
-		group_weights: _t.Dict[str, int] = dict()  # kw_group -> weight
-		for kw_group_iter, weight in wights_by_keyword_synonym_groups.items():
-			if isinstance(kw_group_iter, str):
-				kw_group_iter = [kw_group_iter]
-			kw_group_iter = tuple(kw_group_iter)
-			group_name = kw_group_iter[0]
-			group_weights[group_name] = weight
-			for kw in kw_group_iter:
-				group_name_by_keyword[kw] = group_name
-
-		def keywords_weight_f(story: Story):
-			group_hits: _t.Set[str] = set()
-			for kw in story.keywords:
-				if kw in group_name_by_keyword:
-					gr_name = group_name_by_keyword[kw]
-					group_hits.add(gr_name)
-			return sum(group_weights[gr_name] for gr_name in group_hits)
-
-		return keywords_weight_f
-
-	def keyword_hits_min(self, n: int, *keyword_synonym_groups: _t.Iterable[str]):
+	def keyword_hits_min(self, n: int, *keyword_synonym_groups: _t.Union[KeywordGroups, _t.Iterable[str]]):
 		"""
 		A filtered version of the DB, with... a bit fancy, but very powerful filtering method.
 
@@ -211,13 +541,17 @@ def keyword_hits_min(self, n: int, *keyword_synonym_groups: _t.Iterable[str]):
 		This way, you won't get multiple hits in stories which have multiple variations of the same thing.
 
 		Then, the only stories kept in a filtered DB are the ones with AT LEAST the given number of hits.
+
+		Instead of the groups themselves, a single pre-compiled `KeywordGroups` can be passed.
+		It's worth doing when the same groups are used in multiple filters/sorts: the per-story hits
+		are then counted just once and reused by all of them.
 		"""
-		n_group_hits_f = self.__keyword_group_hits_sorting_key_func(keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return n_group_hits_f(story) >= n
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(keyword_synonym_groups)
+		return self.__filtered_indexed(
+			lambda index, full_bits: counter_at_least(keyword_groups.hits_counter(index), ceil(n), full_bits)
+		)
 
-	def keyword_hits_max(self, n: int, *keyword_synonym_groups: _t.Iterable[str]):
+	def keyword_hits_max(self, n: int, *keyword_synonym_groups: _t.Union[KeywordGroups, _t.Iterable[str]]):
 		"""
 		A filtered version of the DB, with... a bit fancy, but very powerful filtering method.
 
@@ -227,23 +561,26 @@ def keyword_hits_max(self, n: int, *keyword_synonym_groups: _t.Iterable[str]):
 
 		Then, the only stories kept in a filtered DB are the ones with AT MOST the given number of hits.
 		"""
-		n_group_hits_f = self.__keyword_group_hits_sorting_key_func(keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return n_group_hits_f(story) <= n
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(keyword_synonym_groups)
+		return self.__filtered_indexed(
+			lambda index, full_bits: full_bits & ~counter_at_least(keyword_groups.hits_counter(index), floor(n) + 1, full_bits)
+		)
 
-	def keyword_hits_range(self, min: int, max: int, *keyword_synonym_groups: _t.Iterable[str]):
+	def keyword_hits_range(self, min: int, max: int, *keyword_synonym_groups: _t.Union[KeywordGroups, _t.Iterable[str]]):
 		"""
 		A convenience method, combining `.keyword_hits_min().keyword_hits_max()` into one call
 		(which should also be slightly faster).
 		"""
-		n_group_hits_f = self.__keyword_group_hits_sorting_key_func(keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return min <= n_group_hits_f(story) <= max
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(keyword_synonym_groups)
+
+		def matching_bits_f(index: _StoryIndex, full_bits: int):
+			planes = keyword_groups.hits_counter(index)
+			return counter_at_least(planes, ceil(min), full_bits) & ~counter_at_least(planes, floor(max) + 1, full_bits)
+
+		return self.__filtered_indexed(matching_bits_f)
 
 	def keyword_weights_min(
-		self, weight: _t.Union[float, int], wights_by_keyword_synonym_groups: _t.Dict[_t.Iterable[str], _t.Union[int, float]]
+		self, weight: _t.Union[float, int], wights_by_keyword_synonym_groups: _KeywordGroupsArg
 	):
 		"""
 		Similar to `keyword_hits_min()`, but here it expects not just groups of keywords, but also weights for each group
@@ -251,134 +588,375 @@ def keyword_weights_min(
 
 		A total weight calculated for every story in the DB (hitting any group gives it's weight only once),
 		and then only the story with AT LEAST the given weight are kept in the filtered DB.
+
+		A pre-compiled `KeywordGroups` (with weights) can be passed instead of the dict, to reuse the per-story weights
+		across multiple filters/sorts.
 		"""
-		keywords_weight_f = self.__keyword_group_weighted_hits_sorting_key_func(wights_by_keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return keywords_weight_f(story) >= weight
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(wights_by_keyword_synonym_groups)
+		return self.__filtered_indexed(
+			lambda index, full_bits: values_range_bits(keyword_groups.weighted_sums(index), min=weight),
+			cost=_cost_column_bits,
+		)
 
 	def keyword_weights_max(
-		self, weight: _t.Union[float, int], wights_by_keyword_synonym_groups: _t.Dict[_t.Iterable[str], _t.Union[int, float]]
+		self, weight: _t.Union[float, int], wights_by_keyword_synonym_groups: _KeywordGroupsArg
 	):
 		"""
 		Similar to `keyword_weights_min()`, but filtering out any stories with the weight ABOVE the given threshold.
 		Useful when you want to split the DB into subsets of high- and low-relevance, treat them individually
 		and combine afterwards.
 		"""
-		keywords_weight_f = self.__keyword_group_weighted_hits_sorting_key_func(wights_by_keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return keywords_weight_f(story) <= weight
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(wights_by_keyword_synonym_groups)
+		return self.__filtered_indexed(
+			lambda index, full_bits: values_range_bits(keyword_groups.weighted_sums(index), max=weight),
+			cost=_cost_column_bits,
+		)
 
 	def keyword_weights_range(
 		self, min: _t.Union[float, int], max: _t.Union[float, int],
-		wights_by_keyword_synonym_groups: _t.Dict[_t.Iterable[str], _t.Union[int, float]]
+		wights_by_keyword_synonym_groups: _KeywordGroupsArg
 	):
 		"""
 		A convenience method, combining `.keyword_weights_min().keyword_weights_max()` into one call
 		(which should also be slightly faster).
 		"""
-		keywords_weight_f = self.__keyword_group_weighted_hits_sorting_key_func(wights_by_keyword_synonym_groups)
-		def ok_filter(story: Story):
-			return min <= keywords_weight_f(story) <= max
-		return self.__filtered(ok_filter)
+		keyword_groups = self.__compiled_keyword_groups(wights_by_keyword_synonym_groups)
+		return self.__filtered_indexed(
+			lambda index, full_bits: values_range_bits(keyword_groups.weighted_sums(index), min=min, max=max),
+			cost=_cost_column_bits,
+		)
 
 	def rating_min(self, rating: _t.Union[float, int]):
 		"""A filtered version of the DB, with the stories of AT LEAST the given rating."""
-		def ok_filter(story: Story):
-			return story.rating >= rating
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('rating', min=rating),
+			cost=_cost_column_bits,
+		)
 
 	def rating_max(self, rating: _t.Union[float, int]):
 		"""A filtered version of the DB, with the stories of AT MOST the given rating."""
-		def ok_filter(story: Story):
-			return story.rating <= rating
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('rating', max=rating),
+			cost=_cost_column_bits,
+		)
 
 	def rating_range(self, min: _t.Union[float, int], max: _t.Union[float, int]):
 		"""A filtered version of the DB, with the stories which have their rating in the specified range."""
-		def ok_filter(story: Story):
-			return min <= story.rating <= max
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('rating', min=min, max=max),
+			cost=_cost_column_bits,
+		)
 
 	def pages_min(self, n: int):
 		"""A filtered version of the DB, with the stories of AT LEAST the given number of pages."""
-		def ok_filter(story: Story):
-			return story.page_count >= n
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('page_count', min=n),
+			cost=_cost_column_bits,
+		)
 
 	def pages_max(self, n: int):
 		"""A filtered version of the DB, with the stories of AT MOST the given number of pages."""
-		def ok_filter(story: Story):
-			return story.page_count <= n
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('page_count', max=n),
+			cost=_cost_column_bits,
+		)
 
 	def pages_range(self, min: int, max: int):
 		"""A filtered version of the DB, with the stories which have their page count in the specified range."""
-		def ok_filter(story: Story):
-			return min <= story.page_count <= max
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('page_count', min=min, max=max),
+			cost=_cost_column_bits,
+		)
 
 	def words_min(self, n: int):
 		"""A filtered version of the DB, with the stories of AT LEAST the given number of words."""
-		def ok_filter(story: Story):
-			return story.word_count >= n
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('word_count', min=n),
+			cost=_cost_column_bits,
+		)
 
 	def words_max(self, n: int):
 		"""A filtered version of the DB, with the stories of AT MOST the given number of words."""
-		def ok_filter(story: Story):
-			return story.word_count <= n
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('word_count', max=n),
+			cost=_cost_column_bits,
+		)
 
 	def words_range(self, min: int, max: int):
 		"""A filtered version of the DB, with the stories which have their word count in the specified range."""
-		def ok_filter(story: Story):
-			return min <= story.word_count <= max
-		return self.__filtered(ok_filter)
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.column_range_bits('word_count', min=min, max=max),
+			cost=_cost_column_bits,
+		)
 
 	def __sorted(self, key: _t.Callable[[Story], _t.Any], reverse=False) -> 'DataSetDB':
 		"""
 		Base method to build a sorted version of DB. Relies on the order-preserving built-in dicts in the recent python versions.
-		The only thing that's changed is the `.stories` dict.
-		For bug-prevention, other fields have a shallow (not deep) copy: the dict itself is a copy, it's members are references.
 		"""
-		sorted_stories = sorted(self.stories.values(), key=key, reverse=reverse)
-		stories = {story.id: story for story in sorted_stories}
-		return DataSetDB(dict(self.categories), stories, broken_stories=dict(self.broken_stories))
+		return self.__with_steps(_SortStep(key_f=key, reverse=reverse))
+
+	def __sorted_indexed(
+		self, keys_f: _t.Callable[[_StoryIndex, _t.List[int]], _t.Sequence], reverse=False,
+		top: _t.Optional[int] = None,
+	) -> 'DataSetDB':
+		"""
+		Same as `__sorted()`, but sorting keys for all the stories are provided at once, by the given function
+		receiving the index and ordinals of the stories in this DB.
 
-	def sorted_by_max_keyword_hits(self, *keyword_synonym_groups: _t.Iterable[str], descending=True):
+		With `top`, only this many first stories are kept, as with `limited()` right after sorting. It's a partial sort
+		in eager mode, too.
+		"""
+		sort_step = _SortStep(keys_f=keys_f, reverse=reverse)
+		if top is None:
+			return self.__with_steps(sort_step)
+		return self.__with_steps(sort_step, _LimitStep(top))
+
+	def limited(self, max_stories: int):
+		"""
+		A version of the DB with only the first `max_stories` stories, in the current order
+		(negative: all but the last `-max_stories`).
+
+		The limit right after sorting makes it a partial sort: the first stories are selected
+		in O(N * log(max_stories)), without sorting the rest. In lazy mode, that's also done when the DB is dumped
+		with `max_stories`. In eager mode, each step is executed right away, so pass `top` to the sorting method instead.
+		"""
+		return self.__with_steps(_LimitStep(max_stories))
+
+	def sorted_by_max_keyword_hits(
+		self, *keyword_synonym_groups: _t.Union[KeywordGroups, _t.Iterable[str]], descending=True,
+		top: _t.Optional[int] = None,
+	):
 		"""
 		Similar to `keyword_hits_min()`, but instead of filtering sorts the stories dict according to
 		the number of keyword-group-hits per story.
+		With `top`, only this many first stories are kept (selected without sorting the rest).
 		"""
-		n_group_hits_f = self.__keyword_group_hits_sorting_key_func(keyword_synonym_groups)
-		return self.__sorted(n_group_hits_f, reverse=descending)
+		keyword_groups = self.__compiled_keyword_groups(keyword_synonym_groups)
+		return self.__sorted_indexed(
+			lambda index, ordinals: values_at(keyword_groups.hit_counts(index), ordinals),
+			reverse=descending, top=top,
+		)
 
 	def sorted_by_max_keywords_weight(
-		self, wights_by_keyword_synonym_groups: _t.Dict[_t.Iterable[str], _t.Union[int, float]], descending=True
+		self, wights_by_keyword_synonym_groups: _KeywordGroupsArg, descending=True, top: _t.Optional[int] = None,
 	):
 		"""
 		Similar to `keyword_weights_min()`, but instead of filtering sorts the stories dict according to
 		the overall weight per story.
+		With `top`, only this many first stories are kept (selected without sorting the rest).
 		"""
-		keywords_weight_f = self.__keyword_group_weighted_hits_sorting_key_func(wights_by_keyword_synonym_groups)
-		return self.__sorted(keywords_weight_f, reverse=descending)
+		keyword_groups = self.__compiled_keyword_groups(wights_by_keyword_synonym_groups)
+		return self.__sorted_indexed(
+			lambda index, ordinals: values_at(keyword_groups.weighted_sums(index), ordinals),
+			reverse=descending, top=top,
+		)
 
-	def sorted_by_rating(self, step: _t.Union[int, float] = None, descending=True):
+	def sorted_by_rating(self, step: _t.Union[int, float] = None, descending=True, top: _t.Optional[int] = None):
 		"""
 		A version of the DB, with stories sorted by their rating.
 		If optional `step` argument provided, treats rating within the given step as equal.
+		With `top`, only this many first stories are kept (selected without sorting the rest).
+		"""
+		return self.__sorted_indexed(
+			lambda index, ordinals: index.column_values('rating', ordinals, step=step),
+			reverse=descending, top=top,
+		)
+
+	def __text_index(self) -> _TextIndex:
+		loader = self._loader
+		if loader is not None:
+			return loader.load_text_index()
+		print("The DB isn't loaded from a dataset. Building a temporary full-text index for its stories...")
+		builder = _TextIndexBuilder()
+		for story_id, story in chain(self.stories.items(), self.broken_stories.items()):
+			builder.add(story_id, story.text)
+		return builder.build_in_memory()
+
+	def __trigram_index(self) -> _t.Tuple[_TrigramIndex, _t.Callable[[str, Story], bool]]:
+		"""The index + a function telling whether a story is in it as it is (the story isn't new and its text isn't modified)."""
+		loader = self._loader
+		if loader is not None:
+			trigram_index = loader.load_trigram_index()
+			has_story_f = trigram_index.has_story
+			# Tracked by the text itself, so that no text has to be re-read or re-hashed to check it:
+			return trigram_index, lambda story_id, story: story.is_text_original and has_story_f(story_id)
+
+		print("The DB isn't loaded from a dataset. Building a temporary trigram index for its stories...")
+		builder = _TrigramIndexBuilder()
+		indexed_texts: _t.Dict[str, _t.Union[str, TextRef]] = dict()
+		for story_id, story in chain(self.stories.items(), self.broken_stories.items()):
+			if story_id not in indexed_texts:
+				indexed_texts[story_id] = story.text_or_ref
+			builder.add(story_id, story.text)
+		# Any change of the text replaces the object itself, so a quick identity check is enough:
+		return builder.build_in_memory(), lambda story_id, story: indexed_texts.get(story_id) is story.text_or_ref
+
+	def __text_regex_bits_func(
+		self, pattern: _t.Union[str, re.Pattern], flags: int, workers: _t.Optional[int]
+	) -> _t.Callable[[_StoryIndex, int], int]:
+		"""
+		Selection of stories matching the regex. The candidates are pre-selected with the trigram index
+		(by literal pieces of the regex), and only those are actually searched through.
+		"""
+		if isinstance(pattern, re.Pattern):
+			pattern, flags = pattern.pattern, pattern.flags | flags
+		re.compile(pattern, flags)  # Fail right away on a bad regex, even in lazy mode.
+		trigrams = regex_trigrams(pattern, flags)
+		trigram_index, is_indexed_f = self.__trigram_index()
+		candidate_ids = trigram_index.candidate_ids(trigrams) if trigrams else None
+
+		def matching_bits_f(index: _StoryIndex, full_bits: int):
+			if candidate_ids is not None:
+				# The index can't rule out the stories it doesn't know as they are, so they're searched through, too:
+				unindexed_ordinals = _unindexed_text_ordinals(is_indexed_f, index, ordinals_from_bits(full_bits))
+				full_bits &= index.ids_bits(candidate_ids) | bits_from_ordinals(unindexed_ordinals)
+			ordinals = ordinals_from_bits(full_bits)
+			texts = [index.story(x).text_or_ref for x in ordinals]
+			matches = map_batches_in_workers(partial(_regex_matches_in_texts, pattern, flags), texts, workers)
+			return bits_from_ordinals(list(compress(ordinals, matches)))
+
+		return matching_bits_f
+
+	def with_text_regex(self, pattern: _t.Union[str, re.Pattern], flags=0, workers: _t.Optional[int] = 1):
+		"""
+		A filtered version of the DB: only with stories which have the given regex found in their text.
+
+		Stories are pre-selected with the trigram index (see `DataSetLoader.load_trigram_index()`),
+		The index reflects the original story texts, so the stories it doesn't have (or has with a different text:
+		modified in this DB, see `Story.is_text_original`) are always searched through.
+		Case-insensitive search is narrowed down, too: trigrams are case-folded the same way `re.IGNORECASE` works.
+		The regex search itself is done in `workers` processes (0 or less - as many as CPU cores).
+		When enabled on Windows, make sure your main script is guarded with `if __name__ == '__main__':`
 		"""
-		def key_no_round(story: Story):
-			return story.rating
+		return self.__filtered_indexed(self.__text_regex_bits_func(pattern, flags, workers), cost=_cost_text_scan)
 
-		round_multiplier = 1 if step is None or step <= 0 else 1.0 / step
+	def not_text_regex(self, pattern: _t.Union[str, re.Pattern], flags=0, workers: _t.Optional[int] = 1):
+		"""
+		A filtered version of the DB, which no longer contains any stories which have the given regex found in their text.
+		See `with_text_regex()` for details.
+		"""
+		matching_bits_f = self.__text_regex_bits_func(pattern, flags, workers)
+		return self.__filtered_indexed(
+			lambda index, full_bits: full_bits & ~matching_bits_f(index, full_bits),
+			cost=_cost_text_scan,
+		)
+
+	def with_text_phrase(self, phrase: str, ignore_case=False, workers: _t.Optional[int] = 1):
+		"""A filtered version of the DB: only with stories containing the exact phrase. See `with_text_regex()`."""
+		return self.with_text_regex(re.escape(phrase), flags=re.IGNORECASE if ignore_case else 0, workers=workers)
+
+	def not_text_phrase(self, phrase: str, ignore_case=False, workers: _t.Optional[int] = 1):
+		"""A filtered version of the DB, which no longer contains any stories with the exact phrase in their text."""
+		return self.not_text_regex(re.escape(phrase), flags=re.IGNORECASE if ignore_case else 0, workers=workers)
+
+	def without_near_duplicates(self, threshold: float = 0.8):
+		"""
+		A filtered version of the DB, with only one story kept from each group of near-duplicates
+		(reposts, re-uploads, copies under a different ID): the first one in the current order.
+		So, to choose which one is kept, sort the DB beforehand (e.g., by rating).
 
-		def key_rounded(story: Story):
-			return int(story.rating * round_multiplier)
+		Texts are compared by estimated Jaccard similarity of their word 5-grams (MinHash + LSH, no pairwise comparison).
+		Within a group, each story is similar to some other one by AT LEAST the given threshold.
 
-		return self.__sorted(key_no_round if step is None or step <= 0 else key_rounded, reverse=descending)
+		Signatures of the dataset stories are computed once per dataset version
+		(see `DataSetLoader.load_minhash_signatures()`), so they reflect the original texts.
+		Stories missing there, the ones with a modified text (see `Story.is_text_original`),
+		or all of them if the DB isn't loaded from a dataset, get a signature on the fly.
+
+		In lazy mode, the result depends on the steps before this one, so they're all executed first, as is.
+		"""
+		if not 0.0 < threshold <= 1.0:
+			raise ValueError(f"Similarity threshold has to be within (0, 1] range. Got: {threshold}")
+		loader = self._loader
+
+		def are_selected_f(stories: StoriesView):
+			signatures_by_id = loader.load_minhash_signatures() if loader is not None else dict()
+			signatures = [
+				(signatures_by_id.get(story_id) if story.is_text_original else None) or minhash_signature(story.text)
+				for story_id, story in stories.items()
+			]
+			representatives = near_duplicate_representatives(signatures, threshold)
+			return map(eq, representatives, range(len(representatives)))
+
+		return self.__with_steps(_SelectStep(are_selected_f))
+
+	def text_relevance(self, query: str) -> _t.Dict[str, float]:
+		"""
+		BM25 relevance of the stories to the given text query, according to the full-text index:
+		{story_id: score}, with only the stories containing ANY of the query words, the most relevant first.
+
+		The index is built once per dataset version (see `DataSetLoader.load_text_index()`), so it reflects
+		the original story texts, even if they're modified in this DB.
+		"""
+		stories_dict = self.stories
+		return {
+			story_id: score for story_id, score in self.__text_index().scores(query).items()
+			if story_id in stories_dict
+		}
+
+	def with_text_matching(self, query: str, min_score: _t.Union[float, int] = 0):
+		"""
+		A filtered version of the DB: only with stories containing ANY of the query words in their text
+		and having the BM25 relevance (see `text_relevance()`) of AT LEAST the given score.
+		"""
+		scores = self.__text_index().scores(query)
+		matching_ids = [story_id for story_id, score in scores.items() if score >= min_score]
+		return self.__filtered_indexed(
+			lambda index, full_bits: index.ids_bits(matching_ids),
+			cost=_cost_text_index_bits,
+		)
+
+	def sorted_by_text_relevance(self, query: str, descending=True, top: _t.Optional[int] = None):
+		"""
+		A version of the DB, with stories sorted by their BM25 relevance to the text query (see `text_relevance()`).
+		Stories which don't contain any of the query words have zero relevance.
+		With `top`, only this many first stories are kept (selected without sorting the rest).
+		"""
+		scores = self.__text_index().scores(query)
+		return self.__sorted_indexed(
+			lambda index, ordinals: [scores.get(story.id, 0.0) for story in map(index.story, ordinals)],
+			reverse=descending, top=top,
+		)
+
+	def iter_output_text(
+		self, max_stories=-1,
+		max_chars: _t.Optional[int] = None, max_bytes: _t.Optional[int] = None, max_words: _t.Optional[int] = None,
+		encoding='utf-8',
+	) -> _t.Iterator[str]:
+		"""
+		Streaming version of `dumped_as_output_text()`: each story is formatted only when it's requested.
+
+		The output can also be limited by its overall size: in characters, bytes (in the given encoding) or words.
+		Stories are never cut - the output stops right before the first story which would exceed any of the limits.
+		"""
+		# A pending plan (in lazy mode) is executed into this DB, once. But if it ends with sorting, the sorts are
+		# left pending, and only the dumped stories are selected for the output, without sorting the rest:
+		self.__execute_plan(keep_sorts=max_stories is not None)
+		if self._plan:
+			stories_dict, _ = _execute_plan(*self.__views(), self._plan + (_LimitStep(max_stories), ))
+			max_stories = None
+		else:
+			stories_dict = self._stories
+			if max_stories is not None and max_stories < 0:
+				max_stories = max(0, len(stories_dict) + max_stories)
+
+		# (limit, total_so_far, measure_f)
+		budgets: _t.List[_t.List] = [
+			[limit, 0, measure_f] for limit, measure_f in (
+				(max_chars, len),
+				(max_bytes, lambda txt: len(txt.encode(encoding))),
+				(max_words, lambda txt: len(txt.split())),
+			) if limit is not None
+		]
+
+		for piece in _output_text_pieces(map(Story.dumped_as_output_text, islice(stories_dict.values(), max_stories))):
+			for budget in budgets:
+				limit, total, measure_f = budget
+				total += measure_f(piece)
+				if total > limit:
+					return
+				budget[1] = total
+			yield piece
 
 	def dumped_as_output_text(self, max_stories=-1) -> _t.List[str]:
 		"""
@@ -387,47 +965,104 @@ def dumped_as_output_text(self, max_stories=-1) -> _t.List[str]:
 		https://tapwavezodiac.github.io/novelaiUKB/The-Rabbit-Hole.html
 
 		The recommended 4-dashes separator is used to further emphasise the story beginning.
+
+		All the formatted stories are kept in memory at once. For big selections, prefer `iter_output_text()`.
 		"""
-		stories_dict = self.stories
-		if max_stories is not None and max_stories < 0:
-			max_stories = max(0, len(stories_dict) + max_stories)
+		return list(self.iter_output_text(max_stories))
 
-		all_story_texts = (
-			story.dumped_as_output_text() for story in stories_dict.values()
-		)
-		all_story_texts = iter(all_story_texts)
-		try:
-			first_story = next(all_story_texts)
-		except StopIteration:
-			return []
-
-		all_story_texts = chain(
-			[first_story],
-			(f"\n\n----\n\n{txt}" for txt in all_story_texts)
+	def dump_to_output_txt_file(
+		self, file_name: _t.Optional[_PathLike] = None, max_stories=-1,
+		max_chars: _t.Optional[int] = None, max_bytes: _t.Optional[int] = None, max_words: _t.Optional[int] = None,
+	):
+		"""
+		Write the formatted story pool to a text file, story by story (see `iter_output_text()` for size limits).
+		Memory usage doesn't depend on the selection size.
+		"""
+		file_path = _get_full_file_path(file_name, _default_out_file, 'output txt file')
+		with open(
+			file_path, 'w', encoding=_out_file_encoding, newline='\n', buffering=_out_file_buffer_size
+		) as file_handle:
+			file_handle.writelines(self.iter_output_text(
+				max_stories, max_chars=max_chars, max_bytes=max_bytes, max_words=max_words, encoding=_out_file_encoding
+			))
+
+	def dump_to_output_txt_shards(
+		self, file_name: _t.Optional[_PathLike] = None,
+		shards: _t.Optional[int] = None, max_shard_bytes: _t.Optional[int] = None, workers: _t.Optional[int] = 1,
+	) -> _t.List[Path]:
+		"""
+		Export the entire story pool (in its current order) as multiple shard files, optionally written in parallel.
+		Each shard is formatted exactly like `dump_to_output_txt_file()` output.
+
+		The files are named after the given one, with a shard number added: ``combined.0000.txt``, ``combined.0001.txt``...
+		Next to them, a ``combined.manifest.json`` is saved, listing each shard's file, size and story IDs.
+
+		:param shards:
+			Split into this many shards of roughly equal size (estimated by word count).
+			`None` (default), 0 or less - as many as CPU cores.
+		:param max_shard_bytes:
+			Alternatively, split into as many shards as necessary for each one to fit this size.
+			It requires formatting every story twice: first to measure it, and then to actually write.
+		:param workers:
+			Number of processes to format (and measure) stories in. 0 or less means "as many as CPU cores".
+			Each shard is written by a single process, so there's no point in more workers than shards.
+			When enabled on Windows, make sure your main script is guarded with `if __name__ == '__main__':`
+		:return: Paths of written shard files.
+		"""
+		if shards is not None and max_shard_bytes is not None:
+			raise ValueError(f"Only one of shards number ({shards}) or max shard size ({max_shard_bytes}) is expected")
+		stories = list(self.stories.values())
+		file_path = _get_full_file_path(file_name, _default_out_file, 'output txt shards')
+		file_stem, file_ext = file_path.stem, file_path.suffix
+
+		if max_shard_bytes is None:
+			shard_stories = _split_to_n_shards(stories, workers_number(shards))
+		else:
+			sizes = map_batches_in_workers(_output_sizes, list(map(_output_parts, stories)), workers)
+			shard_stories = _split_to_capped_shards(stories, sizes, max_shard_bytes)
+
+		n_digits = max(4, len(str(len(shard_stories) - 1)))
+		shard_paths = [
+			file_path.with_name(f"{file_stem}.{i:0{n_digits}d}{file_ext}") for i in range(len(shard_stories))
+		]
+		n_workers = max(1, min(workers_number(workers), len(shard_paths)))
+		print(f"Writing {len(stories)} stories to {len(shard_paths)} shards in {n_workers} process(es)...")
+		shard_sizes = map_in_workers(
+			_write_output_shard, shard_paths, [list(map(_output_parts, x)) for x in shard_stories], workers=workers
 		)
-		return list(islice(all_story_texts, max_stories))
 
-	def dump_to_output_txt_file(self, file_name: _t.Optional[_PathLike] = None, max_stories=-1):
-		file_path = _get_full_file_path(file_name, _default_out_file, 'output txt file')
-		with open(file_path, 'w', encoding='utf-8', newline='\n') as file_handle:
-			file_handle.writelines(self.dumped_as_output_text(max_stories))
+		manifest = {
+			'shards': [
+				{
+					'file': shard_path.name,
+					'bytes': shard_size,
+					'stories': [story.id for story in cur_stories],
+				}
+				for shard_path, shard_size, cur_stories in zip(shard_paths, shard_sizes, shard_stories)
+			],
+		}
+		manifest_path = file_path.with_name(f"{file_stem}{_shards_manifest_suffix}")
+		with open(manifest_path, 'w', encoding=_out_file_encoding, newline='\n') as manifest_file:
+			json.dump(manifest, manifest_file, indent='\t')
+		print(f"Shards manifest:\n{manifest_path}")
+		return shard_paths
 
-	def filter_out_broken_stories(self):
+	def filter_out_broken_stories(self, detector: _t.Optional[BrokenStoryDetector] = None, workers: _t.Optional[int] = 1):
 		"""
-		Unfortunately, there's a garbage within dataset.
-		Fortunately, it for some reason has a COVID-19 warning at the end, so it's easy to detect.
-		To fix it permanently, one should update the dataset itself.
+		Unfortunately, there's a garbage within dataset: stories with a mess of html/js instead of the actual text.
+		Most of them for some reason have a COVID-19 warning at the end, and the rest are full of markup.
+		They're detected by a `BrokenStoryDetector`. The default one checks only for the COVID-19 warning.
+		Pass `BrokenStoryDetector.strict()` to catch the markup-heavy ones too, or a custom detector to change the checks.
+		The checks are done in `workers` processes (0 or less - as many as CPU cores).
+		When enabled on Windows, make sure your main script is guarded with `if __name__ == '__main__':`
 
+		To fix it permanently, one should update the dataset itself.
 		Use `DataSetLoader().dump_stories_to_category_json()` - but treat the DB CAREFULLY).
 		You should NOT perform any filtering or sorting prior to updating the source dataset.
 		"""
-		stories = dict(self.stories)
-		buggy = dict(self.broken_stories)
-		for story_id, story in list(stories.items()):
-			if story.text.rstrip().endswith("COVID-19 RESOURCES"):
-				stories.pop(story_id)
-				buggy[story_id] = story
-		return DataSetDB(dict(self.categories), stories, broken_stories=buggy)
+		if detector is None:
+			detector = _default_broken_story_detector
+		return self.__with_steps(_ExtractStep(partial(detector.are_broken, workers=workers)))
 
 	@staticmethod
 	def load_single_story_text_from_file(file_name: _PathLike, **dataset_loader_kwargs) -> str:
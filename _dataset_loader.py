@@ -8,16 +8,33 @@
 
 from attrs import define, field, setters as attrs_setters
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import gc
+import inspect
+from itertools import chain, islice
 import json
+import os
+import pickle
 from pathlib import Path
+import re
+from queue import Queue, Full
 from shutil import rmtree
+from sys import intern
+from threading import Event, Semaphore, Thread
+from time import time_ns
+from zlib import crc32
 
 from git import Repo, PathLike, NoSuchPathError, InvalidGitRepositoryError, RemoteProgress
 import multivolumefile
 from py7zr import SevenZipFile
 from tqdm import tqdm
 
-from ._data_objects import Category, ShortStoryMeta, Story
+from ._data_objects import Category, ShortStoryMeta, Story, mark_original_texts
+from ._near_dups import signatures_from_story_dicts, signature_params as _minhash_signature_params
+from ._text_index import TextIndex, TextIndexBuilder, TrigramIndex, TrigramIndexBuilder
+from ._text_store import TextStore, TextStoreWriter, store_paths_in_use
 
 
 class _SimpleGitProgress(RemoteProgress):
@@ -37,14 +54,335 @@ def update(self, op_code, cur_count, max_count=None, message=''):
 _story_ids_by_keyword_file = 'keywords_top_overall.json'
 _story_metas_file = 'story_list.json'
 _story_ids_by_category_file = 'story_list_by_category.json'
+# Needed regardless of which categories are loaded:
+_shared_files = (_categories_file, _story_ids_by_keyword_file, _story_metas_file, _story_ids_by_category_file)
+# Per-category files are named by these suffixes:
+_category_file_suffixes = Category.json_filenames_of('')
+_keywords_file_suffix, _stories_file_suffix = _category_file_suffixes
 
 _json_encoding = 'utf-8'
 
+# Bump them whenever the pickled layout changes, so that outdated files are ignored
+# (the snapshot one - on any change in data objects, too):
+_snapshot_format_version = 5
+_minhash_format_version = 1
+_snapshot_file_suffix = '.snapshot.pickle'
+# Text stores are never overwritten: stories loaded earlier (by any process) might still be reading from them.
+# Instead, each new store is a new generation of the file, named by the time it's written:
+_text_store_file_pattern = '.texts.{generation}.bin'
+_text_index_file_suffix = '.fulltext.bin'
+_trigram_index_file_suffix = '.trigrams.bin'
+_minhash_file_suffix = '.minhash.pickle'
+# What's extracted from which archive: to skip (or limit) extraction when the archive is updated.
+_unpack_manifest_file_suffix = '.unpacked.json'
+_unpack_manifest_version = 1
+# Parts of a cached file's name, telling which source it's built from (see `DataSetLoader._source_suffix`):
+_subset_suffix_format = '.cats-{:08x}'
+_archive_source_suffix = '.archive'
+_source_suffix_re = re.compile(rf"(?:\.cats-[0-9a-f]{{8}})?(?:{re.escape(_archive_source_suffix)})?")
+
 
 def field_readonly(default, **kwargs):
 	return field(default=default, on_setattr=attrs_setters.frozen, **kwargs)
 
 
+def _categories_subset(categories: _t.Optional[_t.Iterable[str]]) -> _t.Optional[_t.Tuple[str, ...]]:
+	if categories is None:
+		return None
+	if isinstance(categories, str):
+		categories = (categories, )
+	return tuple(sorted(set(categories)))
+
+
+def _file_stat(file_path: Path) -> _t.List[int]:
+	"""Size and modification time: cheap file fingerprint, to detect a changed file without reading it."""
+	stat = file_path.stat()
+	return [stat.st_size, stat.st_mtime_ns]
+
+
+@contextmanager
+def _gc_paused():
+	"""
+	Bulk creation of millions of objects (which all survive) makes the garbage collector
+	run over and over the entire heap, uselessly. It takes a significant share of the load time.
+	"""
+	was_enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if was_enabled:
+			gc.enable()
+
+
+def _load_json_file_at(file_path: PathLike):
+	# noinspection PyTypeChecker
+	with open(file_path, 'r', encoding=_json_encoding) as file_handle:
+		return json.load(file_handle)
+
+
+# Any of these means a broken (half-written, or pickled by an incompatible version of the code) cache file:
+_cache_load_errors = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError)
+
+
+def _load_versioned_pickle(file_path: Path, header: dict, print_name: str):
+	"""
+	Load the payload of a file saved by `_dump_versioned_pickle()`.
+	`None` if the file's header doesn't match the given one (i.e., it's of an incompatible format).
+	The file's header might have some other items, too: they're informational (see `_versioned_pickle_header()`).
+	"""
+	# noinspection PyTypeChecker
+	with open(file_path, 'rb') as file_handle:
+		# The header is pickled separately, to reject a file without reading the rest of it:
+		file_header = pickle.load(file_handle)
+		if not isinstance(file_header, dict) or any(file_header.get(k) != v for k, v in header.items()):
+			print(f"{print_name.capitalize()} has an incompatible format version.")
+			return None
+		return pickle.load(file_handle)
+
+
+def _versioned_pickle_header(file_path: Path) -> dict:
+	"""Just the header of a file saved by `_dump_versioned_pickle()`. Empty if the file can't be read."""
+	try:
+		# noinspection PyTypeChecker
+		with open(file_path, 'rb') as file_handle:
+			header = pickle.load(file_handle)
+	except _cache_load_errors:
+		return dict()
+	return header if isinstance(header, dict) else dict()
+
+
+def _dump_versioned_pickle(file_path: Path, header: dict, payload):
+	tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+	# noinspection PyTypeChecker
+	with open(tmp_path, 'wb') as file_handle:
+		pickle.dump(header, file_handle, protocol=pickle.HIGHEST_PROTOCOL)
+		pickle.dump(payload, file_handle, protocol=pickle.HIGHEST_PROTOCOL)
+	# Atomic replacement: a half-written file should never be picked up by a parallel/interrupted process.
+	os.replace(tmp_path, file_path)
+
+
+def _texts_moved_to_store(stories: _t.Dict[str, Story], text_writer: TextStoreWriter) -> _t.Dict[str, Story]:
+	"""
+	Replace each story text with a reference to it in the text store being written.
+	A story which is already there (from another category) refers to the stored text, after it's checked to be the same.
+	"""
+	for story_id, story in stories.items():
+		if story_id not in text_writer:
+			story.text = text_writer.add(story.text, story_id)
+			continue
+		stored_text_ref = text_writer.ref(story_id)
+		if stored_text_ref.resolve() != story.text:
+			raise ValueError(f"Same story appears twice with different texts:\n{story_id}")
+		story.text = stored_text_ref
+	# Assigning the text resets the flag, but it's still the same text:
+	mark_original_texts(stories.values())
+	return stories
+
+
+def _popped_parsed_files(parsed_files: _t.Dict[str, _t.Any], file_names: _t.Iterable[str]) -> _t.Iterator[_t.Any]:
+	"""Take the files parsed from the archive (see `DataSetLoader._parsed_archive_files()`) out, one by one."""
+	for file_name in file_names:
+		if file_name not in parsed_files:
+			raise FileNotFoundError(f"No such file in the dataset archive: {file_name}")
+		yield parsed_files.pop(file_name)
+
+
+def _files_of_categories(categories: _t.Optional[_t.Iterable[str]]) -> _t.Optional[_t.Set[str]]:
+	"""Dataset files needed to load the given categories. `None` means all of them."""
+	if categories is None:
+		return None
+	res = set(_shared_files)
+	for category in categories:
+		res.update(Category.json_filenames_of(category))
+	return res
+
+
+def _load_text_store_file(file_path: Path) -> TextStore:
+	store = TextStore(file_path)
+	try:
+		len(store.story_ids)  # Reads the store's index, failing on a broken file.
+	except Exception:
+		store.close()
+		raise
+	return store
+
+
+def _load_json_source(source: _t.Union[PathLike, bytes, bytearray]):
+	"""A JSON file - either by its path or by its raw contents (read straight from the archive)."""
+	if isinstance(source, (bytes, bytearray)):
+		return json.loads(source.decode(_json_encoding))
+	return _load_json_file_at(source)
+
+
+class _StreamCancelled(Exception):
+	pass
+
+
+class _StreamedArchiveMember:
+	"""
+	Collects decompressed chunks of a single archive member in memory, in a single growing buffer
+	(so that the whole member isn't copied once more to join the chunks).
+	Duck-typed `py7zr.io.Py7zIO`, so that the module works with any `py7zr` version.
+	"""
+	def __init__(self, file_name: str, cancelled: Event):
+		self.file_name = file_name
+		self._cancelled = cancelled
+		self._buffer = bytearray()
+
+	def write(self, data: _t.Union[bytes, bytearray]) -> int:
+		if self._cancelled.is_set():
+			# Stops decompression right away, without finishing the file:
+			raise _StreamCancelled()
+		self._buffer += data
+		return len(data)
+
+	def read(self, size: _t.Optional[int] = None) -> bytes:
+		return b''
+
+	def seek(self, offset: int, whence: int = 0) -> int:
+		return 0
+
+	def flush(self):
+		pass
+
+	def size(self) -> int:
+		return len(self._buffer)
+
+	def close(self):
+		pass
+
+	def data(self) -> bytearray:
+		"""Hand over the collected contents: `py7zr` may keep the member object itself for a while."""
+		data, self._buffer = self._buffer, bytearray()
+		return data
+
+
+class _ArchiveJsonStream:
+	"""
+	Dataset files decompressed straight from the archive into memory, in a single pass over it, without unpacking.
+	Files are iterated over as `(file_name, data)` pairs, in the archive's order. So the consumer has to take them
+	in this order, too: in a solid archive, jumping to a specific file means decompressing everything before it anyway.
+
+	Decompression runs in a background thread (which `lzma` lets run in parallel), but only on demand: the next file
+	is decompressed only when it's requested, never ahead of the consumer. So, as long as the consumer drops each file
+	before requesting the next one, at most a single file is kept in memory in its raw form.
+	A consumer sending files to worker processes overlaps decompression with their parsing, at the cost of
+	a raw file per busy worker.
+	"""
+	def __init__(self, archive: SevenZipFile, file_names: _t.Iterable[str]):
+		self.file_names = frozenset(file_names)
+		self._queue = Queue(maxsize=1)
+		self._requested = Semaphore(0)
+		self._pending: _t.Optional[_StreamedArchiveMember] = None
+		self._cancelled = Event()
+		self._is_finished = False
+		self._thread = Thread(target=self._decompress, args=(archive, ), daemon=True)
+		self._thread.start()
+
+	def create(self, file_name: str) -> _StreamedArchiveMember:
+		"""`py7zr.io.WriterFactory` interface, called from the background thread."""
+		# Members are decompressed one after another, and by now CRC of the previous one is already checked:
+		self._put_pending()
+		self._wait_requested()
+		self._pending = _StreamedArchiveMember(file_name, self._cancelled)
+		return self._pending
+
+	def _wait_requested(self):
+		while not self._requested.acquire(timeout=0.1):
+			if self._cancelled.is_set():
+				raise _StreamCancelled()
+
+	def _put(self, item):
+		while not self._cancelled.is_set():
+			try:
+				self._queue.put(item, timeout=0.1)
+				return
+			except Full:
+				continue
+		raise _StreamCancelled()
+
+	def _put_pending(self):
+		pending = self._pending
+		if pending is not None:
+			self._pending = None
+			self._put((pending.file_name, pending.data()))
+
+	def _decompress(self, archive: SevenZipFile):
+		try:
+			targets = sorted(self.file_names)
+			if 'factory' in inspect.signature(archive.extract).parameters:
+				archive.extract(targets=targets, factory=self)
+				self._put_pending()
+			else:
+				# Older `py7zr` can only decompress all the files into memory at once:
+				for file_name, data in archive.read(targets).items():
+					self._put((file_name, data.read()))
+			self._put(None)
+		except _StreamCancelled:
+			pass
+		except BaseException as e:
+			try:
+				self._put(e)
+			except _StreamCancelled:
+				pass
+
+	def __iter__(self) -> _t.Iterator[_t.Tuple[str, bytearray]]:
+		while not self._is_finished:
+			self._requested.release()
+			item = self._queue.get()
+			if item is None or isinstance(item, BaseException):
+				self._is_finished = True
+				if item is not None:
+					raise item
+				return
+			yield item
+			# Not to keep the file alive while the next one is decompressed:
+			del item
+
+	def close(self):
+		self._cancelled.set()
+		self._thread.join()
+
+
+# The functions below are executed in worker processes, so they have to be module-level (picklable) ones.
+# Each of them receives either a path to a JSON file or its raw contents.
+
+def _load_keyword_sets_from_file(source: _t.Union[PathLike, bytes]) -> _t.Dict[str, _t.Set[str]]:
+	with _gc_paused():
+		return {
+			k: set(v) for k, v in _load_json_source(source).items()
+		}
+
+
+def _stories_from_json_dict(raw_json_data: _t.Dict[str, dict]) -> _t.Dict[str, Story]:
+	"""
+	Convert raw story dicts, removing each one from the source dict right away, to not keep both in memory.
+	The batch is validated once and then stories are built bypassing per-field validators.
+	"""
+	stories = Story.deserialize_json_dicts(raw_json_data)
+	mark_original_texts(stories.values())
+	return stories
+
+
+def _load_stories_from_file(source: _t.Union[PathLike, bytes]) -> _t.Dict[str, Story]:
+	with _gc_paused():
+		return _stories_from_json_dict(_load_json_source(source))
+
+
+def _load_dataset_file(file_name: str, source: _t.Union[PathLike, bytes]):
+	"""Any of the files needed to load categories and stories, parsed according to its kind."""
+	if file_name.endswith(_stories_file_suffix):
+		return _load_stories_from_file(source)
+	if file_name.endswith(_keywords_file_suffix):
+		return _load_keyword_sets_from_file(source)
+	return _load_json_source(source)
+
+
+def _load_minhash_signatures_from_file(source: _t.Union[PathLike, bytes]) -> _t.Dict[str, bytes]:
+	return signatures_from_story_dicts(_load_json_source(source))
+
+
 @define
 class DataSetLoader:
 	"""
@@ -66,8 +404,33 @@ class DataSetLoader:
 
 	repo_url: str = field_readonly('https://github.com/Lex-DRL/LitErotica-v2-JSON.git')
 
+	# Keep a binary snapshot of the already parsed dataset next to the unpacked dir:
+	use_snapshot: bool = field_readonly(True)
+	# Load only story metadata, with texts moved to a compressed sidecar file and read from it on demand
+	# (see `load_text_store()`):
+	lazy_text: bool = field_readonly(False)
+	# Intern strings shared between stories/categories and keep story keywords as sorted tuples instead of sets
+	# (see `Story.compact()`). Several times less memory for metadata:
+	compact: bool = field_readonly(False)
+	# Number of worker processes to load category files in parallel. `1` means serial loading, `0` - use all CPU cores.
+	# When enabled on Windows, make sure your main script is guarded with `if __name__ == '__main__':`
+	workers: int = field_readonly(1)
+	# Only these categories are extracted from the archive and loaded (`None` - all of them).
+	# The other ones are never loaded by this loader (nor get into a DB loaded with it). Their files stay
+	# in the archive until something needs them, like a loader with a different subset on the same dir.
+	# A loader with a subset has its own snapshot and indexes, so they never get mixed with the ones for the full dataset:
+	categories: _t.Optional[_t.Tuple[str, ...]] = field_readonly(None, converter=_categories_subset)
+	# Read JSON files straight from the downloaded archive, never unpacking it to disk.
+	# For read-only/small disks. Local changes in the unpacked files (if there are any) aren't seen in this mode,
+	# so it has its own snapshot and indexes, too:
+	read_from_archive: bool = field_readonly(False)
+
 	__root_dir_path_cached: Path = None
 	__unpacked_dir_path_cached: Path = None
+	__text_store_cached: TextStore = None
+	__text_index_cached: TextIndex = None
+	__trigram_index_cached: TrigramIndex = None
+	__minhash_signatures_cached: _t.Dict[str, bytes] = None
 
 	@property
 	def root_package_dir_path(self) -> Path:
@@ -97,12 +460,88 @@ def _unpacked_dir_path(self) -> Path:
 			self.__unpacked_dir_path_cached = (repo_dir / self.unpack_subdir).absolute()
 		return self.__unpacked_dir_path_cached
 
-	def download_and_unpack(self) -> Repo:
+	def _path_next_to_unpacked_dir(self, suffix: str) -> Path:
+		unpacked_dir_path = self._unpacked_dir_path
+		return unpacked_dir_path.with_name(f"{unpacked_dir_path.name}{suffix}")
+
+	@property
+	def _subset_suffix(self) -> str:
+		"""Distinguishes files built from a subset of categories. Empty for the full dataset."""
+		categories = self.categories
+		if categories is None:
+			return ''
+		subset_hash = crc32('\n'.join(categories).encode(_json_encoding))
+		return _subset_suffix_format.format(subset_hash)
+
+	@property
+	def _source_suffix(self) -> str:
 		"""
-		Unconditionally (force-) download the dataset from GitHub and extract it.
+		Distinguishes files built from different sources: a subset of categories and/or the archive itself.
+		The archive doesn't have local changes of the unpacked files, so the files built from it are never mixed
+		with the ones built from the unpacked dataset.
+		"""
+		return f"{self._subset_suffix}{_archive_source_suffix if self.read_from_archive else ''}"
+
+	def _wanted_files(self) -> _t.Optional[_t.Set[str]]:
+		"""Dataset files needed for the categories subset. `None` means all of them."""
+		return _files_of_categories(self.categories)
+
+	@property
+	def _snapshot_file_path(self) -> Path:
+		# Each loading mode produces different data, so each one has its own snapshot:
+		mode_suffix = ''.join(
+			x_suffix for x_suffix, x_enabled in (('.compact', self.compact), ('.meta', self.lazy_text))
+			if x_enabled
+		)
+		return self._path_next_to_unpacked_dir(f"{self._source_suffix}{mode_suffix}{_snapshot_file_suffix}")
+
+	def _text_store_file_paths(self) -> _t.List[Path]:
+		"""All the generations of text store for the current source, from the oldest one to the newest."""
+		pattern_path = self._path_next_to_unpacked_dir(
+			f"{self._source_suffix}{_text_store_file_pattern.format(generation='*')}"
+		)
+		return sorted(pattern_path.parent.glob(pattern_path.name))
+
+	def _new_text_store_file_path(self) -> Path:
+		generation = time_ns()
+		while True:
+			file_path = self._path_next_to_unpacked_dir(
+				f"{self._source_suffix}{_text_store_file_pattern.format(generation=f'{generation:016x}')}"
+			)
+			if not file_path.exists():
+				return file_path
+			generation += 1
+
+	@property
+	def _text_index_file_path(self) -> Path:
+		return self._path_next_to_unpacked_dir(f"{self._source_suffix}{_text_index_file_suffix}")
+
+	@property
+	def _trigram_index_file_path(self) -> Path:
+		return self._path_next_to_unpacked_dir(f"{self._source_suffix}{_trigram_index_file_suffix}")
+
+	@property
+	def _minhash_file_path(self) -> Path:
+		return self._path_next_to_unpacked_dir(f"{self._source_suffix}{_minhash_file_suffix}")
+
+	@property
+	def _unpack_manifest_file_path(self) -> Path:
+		return self._path_next_to_unpacked_dir(_unpack_manifest_file_suffix)
+
+	def download_and_unpack(self, force_unpack=False) -> Repo:
+		"""
+		Download the dataset from GitHub (or pull updates for it) and extract it.
 		You might need to manually remove the repo dir if it's already downloaded and yet broken.
 		The method doesn't do that to stay away from accidental removal of dataset customizations you'd like to keep.
+
+		Extraction is incremental (see `unpack()`), unless `force_unpack` is set.
 		"""
+		repo = self.download()
+		self.unpack(force=force_unpack)
+		return repo
+
+	def download(self) -> Repo:
+		"""Download the dataset from GitHub (or pull updates for it), without extracting it."""
 		repo_dir = self._repo_subdir_path()
 
 		try:
@@ -114,19 +553,181 @@ def download_and_unpack(self) -> Repo:
 			print(f"Cloning <LitErotica dataset> repository...\n{self.repo_url}\n{repo_dir}")
 			# noinspection PyTypeChecker
 			repo = Repo.clone_from(self.repo_url, repo_dir, branch='main', progress=_SimpleGitProgress())
+		return repo
+
+	def _archive_volume_paths(self) -> _t.List[Path]:
+		archive_file = self.archive_file
+		return sorted(
+			x for x in self._repo_subdir_path().glob(f"{archive_file}.*")
+			if x.is_file() and x.name[len(archive_file) + 1:].isdigit()
+		)
+
+	def _load_unpack_manifest(self) -> _t.Optional[dict]:
+		manifest_path = self._unpack_manifest_file_path
+		if not manifest_path.is_file():
+			return None
+		try:
+			manifest: dict = _load_json_file_at(manifest_path)
+		except (OSError, ValueError) as e:
+			print(f"Unpacked files manifest is broken, ignoring it: {e}")
+			return None
+		if manifest.get('version') != _unpack_manifest_version:
+			return None
+		return manifest
 
+	def _locally_modified_files(self, manifest: dict) -> _t.Set[str]:
+		"""Previously extracted files which were changed afterwards (e.g., with `dump_stories_to_category_json()`)."""
 		unpacked_dir_path = self._unpacked_dir_path
-		print(f"\nUnpacking dataset from archive to:\n{unpacked_dir_path}")
-		if unpacked_dir_path.exists() and unpacked_dir_path.is_dir():
-			print("Removing old dir...")
-			rmtree(unpacked_dir_path)
+		res: _t.Set[str] = set()
+		for file_name, member in manifest['members'].items():
+			file_path = unpacked_dir_path / file_name
+			if file_path.is_file() and _file_stat(file_path) != member['local']:
+				res.add(file_name)
+		return res
 
-		print("Unpacking (please wait)...")
-		with multivolumefile.open(repo_dir / self.archive_file, mode='rb') as joined_archive_file:
+	def _write_unpack_manifest(self, manifest: dict):
+		manifest_path = self._unpack_manifest_file_path
+		tmp_path = manifest_path.with_name(f"{manifest_path.name}.tmp")
+		with open(tmp_path, 'w', encoding=_json_encoding) as manifest_file:
+			json.dump(manifest, manifest_file, indent='\t')
+		os.replace(tmp_path, manifest_path)
+
+	@contextmanager
+	def _opened_archive(self) -> _t.Iterator[SevenZipFile]:
+		if not self._archive_volume_paths():
+			print("Dataset isn't downloaded yet. Downloading it...")
+			self.download()
+		with multivolumefile.open(self._repo_subdir_path() / self.archive_file, mode='rb') as joined_archive_file:
 			with SevenZipFile(joined_archive_file, mode='r') as archive:
-				archive.extractall(path=unpacked_dir_path)
+				yield archive
+
+	def unpack(self, force=False):
+		"""
+		Extract the dataset from the already downloaded archive.
+
+		The archive volumes and the extracted files are recorded in a manifest next to the unpacked dir.
+		So the next time:
+		- if the archive hasn't changed and all the files are in place, nothing is extracted at all;
+		- otherwise, only the files which are changed in the archive (by checksum) or missing are extracted.
+
+		If the loader has a `categories` subset, only the shared files and the files of these categories are extracted.
+		The rest of them stay in the archive until something needs them (see `_ensure_extracted()`).
+
+		The dataset files modified locally after extraction (like manually fixed stories) are never overwritten:
+		they're kept and reported. Delete such a file to get its version from the archive again.
+		With `force`, the unpacked dir is removed and the archive is extracted from scratch.
+		"""
+		unpacked_dir_path = self._unpacked_dir_path
+		wanted = self._wanted_files()
+		volumes = {x.name: _file_stat(x) for x in self._archive_volume_paths()}
+		manifest = None
+		if not force and unpacked_dir_path.is_dir():
+			manifest = self._load_unpack_manifest()
+
+		locally_modified: _t.Set[str] = set()
+		if manifest is not None:
+			locally_modified = self._locally_modified_files(manifest)
+			if manifest['volumes'] == volumes and all(
+				(unpacked_dir_path / x).is_file() for x in manifest['members'] if wanted is None or x in wanted
+			):
+				print("Dataset archive hasn't changed since the last extraction. Skipping it.")
+				self.__report_locally_modified(locally_modified)
+				return
+
+		print(f"\nUnpacking dataset from archive to:\n{unpacked_dir_path}")
+		with self._opened_archive() as archive:
+			members: _t.Dict[str, dict] = {
+				x.filename: dict(crc32=x.crc32, size=x.uncompressed)
+				for x in archive.list() if not x.is_directory
+			}
+			archive.reset()
+			if wanted is not None:
+				not_in_archive = sorted(x for x in wanted if x not in members)
+				if not_in_archive:
+					print("WARNING! These files of the selected categories aren't in the archive:\n" + '\n'.join(not_in_archive))
+
+			if manifest is None:
+				# Extracted files keep their in-archive modification time,
+				# so it can't be trusted to detect an outdated snapshot:
+				self._remove_unpacked_caches()
+				if unpacked_dir_path.exists() and unpacked_dir_path.is_dir():
+					print("Removing old dir...")
+					rmtree(unpacked_dir_path)
+				if wanted is None:
+					print("Unpacking (please wait)...")
+					archive.extractall(path=unpacked_dir_path)
+				else:
+					targets = [x for x in members if x in wanted]
+					print(f"Unpacking {len(targets)} file(s) of the selected categories out of {len(members)} (please wait)...")
+					archive.extract(path=unpacked_dir_path, targets=targets)
+			else:
+				self.__unpack_changed(archive, manifest, members, locally_modified, wanted)
+
+		# Locally modified files keep their recorded state, so they're still detected as such the next time:
+		prev_members: _t.Dict[str, dict] = manifest['members'] if manifest is not None else dict()
+		for file_name, member in members.items():
+			file_path = unpacked_dir_path / file_name
+			if file_name in locally_modified and file_name in prev_members:
+				member['local'] = prev_members[file_name]['local']
+			else:
+				member['local'] = _file_stat(file_path) if file_path.is_file() else None
+		self._write_unpack_manifest(dict(version=_unpack_manifest_version, volumes=volumes, members=members))
 		print("Done!\n")
-		return repo
+
+	def __unpack_changed(
+		self, archive: SevenZipFile, manifest: dict, members: _t.Dict[str, dict], locally_modified: _t.Set[str],
+		wanted: _t.Optional[_t.Set[str]],
+	):
+		"""
+		Extract only the changed/missing files. Remove the ones which are no longer in the archive.
+		The files which aren't extracted yet and aren't `wanted` are left in the archive.
+		"""
+		unpacked_dir_path = self._unpacked_dir_path
+		prev_members: _t.Dict[str, dict] = manifest['members']
+
+		changed: _t.List[str] = list()
+		conflicts: _t.List[str] = list()
+		for file_name, member in members.items():
+			is_extracted = (unpacked_dir_path / file_name).is_file()
+			if not(is_extracted or wanted is None or file_name in wanted):
+				continue
+			prev_member = prev_members.get(file_name)
+			is_changed = prev_member is None or any(prev_member.get(x) != member[x] for x in ('crc32', 'size'))
+			if file_name in locally_modified:
+				if is_changed:
+					conflicts.append(file_name)
+				continue
+			if is_changed or not is_extracted:
+				changed.append(file_name)
+		removed = [
+			x for x in prev_members
+			if x not in members and x not in locally_modified and (unpacked_dir_path / x).is_file()
+		]
+
+		self.__report_locally_modified(locally_modified)
+		if conflicts:
+			print(
+				"WARNING! These locally modified files are also updated in the archive. "
+				"Local versions are kept, delete them to get the updated ones:\n" + '\n'.join(conflicts)
+			)
+		if not(changed or removed):
+			print("No dataset files are changed in the archive.")
+			return
+
+		# Extracted files keep their in-archive modification time, so it can't be trusted to detect an outdated snapshot:
+		self._remove_unpacked_caches(chain(changed, removed))
+		for file_name in removed:
+			print(f"Removing the file which is no longer in the archive: {file_name}")
+			(unpacked_dir_path / file_name).unlink(missing_ok=True)
+		if changed:
+			print(f"Unpacking {len(changed)} changed file(s) out of {len(members)} (please wait)...")
+			archive.extract(path=unpacked_dir_path, targets=changed)
+
+	@staticmethod
+	def __report_locally_modified(locally_modified: _t.Iterable[str]):
+		locally_modified = sorted(locally_modified)
+		if locally_modified:
+			print("Locally modified dataset files (kept as is):\n" + '\n'.join(locally_modified))
 
 	def dataset_dir(self) -> Path:
 		"""The path to the folder containing JSON files. If necessary, the dataset will be auto-downloaded."""
@@ -138,11 +739,202 @@ def dataset_dir(self) -> Path:
 			self.download_and_unpack()
 		return unpacked_dir_path
 
-	def _load_json_file(self, file_name: PathLike):
-		file_path = (self.dataset_dir() / file_name).absolute()
-		# noinspection PyTypeChecker
-		with open(file_path, 'r', encoding=_json_encoding) as file_handle:
-			return json.load(file_handle)
+	def __missing_files_for_loading(self, file_names: _t.Iterable[str]) -> _t.List[str]:
+		"""Which of the given dataset files are needed to load the `categories` and aren't extracted yet."""
+		dataset_dir = self._unpacked_dir_path
+		wanted = self._wanted_files()
+		return [
+			x for x in file_names
+			if (wanted is None or x in wanted) and not (dataset_dir / x).is_file()
+		]
+
+	def _ensure_extracted(self, file_names: _t.Iterable[str]):
+		"""
+		Lazy extraction of the dataset files which weren't unpacked yet (see `categories`).
+		The archive is solid, so extracting anything from it means decompressing it up to that file. Thus, once
+		it's needed, any other missing file for the loaded categories is extracted, too, all of them in a single pass.
+		This way, loading categories and then their stories doesn't go through the archive twice.
+		The files which aren't in the archive either are left for the caller to fail on.
+		"""
+		if self.read_from_archive:
+			return
+		dataset_dir = self.dataset_dir()
+		missing = [x for x in dict.fromkeys(file_names) if not (dataset_dir / x).is_file()]
+		if not(missing and self._archive_volume_paths()):
+			return
+
+		manifest = self._load_unpack_manifest()
+		if manifest is not None:
+			missing = [x for x in missing if x in manifest['members']]
+			if not missing:
+				return
+			missing = list(dict.fromkeys(chain(missing, self.__missing_files_for_loading(manifest['members']))))
+		with self._opened_archive() as archive:
+			if manifest is None:
+				in_archive = [x.filename for x in archive.list() if not x.is_directory]
+				archive.reset()
+				in_archive_set = set(in_archive)
+				missing = [x for x in missing if x in in_archive_set]
+				if not missing:
+					return
+				missing = list(dict.fromkeys(chain(missing, self.__missing_files_for_loading(in_archive))))
+			print(f"Extracting {len(missing)} more dataset file(s) from archive...")
+			archive.extract(path=dataset_dir, targets=missing)
+
+		if manifest is None:
+			return
+		members: _t.Dict[str, dict] = manifest['members']
+		restored = [x for x in missing if members[x]['local'] is not None]
+		if restored:
+			# A previously extracted file was deleted to get its archived version back, while the snapshot
+			# might still contain the deleted one. Its in-archive modification time can't detect that:
+			self._remove_unpacked_caches(restored)
+		for file_name in missing:
+			file_path = dataset_dir / file_name
+			members[file_name]['local'] = _file_stat(file_path) if file_path.is_file() else None
+		self._write_unpack_manifest(manifest)
+
+	def _is_category_file_for_loading(
+		self, file_name: str, suffixes: _t.Tuple[str, ...] = _category_file_suffixes
+	) -> bool:
+		"""Whether it's a per-category file (of the given kinds) of a loaded category."""
+		if not file_name.endswith(suffixes):
+			return False
+		wanted = self._wanted_files()
+		return wanted is None or file_name in wanted
+
+	def _is_file_for_categories(self, file_name: str) -> bool:
+		"""Whether the file is needed to load categories (see `load_categories()`)."""
+		if file_name in (_categories_file, _story_ids_by_category_file):
+			return True
+		return self._is_category_file_for_loading(file_name, (_keywords_file_suffix, ))
+
+	def _is_stories_file_for_loading(self, file_name: str) -> bool:
+		return self._is_category_file_for_loading(file_name, (_stories_file_suffix, ))
+
+	def _is_file_for_loading(self, file_name: str) -> bool:
+		"""Whether the file is needed to load categories and stories (see `load_all()`)."""
+		if file_name in (_categories_file, _story_ids_by_category_file):
+			return True
+		return self._is_category_file_for_loading(file_name)
+
+	@contextmanager
+	def _opened_archive_stream(self, is_needed_f: _t.Callable[[str], bool]) -> _t.Iterator[_ArchiveJsonStream]:
+		with self._opened_archive() as archive:
+			file_names = [x.filename for x in archive.list() if not x.is_directory and is_needed_f(x.filename)]
+			archive.reset()
+			stream = _ArchiveJsonStream(archive, file_names)
+			try:
+				yield stream
+			finally:
+				stream.close()
+
+	def _json_source(self, file_name: str) -> _t.Union[str, bytes]:
+		"""Path to a dataset file or, in `read_from_archive` mode, its contents."""
+		if not self.read_from_archive:
+			return str((self.dataset_dir() / file_name).absolute())
+		with self._opened_archive_stream(lambda x: x == file_name) as one_file_stream:
+			for _, data in one_file_stream:
+				return data
+		raise FileNotFoundError(f"No such file in the dataset archive: {file_name}")
+
+	def _load_json_file(self, file_name: str):
+		self._ensure_extracted((file_name, ))
+		return _load_json_source(self._json_source(file_name))
+
+	def _workers_number(self, n_tasks: int) -> int:
+		workers = self.workers
+		if workers is None or workers < 1:
+			workers = os.cpu_count() or 1
+		return max(1, min(workers, n_tasks))
+
+	def _imap_in_workers(
+		self, func: _t.Callable[..., _t.Any], args: _t.Iterable[tuple], n_tasks: int, tasks_per_worker: int = 2
+	) -> _t.Iterator[_t.Any]:
+		"""
+		Call the given function for each tuple of arguments: in a process pool, if `workers` allow, or serially.
+		The results are yielded in the same order as the arguments, regardless of which call is finished first.
+
+		Arguments are taken lazily and only a limited number of calls (`tasks_per_worker` per each worker)
+		is done ahead of the consumer, so neither the arguments (which might be entire files read into memory)
+		nor the finished-but-not-yet-consumed results pile up in memory. Serially, the arguments of a call
+		are dropped as soon as it's done, before the next ones are taken.
+		"""
+		args = iter(args)
+		n_workers = self._workers_number(n_tasks)
+		if n_workers < 2:
+			for x_args in args:
+				result = func(*x_args)
+				del x_args
+				yield result
+			return
+		with ProcessPoolExecutor(max_workers=n_workers) as executor:
+			futures = deque(
+				executor.submit(func, *x_args) for x_args in islice(args, n_workers * max(1, tasks_per_worker))
+			)
+			while futures:
+				result = futures.popleft().result()
+				for x_args in islice(args, 1):
+					futures.append(executor.submit(func, *x_args))
+				yield result
+
+	def _imap_dataset_files(self, func: _t.Callable[[str], _t.Any], file_names: _t.List[str]) -> _t.Iterator[_t.Any]:
+		"""Call the given function for each dataset file (see `_imap_in_workers()`), in the given order."""
+		self._ensure_extracted(file_names)
+		return self._imap_in_workers(func, zip(map(self._json_source, file_names)), len(file_names))
+
+	def _parsed_archive_files(
+		self, is_needed_f: _t.Callable[[str], bool], text_writer: _t.Optional[TextStoreWriter] = None
+	) -> _t.Dict[str, _t.Any]:
+		"""
+		In `read_from_archive` mode: the needed dataset files, parsed in a single pass over the archive.
+		They're parsed in the archive's order, each one as soon as it's decompressed (in worker processes,
+		if `workers` allow), so none of them is kept in its raw form, waiting for the ones requested earlier.
+		At most a single raw file is held in memory at once - or one per worker.
+		It's up to the caller to assemble the parsed files afterwards, in whatever order it needs.
+
+		With a text writer, story texts are moved to the text store as soon as each stories file is parsed.
+		"""
+		parsed_files: _t.Dict[str, _t.Any] = dict()
+		with self._opened_archive_stream(is_needed_f) as stream:
+			submitted_file_names: _t.Deque[str] = deque()
+
+			def iter_args():
+				for file_name, data in stream:
+					submitted_file_names.append(file_name)
+					yield file_name, data
+					del data
+
+			for parsed in self._imap_in_workers(
+				_load_dataset_file, iter_args(), len(stream.file_names), tasks_per_worker=1
+			):
+				file_name = submitted_file_names.popleft()
+				if text_writer is not None and file_name.endswith(_stories_file_suffix):
+					parsed = _texts_moved_to_store(parsed, text_writer)
+				parsed_files[file_name] = parsed
+		return parsed_files
+
+	def _iter_parsed_stories_files(self, parse_f: _t.Callable[[_t.Union[str, bytes]], _t.Any]) -> _t.Iterator[_t.Any]:
+		"""
+		Each stories file of the loaded categories, parsed with the given (module-level) function.
+		In `read_from_archive` mode, they're parsed in the archive's order, as they're decompressed.
+		Otherwise, in the order of categories.
+
+		For the data built from all the stories, where it doesn't matter which of the duplicate stories
+		(the same ones in different categories) comes first.
+		"""
+		if not self.read_from_archive:
+			file_names = [cat.json_stories_filename for cat in self.load_categories().values()]
+			yield from self._imap_dataset_files(parse_f, file_names)
+			return
+		with self._opened_archive_stream(self._is_stories_file_for_loading) as stream:
+
+			def iter_args():
+				for _, data in stream:
+					yield (data, )
+					del data
+
+			yield from self._imap_in_workers(parse_f, iter_args(), len(stream.file_names), tasks_per_worker=1)
 
 	def _load_story_ids_by_category(self) -> _t.Dict[str, _t.List[str]]:
 		return self._load_json_file(_story_ids_by_category_file)
@@ -164,53 +956,479 @@ def load_short_story_metas(self) -> _t.Dict[str, ShortStoryMeta]:
 		}
 
 	def load_categories(self) -> _t.Dict[str, Category]:
-		raw_json_data: dict = self._load_json_file(_categories_file)
-		categories: _t.Dict[str, Category] = {
+		"""All the categories or only the `categories` subset, if it's specified."""
+		if self.read_from_archive:
+			return self._categories_from_parsed_files(self._parsed_archive_files(self._is_file_for_categories))
+
+		categories = self._deserialized_categories(self._load_json_file(_categories_file))
+		keywords_file_names = [cat.json_keywords_filename for cat in categories.values()]
+		self._ensure_extracted(keywords_file_names)
+		self._set_category_story_ids(categories, self._load_story_ids_by_category())
+		keyword_sets_by_cat = self._imap_dataset_files(_load_keyword_sets_from_file, keywords_file_names)
+		for cat, keyword_sets in zip(categories.values(), keyword_sets_by_cat):
+			cat.stories_by_keyword = keyword_sets
+		return self._finalized_categories(categories)
+
+	def _categories_from_parsed_files(self, parsed_files: _t.Dict[str, _t.Any]) -> _t.Dict[str, Category]:
+		"""The same as `load_categories()`, from the files already parsed from the archive (which are taken out)."""
+		raw_json_data, story_ids_by_category = _popped_parsed_files(
+			parsed_files, (_categories_file, _story_ids_by_category_file)
+		)
+		categories = self._deserialized_categories(raw_json_data)
+		self._set_category_story_ids(categories, story_ids_by_category)
+		keyword_sets_by_cat = _popped_parsed_files(parsed_files, [cat.json_keywords_filename for cat in categories.values()])
+		for cat, keyword_sets in zip(categories.values(), keyword_sets_by_cat):
+			cat.stories_by_keyword = keyword_sets
+		return self._finalized_categories(categories)
+
+	def _deserialized_categories(self, raw_json_data: dict) -> _t.Dict[str, Category]:
+		subset = self.categories
+		if subset is not None:
+			unknown = [x for x in subset if x not in raw_json_data]
+			if unknown:
+				raise ValueError(f"Unknown categories: {unknown}")
+			# In the dataset's order, not in the subset's one: the same stories are kept as in the full dataset.
+			raw_json_data = {x_nm: x_dict for x_nm, x_dict in raw_json_data.items() if x_nm in subset}
+		return {
 			x_nm: Category.deserialize_json_dict(**x_dict)
 			for x_nm, x_dict in raw_json_data.items()
 		}
-		story_ids_by_category = self._load_story_ids_by_category()
-		for cat_id, story_ids in story_ids_by_category.items():
-			cat = categories[cat_id]
-			cat.stories = set(story_ids)
 
-		for cat in categories.values():
-			cat.stories_by_keyword = {
-				k: set(v) for k, v in self._load_story_ids_by_keyword_for_category(cat).items()
-			}
+	@staticmethod
+	def _set_category_story_ids(categories: _t.Dict[str, Category], story_ids_by_category: _t.Dict[str, _t.List[str]]):
+		for cat_id, story_ids in story_ids_by_category.items():
+			cat = categories.get(cat_id)
+			if cat is not None:
+				cat.stories = set(story_ids)
 
+	def _finalized_categories(self, categories: _t.Dict[str, Category]) -> _t.Dict[str, Category]:
+		if self.compact:
+			for cat in categories.values():
+				cat.compact()
 		return categories
 
+	def _iter_stories_by_category(self, categories: _t.Dict[str, Category]) -> _t.Iterator[_t.Dict[str, Story]]:
+		"""One category at a time, in the order of categories - either serially or in a process pool."""
+		return self._imap_dataset_files(_load_stories_from_file, [cat.json_stories_filename for cat in categories.values()])
+
+	@contextmanager
+	def _text_store_written(self) -> _t.Iterator[_t.Optional[TextStoreWriter]]:
+		"""In `lazy_text` mode, a new text store is written within this context. Otherwise, the writer is `None`."""
+		if not self.lazy_text:
+			yield None
+			return
+		text_store_path = self._new_text_store_file_path()
+		print(f"Writing story texts to:\n{text_store_path}")
+		self.__text_store_cached = None
+		with TextStoreWriter(text_store_path) as text_writer:
+			yield text_writer
+		# The same store is available for random access by story ID (see `load_text_store()`):
+		self.__text_store_cached = text_writer.store
+		self._remove_superseded_text_stores(text_store_path)
+
 	def load_all_stories(self, categories: _t.Dict[str, Category]) -> _t.Dict[str, Story]:
-		raw_story_dicts_by_id_by_cat: _t.Dict[str, _t.Dict[str, dict]] = {
-			cat_id: self._load_stories_for_category(cat) for cat_id, cat in categories.items()
-		}
-		all_story_dicts_by_id: _t.Dict[str, dict] = dict()
-		for cat_stories_dict in raw_story_dicts_by_id_by_cat.values():
-			for story_id, story_data_dict in cat_stories_dict.items():
-				if story_id not in all_story_dicts_by_id:
-					all_story_dicts_by_id[story_id] = story_data_dict
+		"""
+		Stories are streamed category by category: at any moment, only a single category is kept in its raw form.
+		In `lazy_text` mode, each text is also moved to the text store as soon as its category is parsed.
+
+		In `read_from_archive` mode, stories files are parsed in the archive's order instead (see `load_all()`),
+		and only then merged in the order of categories.
+		"""
+		with self._text_store_written() as text_writer:
+			if self.read_from_archive:
+				stories_file_names = [cat.json_stories_filename for cat in categories.values()]
+				parsed_files = self._parsed_archive_files(set(stories_file_names).__contains__, text_writer)
+				return self._merged_stories(_popped_parsed_files(parsed_files, stories_file_names))
+
+			stories_by_category = self._iter_stories_by_category(categories)
+			if text_writer is not None:
+				stories_by_category = (_texts_moved_to_store(x, text_writer) for x in stories_by_category)
+			return self._merged_stories(stories_by_category)
+
+	def _load_all_from_archive(self) -> _t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]:
+		"""Both categories and stories, parsed in a single pass over the archive."""
+		with self._text_store_written() as text_writer:
+			parsed_files = self._parsed_archive_files(self._is_file_for_loading, text_writer)
+			categories = self._categories_from_parsed_files(parsed_files)
+			stories_file_names = [cat.json_stories_filename for cat in categories.values()]
+			return categories, self._merged_stories(_popped_parsed_files(parsed_files, stories_file_names))
+
+	def _merged_stories(self, stories_by_category: _t.Iterable[_t.Dict[str, Story]]) -> _t.Dict[str, Story]:
+		"""
+		Stories of all the categories, in their order. The first occurrence of a story is the one that's kept,
+		and any other one is checked to be the same.
+		In `compact` mode, stories are compacted right in the main process, so that strings are interned there
+		even if stories were built by worker processes.
+		"""
+		compact = self.compact
+		all_stories: _t.Dict[str, Story] = dict()
+		for cat_stories in stories_by_category:
+			for story_id, story in cat_stories.items():
+				if story_id not in all_stories:
+					if compact:
+						story_id = intern(story_id)
+						story.compact()
+					all_stories[story_id] = story
 					continue
-				if all_story_dicts_by_id[story_id] != story_data_dict:
+				# In `lazy_text` mode, texts are compared, too: the text store is already flushed by the time
+				# the duplicate is seen (see `_texts_moved_to_store()`).
+				if all_stories[story_id] != story:
 					raise ValueError(
 						f"Same story appears twice with different data:\n"
-						f"{story_id}\n{all_story_dicts_by_id[story_id]}\n{story_data_dict}"
+						f"{story_id}\n{all_stories[story_id]}\n{story}"
 					)
+			del cat_stories
+		return all_stories
 
-		# We've flattened the dict of dicts of dicts.
-		# Now, all the stories are in the same pool... but they're still raw json dicts themselves.
-		# Converting to the actual data objects:
-		return {
-			x_id: Story.deserialize_json_dict(**x_dict)
-			for x_id, x_dict in all_story_dicts_by_id.items()
-		}
-
-	def load_all(self) -> _t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]:
+	def _loaded_from_json(self) -> _t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]:
+		if self.read_from_archive:
+			return self._load_all_from_archive()
 		categories = self.load_categories()
-		stories = self.load_all_stories(categories)
+		return categories, self.load_all_stories(categories)
+
+	def _newest_source_json_mtime(self) -> int:
+		if self.read_from_archive:
+			return max((x.stat().st_mtime_ns for x in self._archive_volume_paths()), default=0)
+		return max(
+			(x.stat().st_mtime_ns for x in self.dataset_dir().glob('*.json')),
+			default=0
+		)
+
+	def remove_snapshot(self):
+		"""
+		Delete the binary snapshots (if any), forcing the next `load_all()` to re-parse the source JSON files.
+		Text indexes (full-text and trigram ones) and near-duplicate signatures are removed, too:
+		they need to be rebuilt the same way. So are text stores.
+		"""
+		self.__remove_caches(lambda source_suffix: True)
+
+	def _remove_unpacked_caches(self, changed_files: _t.Optional[_t.Iterable[str]] = None):
+		"""
+		The same as `remove_snapshot()`, but only for the files built from the unpacked dataset,
+		once the given files (all of them, if `None`) are extracted there anew.
+		The files built straight from the archive (`read_from_archive`) aren't affected by that, so they're kept.
+		So are the ones of a categories subset which doesn't load any of the changed files.
+		"""
+		changed_files = None if changed_files is None else set(changed_files)
+		unpacked_dir_path = self._unpacked_dir_path
+
+		def subset_files(subset_suffix: str) -> _t.Optional[_t.Set[str]]:
+			"""Files of the subset, by the categories recorded in its snapshots. `None` if they aren't known."""
+			snapshots_pattern = f"{unpacked_dir_path.name}{subset_suffix}*{_snapshot_file_suffix}"
+			for file_path in unpacked_dir_path.parent.glob(snapshots_pattern):
+				categories = _versioned_pickle_header(file_path).get('categories')
+				if categories is not None:
+					return _files_of_categories(categories)
+			return None
+
+		def is_affected(source_suffix: str) -> bool:
+			if source_suffix.endswith(_archive_source_suffix):
+				return False
+			if changed_files is None or not source_suffix:
+				return True
+			files = subset_files(source_suffix)
+			return files is None or not changed_files.isdisjoint(files)
+
+		self.__remove_caches(is_affected)
+
+	def __remove_caches(self, is_affected_f: _t.Callable[[str], bool]):
+		"""
+		Remove the files derived from the dataset (of each loading mode and each categories subset), which are
+		affected by a change of the given source: the function receives their source suffix (see `_source_suffix`).
+		"""
+		if is_affected_f(self._source_suffix):
+			for text_index in (self.__text_index_cached, self.__trigram_index_cached):
+				if text_index is not None:
+					text_index.close()
+			self.__text_index_cached = None
+			self.__trigram_index_cached = None
+			self.__minhash_signatures_cached = None
+			self.__text_store_cached = None
+
+		unpacked_dir_path = self._unpacked_dir_path
+		name_prefix_len = len(unpacked_dir_path.name)
+
+		def affected_files(suffix: str) -> _t.Iterator[Path]:
+			for file_path in unpacked_dir_path.parent.glob(f"{unpacked_dir_path.name}*{suffix}"):
+				if is_affected_f(_source_suffix_re.match(file_path.name, name_prefix_len).group()):
+					yield file_path
+
+		for suffix in (_snapshot_file_suffix, _text_index_file_suffix, _trigram_index_file_suffix, _minhash_file_suffix):
+			for file_path in list(affected_files(suffix)):
+				file_path.unlink(missing_ok=True)
+		# Text stores aren't deleted: stories loaded earlier keep reading their texts from them.
+		# They're only marked as outdated, so that a new generation of the store is written the next time it's needed.
+		# The old ones are deleted once it's written (see `_remove_superseded_text_stores()`):
+		for file_path in list(affected_files(_text_store_file_pattern.format(generation='*'))):
+			os.utime(file_path, ns=(0, 0))
+
+	def remove_old_text_stores(self):
+		"""
+		Delete all the previous generations of text store (for the current categories subset and source),
+		keeping only the newest one.
+
+		A text store is never overwritten, since stories loaded earlier (in `lazy_text` mode) read their texts from it.
+		The previous generations are deleted automatically, as soon as a new one is written - but only the ones
+		no longer in use in this process and not referred to by any up-to-date snapshot (see
+		`_remove_superseded_text_stores()`). This method deletes them regardless. So call it only when
+		no stories loaded from them are in use - in this process or any other one.
+		"""
+		for file_path in self._text_store_file_paths()[:-1]:
+			print(f"Removing old text store:\n{file_path}")
+			file_path.unlink(missing_ok=True)
+
+	def _text_store_names_of_snapshots(self) -> _t.Set[str]:
+		"""Text stores the up-to-date snapshots (of any loading mode, for the current source) refer to."""
+		unpacked_dir_path = self._unpacked_dir_path
+		newest_source_mtime = self._newest_source_json_mtime()
+		res: _t.Set[str] = set()
+		snapshots_pattern = f"{unpacked_dir_path.name}{self._source_suffix}*{_snapshot_file_suffix}"
+		for file_path in unpacked_dir_path.parent.glob(snapshots_pattern):
+			try:
+				if file_path.stat().st_mtime_ns < newest_source_mtime:
+					continue
+			except OSError:
+				continue
+			text_store_name = _versioned_pickle_header(file_path).get('text_store')
+			if text_store_name is not None:
+				res.add(text_store_name)
+		return res
+
+	def _remove_superseded_text_stores(self, new_store_path: Path):
+		"""
+		Called right after a new generation of text store is written: delete the previous ones,
+		which are no longer in use in this process and no up-to-date snapshot refers to.
+
+		Another process can't be seen from here. On Windows, the store it's reading from can't be deleted
+		(and is kept, then). Elsewhere, the process keeps reading from the store it has already mapped,
+		but it won't be able to open a deleted one anymore.
+		"""
+		in_use = store_paths_in_use()
+		in_use.add(new_store_path.absolute())
+		used_by_snapshots = self._text_store_names_of_snapshots()
+		for file_path in self._text_store_file_paths():
+			if file_path.absolute() in in_use or file_path.name in used_by_snapshots:
+				continue
+			print(f"Removing superseded text store:\n{file_path}")
+			try:
+				file_path.unlink(missing_ok=True)
+			except OSError as e:
+				print(f"Unable to remove text store, it's probably in use: {e}")
+
+	def _loaded_or_built_cache(
+		self, file_path: _t.Optional[Path], print_name: str,
+		load_f: _t.Callable[[Path], _t.Any], build_f: _t.Callable[[], _t.Any],
+	):
+		"""
+		The common routine for all the files derived from the dataset and cached next to the unpacked dir
+		(snapshot, text store, text indexes, near-duplicate signatures).
+
+		The file is loaded with `load_f()` only if it's not older than any source JSON file (or the archive itself,
+		in `read_from_archive` mode). Otherwise - or if `load_f()` fails / returns `None` for a file of an incompatible
+		format - it's rebuilt from the dataset with `build_f()`, which is responsible for saving it, too.
+		"""
+		if file_path is not None and file_path.is_file():
+			if file_path.stat().st_mtime_ns < self._newest_source_json_mtime():
+				print(f"{print_name.capitalize()} is outdated.")
+			else:
+				print(f"Loading {print_name}:\n{file_path}")
+				try:
+					loaded = load_f(file_path)
+				except _cache_load_errors as e:
+					print(f"{print_name.capitalize()} is broken, ignoring it: {e}")
+					loaded = None
+				if loaded is not None:
+					return loaded
+
+		print(f"Building {print_name} (it's done once per dataset version, please wait)...")
+		return build_f()
+
+	def _load_snapshot(self, file_path: Path) -> _t.Optional[_t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]]:
+		"""
+		Load the previously parsed dataset from a binary snapshot. Stories aren't validated again.
+		In `lazy_text` mode, the snapshot records the exact text store its stories refer to.
+		"""
+		loaded = _load_versioned_pickle(file_path, dict(version=_snapshot_format_version), 'dataset snapshot')
+		if loaded is None:
+			return None
+		categories, stories, text_store_name = loaded
+		if text_store_name is not None:
+			text_store_path = file_path.with_name(text_store_name)
+			if not text_store_path.is_file():
+				print(f"Text store for dataset snapshot is missing:\n{text_store_path}")
+				return None
+			self.__text_store_cached = _load_text_store_file(text_store_path)
+		return categories, stories
+
+	def _built_snapshot(self) -> _t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]:
+		"""Parse the dataset from JSON files and save a snapshot of it for the next time."""
+		categories, stories = self._loaded_from_json()
+
+		text_store_name = self.__text_store_cached.path.name if self.lazy_text else None
+		snapshot_path = self._snapshot_file_path
+		print(f"Saving dataset snapshot:\n{snapshot_path}")
+		try:
+			# The text store is in the header, too: to tell which stores are used without loading the snapshot itself.
+			# The same way, the categories of a subset: to tell which of its files are changed on unpacking.
+			header = dict(
+				version=_snapshot_format_version, text_store=text_store_name,
+				categories=None if self.categories is None else list(self.categories),
+			)
+			_dump_versioned_pickle(snapshot_path, header, (categories, stories, text_store_name))
+		except OSError as e:
+			print(f"Unable to save dataset snapshot: {e}")
 		return categories, stories
 
-	def dump_stories_to_category_json(self, category: Category, stories: _t.Dict[str, 'Story']):
+	def _loaded_or_built_index(self, file_path: Path, builder_class, print_name: str):
+		"""
+		Load a text index (of the given builder's class) from file. If there's no file or it's outdated, build the index
+		from all the stories in the source JSON files and save it.
+		"""
+		return self._loaded_or_built_cache(
+			file_path, print_name, builder_class._index_class.load,
+			lambda: self._built_index(file_path, builder_class, print_name),
+		)
+
+	def _built_index(self, file_path: Path, builder_class, print_name: str):
+		builder = builder_class()
+		with _gc_paused():
+			for cat_stories in self._iter_parsed_stories_files(_load_stories_from_file):
+				for story_id, story in cat_stories.items():
+					builder.add(story_id, story.text)
+		print(f"Saving {print_name} for {len(builder)} stories:\n{file_path}")
+		try:
+			return builder.save(file_path)
+		except OSError as e:
+			print(f"Unable to save {print_name}, keeping it in memory: {e}")
+			return builder.build_in_memory()
+
+	def load_text_store(self) -> TextStore:
+		"""
+		All the story texts of the dataset in a compressed, memory-mapped store (see `TextStore`).
+		Any text is read from it by the story ID in O(1), without loading the dataset itself.
+
+		JSON files are converted into it once per dataset version (loading with `lazy_text` writes the same store).
+		The same way as a snapshot, it's converted again if any source JSON file is newer - into a new file,
+		since the old one might still be in use (see `remove_old_text_stores()`). Once loaded, it's cached in this loader.
+		"""
+		store = self.__text_store_cached
+		if store is not None:
+			return store
+
+		# Only the newest generation is ever used for new loads:
+		store = self._loaded_or_built_cache(
+			next(reversed(self._text_store_file_paths()), None), 'text store',
+			_load_text_store_file, self._built_text_store,
+		)
+		self.__text_store_cached = store
+		return store
+
+	def _built_text_store(self) -> TextStore:
+		file_path = self._new_text_store_file_path()
+		print(f"Converting story texts to a text store:\n{file_path}")
+		with _gc_paused(), TextStoreWriter(file_path) as text_writer:
+			for cat_stories in self._iter_parsed_stories_files(_load_stories_from_file):
+				for story_id, story in cat_stories.items():
+					# The same as for stories themselves, the first occurrence is the one that's kept:
+					if story_id not in text_writer:
+						text_writer.add(story.text, story_id)
+				del cat_stories
+		self._remove_superseded_text_stores(file_path)
+		return text_writer.store
+
+	def load_text_index(self) -> TextIndex:
+		"""
+		Full-text index over texts of all the stories in the dataset (see `TextIndex`).
+		It's built once per dataset version and saved next to the unpacked dir. Once loaded, it's cached in this loader.
+		"""
+		if self.__text_index_cached is None:
+			self.__text_index_cached = self._loaded_or_built_index(
+				self._text_index_file_path, TextIndexBuilder, 'full-text index'
+			)
+		return self.__text_index_cached
+
+	def load_trigram_index(self) -> TrigramIndex:
+		"""
+		Trigram index over texts of all the stories in the dataset (see `TrigramIndex`).
+		It's built once per dataset version and saved next to the unpacked dir. Once loaded, it's cached in this loader.
+		"""
+		if self.__trigram_index_cached is None:
+			self.__trigram_index_cached = self._loaded_or_built_index(
+				self._trigram_index_file_path, TrigramIndexBuilder, 'trigram index'
+			)
+		return self.__trigram_index_cached
+
+	def load_minhash_signatures(self) -> _t.Dict[str, bytes]:
+		"""
+		MinHash signatures of all the story texts in the dataset, for near-duplicate detection
+		(see `DataSetDB.without_near_duplicates()`).
+
+		They're computed directly from the source JSON files (in parallel, according to `workers`),
+		once per dataset version. The same way as a snapshot, they're saved next to the unpacked dir
+		and recomputed if any source JSON file is newer. Once loaded, they're cached in this loader.
+		"""
+		signatures = self.__minhash_signatures_cached
+		if signatures is not None:
+			return signatures
+
+		signatures = self._loaded_or_built_cache(
+			self._minhash_file_path, 'near-duplicate signature cache',
+			lambda file_path: _load_versioned_pickle(file_path, self._minhash_file_header(), 'near-duplicate signature cache'),
+			self._built_minhash_signatures,
+		)
+		self.__minhash_signatures_cached = signatures
+		return signatures
+
+	@staticmethod
+	def _minhash_file_header() -> dict:
+		return dict(version=_minhash_format_version, **_minhash_signature_params)
+
+	def _built_minhash_signatures(self) -> _t.Dict[str, bytes]:
+		signatures = dict()
+		for file_signatures in self._iter_parsed_stories_files(_load_minhash_signatures_from_file):
+			for story_id, signature in file_signatures.items():
+				# The same as for stories themselves, the first occurrence is the one that's kept:
+				signatures.setdefault(story_id, signature)
+
+		file_path = self._minhash_file_path
+		print(f"Saving near-duplicate signatures:\n{file_path}")
+		try:
+			_dump_versioned_pickle(file_path, self._minhash_file_header(), signatures)
+		except OSError as e:
+			print(f"Unable to save near-duplicate signatures: {e}")
+		return signatures
+
+	def load_all(self) -> _t.Tuple[_t.Dict[str, Category], _t.Dict[str, Story]]:
+		"""
+		Load both categories and stories.
+
+		With `lazy_text` enabled, stories keep only their metadata in memory.
+		Texts are moved into a sidecar file next to the unpacked dir, and each one is read from there on access.
+
+		If `use_snapshot` is enabled, the parsed dataset is taken from a binary snapshot if it's newer than
+		all the source JSON files. Otherwise, JSONs are parsed and a new snapshot is saved for the next time.
+		Stories from a snapshot aren't validated again: unpickling doesn't call `__init__()`.
+
+		In `read_from_archive` mode, all the JSON files are decompressed right into memory, in a single pass
+		over the archive. Each one is parsed as soon as it's decompressed, in the archive's order,
+		while the following ones are being decompressed.
+		"""
+		with _gc_paused():
+			if self.use_snapshot:
+				return self._loaded_or_built_cache(
+					self._snapshot_file_path, 'dataset snapshot', self._load_snapshot, self._built_snapshot
+				)
+			return self._loaded_from_json()
+
+	def dump_stories_to_category_json(self, category: Category, stories: _t.Mapping[str, 'Story']):
+		if self.read_from_archive:
+			# Writing into the unpacked dataset would mean downloading and unpacking it first - just to be
+			# ignored by this very loader, which reads the archive:
+			raise ValueError(
+				f"Can't dump stories of <{category.category}> category: "
+				"the loader reads the dataset straight from the archive (read_from_archive=True), "
+				"and its stories files can't be overwritten there. Use a loader with read_from_archive=False."
+			)
 		file_path = (self.dataset_dir() / category.json_stories_filename).absolute()
 		stories_data_dict = {
 			k: story.serialize_to_dict() for k, story in stories.items()
@@ -218,6 +1436,8 @@ def dump_stories_to_category_json(self, category: Category, stories: _t.Dict[str
 		# noinspection PyTypeChecker
 		with open(file_path, "w", encoding=_json_encoding) as json_file:
 			json.dump(stories_data_dict, json_file)
+		# The file's mtime alone would do, but explicit removal doesn't rely on filesystem timestamp precision:
+		self.remove_snapshot()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+# encoding: utf-8
+"""
+Compiled keyword groups: the argument of `DataSetDB` keyword-group filters and sorts, parsed once and reused.
+"""
+
+import typing as _t
+
+from weakref import WeakKeyDictionary
+
+from ._story_index import StoryIndex, bit_sliced_counter
+
+_Weight = _t.Union[int, float]
+
+
+def _keyword_group_names(keyword_synonym_groups: _t.Iterable[_t.Iterable[str]]) -> _t.Dict[str, str]:
+	"""Map each keyword to its group name (the first keyword in group)."""
+	group_name_by_keyword: _t.Dict[str, str] = dict()  # kw -> kw_group
+	for kw_group_iter in keyword_synonym_groups:
+		if isinstance(kw_group_iter, str):
+			kw_group_iter = [kw_group_iter]
+		kw_group_iter = list(kw_group_iter)
+		group_name = kw_group_iter[0]
+		for kw in kw_group_iter:
+			group_name_by_keyword[kw] = group_name
+	return group_name_by_keyword
+
+
+class KeywordGroups:
+	"""
+	Groups of synonymous keywords (optionally, with a weight for each group), compiled once:
+	each keyword is mapped to an integer group ID.
+
+	Pass it to any of `DataSetDB` keyword-group methods (`keyword_hits_min()`, `keyword_weights_min()`,
+	`sorted_by_max_keywords_weight()`, etc.) instead of the raw groups/weights.
+	Then, per-story scores are computed only once for all the DBs sharing the same story set, and all the following
+	filters and sorts by the same groups just reuse them.
+
+	Built from the same arguments as these methods accept: either an iterable of groups (each one is an iterable
+	of keywords or a single keyword), or a dict with groups as keys and weights as values.
+	A group is named after its first keyword. A keyword belongs only to one group (the last one it's listed in).
+	"""
+
+	def __init__(
+		self, keyword_synonym_groups: _t.Union[_t.Iterable[_t.Iterable[str]], _t.Dict[_t.Iterable[str], _Weight]]
+	):
+		group_weights: _t.Optional[_t.Dict[str, _Weight]] = None  # kw_group -> weight
+		if isinstance(keyword_synonym_groups, dict):
+			group_weights = dict()
+			for kw_group_iter, weight in keyword_synonym_groups.items():
+				if isinstance(kw_group_iter, str):
+					kw_group_iter = [kw_group_iter]
+				group_weights[tuple(kw_group_iter)[0]] = weight
+			keyword_synonym_groups = keyword_synonym_groups.keys()
+
+		keywords_by_group: _t.Dict[str, _t.List[str]] = dict()
+		for kw, group_name in _keyword_group_names(keyword_synonym_groups).items():
+			keywords_by_group.setdefault(group_name, list()).append(kw)
+
+		self.group_names: _t.Tuple[str, ...] = tuple(keywords_by_group.keys())
+		self.keywords: _t.Tuple[_t.Tuple[str, ...], ...] = tuple(map(tuple, keywords_by_group.values()))
+		self.group_id_by_keyword: _t.Dict[str, int] = {
+			kw: group_id for group_id, group_keywords in enumerate(self.keywords) for kw in group_keywords
+		}
+		self.weights: _t.Optional[_t.Tuple[_Weight, ...]] = None
+		if group_weights is not None:
+			self.weights = tuple(group_weights[x] for x in self.group_names)
+
+		# Index -> score kind -> (number of stories in the index, scores):
+		self.__scores_cache: WeakKeyDictionary = WeakKeyDictionary()
+
+	def __repr__(self):
+		weights = self.weights
+		if weights is None:
+			return f"{self.__class__.__name__}({list(self.keywords)!r})"
+		return f"{self.__class__.__name__}({dict(zip(self.keywords, weights))!r})"
+
+	def __len__(self):
+		return len(self.keywords)
+
+	@property
+	def is_weighted(self) -> bool:
+		return self.weights is not None
+
+	def _memoized(self, index: StoryIndex, kind: str, compute_f: _t.Callable[[], _t.Any]):
+		"""
+		Scores are computed for all the stories in the index. New stories are registered in it only when
+		a DB with them is filtered/sorted, so the scores are recomputed only then.
+		"""
+		index_scores: _t.Dict[str, _t.Tuple[int, _t.Any]] = self.__scores_cache.setdefault(index, dict())
+		n_stories = len(index)
+		cached = index_scores.get(kind)
+		if cached is not None and cached[0] == n_stories:
+			return cached[1]
+		scores = compute_f()
+		index_scores[kind] = (n_stories, scores)
+		return scores
+
+	def hit_counts(self, index: StoryIndex) -> _t.Sequence[int]:
+		"""For each story in the index (by ordinal), the number of groups it hits."""
+		return self._memoized(index, 'hits', lambda: index.keyword_groups_matrix(self.keywords).hit_counts())
+
+	def hits_counter(self, index: StoryIndex) -> _t.List[int]:
+		"""The same hit counts, as a bit-sliced counter (see `bit_sliced_counter()`)."""
+		return self._memoized(index, 'hits_counter', lambda: bit_sliced_counter(
+			index.any_keyword_bits(group_keywords) for group_keywords in self.keywords
+		))
+
+	def weighted_sums(self, index: StoryIndex) -> _t.Sequence[_Weight]:
+		"""For each story in the index (by ordinal), the sum of weights of the groups it hits."""
+		weights = self.weights
+		if weights is None:
+			raise ValueError(f"Keyword groups have no weights: {self!r}")
+		return self._memoized(index, 'weights', lambda: index.keyword_groups_matrix(self.keywords).weighted_sums(weights))
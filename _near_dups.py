@@ -0,0 +1,150 @@
+# encoding: utf-8
+"""
+Detection of near-duplicate story texts (reposts, re-uploads, copies under a different ID).
+
+Each text is turned into a MinHash signature: a fixed-size sketch, such that the share of equal items in
+two signatures estimates Jaccard similarity of the texts (as sets of word 5-grams, aka shingles).
+The signature is computed in a single pass over the shingles, with one-permutation hashing: shingle hashes are
+distributed into bins, and the minimum of each bin becomes a signature item. Empty bins borrow
+the value of the next non-empty one, which keeps the estimate unbiased for short texts.
+
+Then, locality-sensitive hashing (LSH) groups the stories: signatures are split into bands, and only the stories
+with a fully equal band become candidates for comparison. So the work grows linearly with the number of stories,
+instead of comparing each pair.
+"""
+
+import typing as _t
+
+from array import array
+from itertools import islice
+from operator import eq
+from zlib import crc32
+
+from ._text_index import text_terms
+
+try:
+	import numpy as _np
+except ImportError:
+	_np = None
+
+_shingle_words = 5
+_signature_size = 128  # must be a power of 2
+_bin_bits = _signature_size.bit_length() - 1
+_value_bits = 32 - _bin_bits
+_value_mask = (1 << _value_bits) - 1
+_empty_bin = 0xFFFFFFFF
+
+# Stored with the cached signatures: if any of these change, the cache is outdated.
+signature_params = dict(shingle_words=_shingle_words, signature_size=_signature_size, hash='crc32')
+
+
+def _shingle_hashes(text: str) -> _t.Set[int]:
+	words = text_terms(text)
+	if len(words) < _shingle_words:
+		shingles = [' '.join(words)] if words else []
+	else:
+		shingles = map(' '.join, zip(*(islice(words, i, None) for i in range(_shingle_words))))
+	return set(map(crc32, map(str.encode, shingles)))
+
+
+def minhash_signature(text: str) -> bytes:
+	"""MinHash signature of the text, as raw bytes of 32-bit items (the same on any machine with the same byte order)."""
+	hashes = _shingle_hashes(text)
+	if not hashes:
+		return b'\xff' * (_signature_size * 4)
+
+	# The highest bits of a hash select a bin, the rest is the value:
+	if _np is not None:
+		hashes = _np.fromiter(hashes, dtype=_np.uint32, count=len(hashes))
+		mins = _np.full(_signature_size, _empty_bin, dtype=_np.uint32)
+		_np.minimum.at(mins, hashes >> _value_bits, hashes & _value_mask)
+		mins = mins.tolist()
+	else:
+		mins = [_empty_bin] * _signature_size
+		for h in hashes:
+			i = h >> _value_bits
+			value = h & _value_mask
+			if value < mins[i]:
+				mins[i] = value
+
+	if _empty_bin in mins:
+		# Densification by rotation: an empty bin takes the value of the next non-empty one,
+		# shifted by the distance to it (so that the borrowed values don't collide with the original ones).
+		signature = list(mins)
+		for i, value in enumerate(mins):
+			if value != _empty_bin:
+				continue
+			distance = 1
+			while mins[(i + distance) % _signature_size] == _empty_bin:
+				distance += 1
+			signature[i] = mins[(i + distance) % _signature_size] + (distance << _value_bits)
+		mins = signature
+
+	return array('I', mins).tobytes()
+
+
+def signatures_from_story_dicts(raw_json_data: _t.Dict[str, dict]) -> _t.Dict[str, bytes]:
+	"""Signatures of stories in raw (JSON) form, without building the `Story` objects."""
+	return {
+		story_id: minhash_signature(story_dict.get('text', ''))
+		for story_id, story_dict in raw_json_data.items()
+	}
+
+
+def similarity(signature1: bytes, signature2: bytes) -> float:
+	"""Estimated Jaccard similarity of the texts with the given signatures."""
+	items1 = memoryview(signature1).cast('I')
+	items2 = memoryview(signature2).cast('I')
+	return sum(map(eq, items1, items2)) / _signature_size
+
+
+def _lsh_band_rows(threshold: float) -> int:
+	"""
+	Band size for the given similarity threshold. A pair of texts becomes a candidate with the probability
+	of `1 - (1 - s^rows)^bands`, which rises sharply around `s = (1 / bands)^(1 / rows)`.
+	The biggest band with this point below the threshold is chosen: to miss as few duplicates as possible,
+	while still keeping the number of candidates low.
+	"""
+	rows = 1
+	while rows < _signature_size:
+		next_rows = rows * 2
+		bands = _signature_size // next_rows
+		if (1.0 / bands) ** (1.0 / next_rows) > threshold:
+			break
+		rows = next_rows
+	return rows
+
+
+def near_duplicate_representatives(signatures: _t.List[bytes], threshold: float = 0.8) -> _t.List[int]:
+	"""
+	For each signature, the position of the signature representing its group of near-duplicates:
+	the first one in the list. Within a group, each text has the estimated similarity of AT LEAST the threshold
+	to some other one (so a group might contain a chain of gradually changing texts).
+	"""
+	n = len(signatures)
+	parents = list(range(n))
+
+	def root(i: int) -> int:
+		while parents[i] != i:
+			parents[i] = parents[parents[i]]
+			i = parents[i]
+		return i
+
+	band_size = _lsh_band_rows(threshold) * 4
+	for band_start in range(0, _signature_size * 4, band_size):
+		band_end = band_start + band_size
+		first_by_band: _t.Dict[bytes, int] = dict()
+		for i, signature in enumerate(signatures):
+			first = first_by_band.setdefault(signature[band_start:band_end], i)
+			if first == i:
+				continue
+			# Each story is compared only to the first one with the same band, not to each of them:
+			root_first, root_i = root(first), root(i)
+			if root_first != root_i and similarity(signatures[first], signature) >= threshold:
+				# The earliest story always stays the root:
+				if root_first < root_i:
+					parents[root_i] = root_first
+				else:
+					parents[root_first] = root_i
+
+	return [root(i) for i in range(n)]
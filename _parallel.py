@@ -0,0 +1,57 @@
+# encoding: utf-8
+"""
+Helpers to process batches of stories (texts) in a process pool.
+"""
+
+import typing as _t
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from math import ceil
+from os import cpu_count
+
+_T = _t.TypeVar('_T')
+_R = _t.TypeVar('_R')
+
+# Fewer items than that are processed right in the main process: starting a pool would take longer.
+_parallel_min_items = 64
+
+
+def workers_number(workers: _t.Optional[int]) -> int:
+	"""`0` or less (or `None`) means "as many as CPU cores"."""
+	if workers is None or workers < 1:
+		return cpu_count() or 1
+	return workers
+
+
+def map_in_workers(
+	func: _t.Callable[..., _R], *item_lists: _t.List[_t.Any], workers: _t.Optional[int] = 1
+) -> _t.List[_R]:
+	"""
+	The same as `map()`, but in a process pool: one task per item (from each of the lists, like `map()` does),
+	and the results in the same order. For a few big items, each one worth a task of its own.
+	The function has to be picklable: a module-level one (or `functools.partial` of it).
+	"""
+	workers = min(workers_number(workers), min(map(len, item_lists)))
+	if workers <= 1:
+		return list(map(func, *item_lists))
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		return list(executor.map(func, *item_lists))
+
+
+def map_batches_in_workers(
+	batch_f: _t.Callable[[_t.List[_T]], _t.List[_R]], items: _t.List[_T], workers: _t.Optional[int] = 1
+) -> _t.List[_R]:
+	"""
+	Call the batch function for chunks of items in a process pool, and join the results (in the same order).
+	The function has to be picklable: a module-level one (or `functools.partial` of it).
+	"""
+	workers = workers_number(workers)
+	if workers == 1 or len(items) < _parallel_min_items:
+		return batch_f(items)
+	# Several chunks per worker, to even out the load:
+	chunk_size = max(1, ceil(len(items) / (workers * 4)))
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		return list(chain.from_iterable(executor.map(
+			batch_f, (items[i:i + chunk_size] for i in range(0, len(items), chunk_size))
+		)))
@@ -0,0 +1,238 @@
+# encoding: utf-8
+"""
+Steps of filtering/sorting performed on `DataSetDB`, and the engine executing a sequence of them.
+
+An eager DB executes each step right away, as a plan of a single step.
+A lazy one accumulates the steps and executes the whole plan at once, when the stories are actually needed.
+This way, a chain of filters makes a single pass over the stories instead of building a new selection at each step.
+
+The stories are processed as arrays of their ordinals in the index, and the result is a `StoriesView`.
+"""
+
+import typing as _t
+
+from array import array
+from attrs import define, field
+from itertools import compress, groupby
+from operator import not_
+
+from ._data_objects import Story
+from ._story_index import (
+	StoriesView, StoryIndex, bits_from_ordinals, ordinals_array, ordinals_from_bits, sorted_positions, top_positions,
+)
+
+# Relative cost of different kinds of filters. Within a plan, cheaper ones are executed first,
+# so the more expensive ones are evaluated only for the stories left after them.
+cost_keyword_bits = 0  # bitset algebra on inverted index
+cost_column_bits = 1  # (vectorized) range check on numeric column
+cost_text_index_bits = 1  # lookup of stories pre-selected with the full-text index
+cost_predicate = 2  # python function called for each story
+cost_text_scan = 3  # reading through the texts of (pre-selected) stories
+
+
+@define(frozen=True, eq=False)
+class FilterStep:
+	"""
+	Keep only the matching stories. Exactly one of the functions is expected:
+	- `ok_f`: called for each story;
+	- `bits_f`: receives the index and the bitset of the current stories, returns a bitset of the matching ones.
+	"""
+	ok_f: _t.Optional[_t.Callable[[Story], bool]] = field(default=None)
+	bits_f: _t.Optional[_t.Callable[[StoryIndex, int], int]] = field(default=None)
+	cost: int = field(default=cost_predicate)
+
+
+@define(frozen=True, eq=False)
+class SortStep:
+	"""
+	Stable sort of the stories. Exactly one of the functions is expected:
+	- `key_f`: called for each story;
+	- `keys_f`: receives the index and the story ordinals, returns sorting keys for all of them at once.
+	"""
+	key_f: _t.Optional[_t.Callable[[Story], _t.Any]] = field(default=None)
+	keys_f: _t.Optional[_t.Callable[[StoryIndex, _t.List[int]], _t.Sequence]] = field(default=None)
+	reverse: bool = field(default=False)
+
+	def sorted_ordinals(self, ordinals: array, index: StoryIndex, limit: _t.Optional[int] = None) -> array:
+		"""
+		With `limit`, only this many first stories are kept, and they're selected without sorting the rest.
+		Either way, the key is evaluated only once per story.
+		"""
+		if self.keys_f is None:
+			keys = list(map(self.key_f, map(index.story, ordinals)))
+		else:
+			keys = self.keys_f(index, ordinals)
+		if limit is None:
+			positions = sorted_positions(keys, reverse=self.reverse)
+		else:
+			positions = top_positions(keys, limit, reverse=self.reverse)
+		return ordinals_array(map(ordinals.__getitem__, positions))
+
+
+@define(frozen=True, eq=False)
+class ExtractStep:
+	"""
+	Move the matching stories from the main pool to `broken_stories`.
+
+	Unlike filters, it has a side effect, so it can't be reordered: it acts as a barrier,
+	and all the steps before it are executed before it.
+	"""
+	# Receives all the stories at once, returns a flag for each one:
+	are_extracted_f: _t.Callable[[_t.List[Story]], _t.Iterable[bool]] = field()
+
+
+@define(frozen=True, eq=False)
+class SelectStep:
+	"""
+	Keep only some of the stories, chosen by looking at all of them at once (and their order),
+	rather than at each story separately. The function receives the stories, returns a flag for each one.
+
+	Its result depends on what's selected before it, so it can't be reordered: it acts as a barrier, too.
+	"""
+	are_selected_f: _t.Callable[[StoriesView], _t.Iterable[bool]] = field()
+
+
+@define(frozen=True, eq=False)
+class LimitStep:
+	"""
+	Keep only the first `n` stories (negative: all but the last `-n`).
+
+	It depends on the order and on what's selected before it, so it's a barrier. But if it follows a sort,
+	both are executed together, as a partial sort: only the first stories are selected.
+	"""
+	n: int = field()
+
+	def resolved(self, n_stories: int) -> int:
+		return self.n if self.n >= 0 else max(0, n_stories + self.n)
+
+
+PlanStep = _t.Union[FilterStep, SortStep, ExtractStep, SelectStep, LimitStep]
+
+
+def _filtered_bits(
+	ordinals: array, index: StoryIndex, bits_filters: _t.List[_t.Callable[[StoryIndex, int], int]]
+) -> array:
+	full_bits = bits_from_ordinals(ordinals)
+	bits = full_bits
+	for bits_f in bits_filters:
+		if not bits:
+			break
+		bits &= bits_f(index, bits)
+	if bits == full_bits:
+		return ordinals
+	kept_ordinals = set(ordinals_from_bits(bits))
+	return ordinals_array(compress(ordinals, map(kept_ordinals.__contains__, ordinals)))
+
+
+def _filtered_ok(ordinals: array, index: StoryIndex, ok_filters: _t.List[_t.Callable[[Story], bool]]) -> array:
+	story_f = index.story
+	if len(ok_filters) == 1:
+		ok_f = ok_filters[0]
+		return ordinals_array(x for x in ordinals if ok_f(story_f(x)))
+	return ordinals_array(
+		x for x in ordinals
+		if all(ok_f(story_f(x)) for ok_f in ok_filters)
+	)
+
+
+def _filtered(ordinals: array, index: StoryIndex, filters: _t.List[FilterStep]) -> array:
+	"""
+	All the given filters fused together, cheapest first.
+	Consecutive (by cost) filters of the same kind are executed as a single pass.
+	"""
+	filters = sorted(filters, key=lambda x: x.cost)  # stable: steps of the same cost keep their order
+	for is_bits, same_kind_filters in groupby(filters, key=lambda x: x.bits_f is not None):
+		if not ordinals:
+			break
+		if is_bits:
+			ordinals = _filtered_bits(ordinals, index, [x.bits_f for x in same_kind_filters])
+		else:
+			ordinals = _filtered_ok(ordinals, index, [x.ok_f for x in same_kind_filters])
+	return ordinals
+
+
+def _executed_stage(
+	ordinals: array, index: StoryIndex, steps: _t.List[_t.Union[FilterStep, SortStep]],
+	limit: _t.Optional[LimitStep] = None,
+) -> array:
+	"""
+	A sequence of filters and sorts, without barriers, optionally followed by a limit.
+	All the sorts are stable and depend on the story only, so filtering before sorting gives the same result
+	as the other way around. Thus, all the filters are executed first, as a single fused step.
+	The limit is applied by the last sort (if there's any).
+	"""
+	filters = [x for x in steps if isinstance(x, FilterStep)]
+	if filters:
+		ordinals = _filtered(ordinals, index, filters)
+	n_limit = None if limit is None else limit.resolved(len(ordinals))
+	sorts = [x for x in steps if isinstance(x, SortStep)]
+	for i, step in enumerate(sorts, start=1):
+		ordinals = step.sorted_ordinals(ordinals, index, limit=n_limit if i == len(sorts) else None)
+	if n_limit is not None and n_limit < len(ordinals):
+		ordinals = ordinals[:n_limit]
+	return ordinals
+
+
+def _merged_by_id(index: StoryIndex, ordinals: array, added_ordinals: array) -> array:
+	"""
+	Append the stories to the others, the way `dict.update()` does: a story with an already present ID
+	replaces that one, in its position.
+	"""
+	merged = dict(zip(map(index.story_id, ordinals), ordinals))
+	merged.update(zip(map(index.story_id, added_ordinals), added_ordinals))
+	return ordinals_array(merged.values())
+
+
+def split_trailing_sorts(
+	plan: _t.Sequence[PlanStep]
+) -> _t.Tuple[_t.Tuple[PlanStep, ...], _t.Tuple[SortStep, ...]]:
+	"""
+	Split the plan in two: the sorts of its last stage (after the last barrier) and all the other steps.
+	Executing the former after the latter gives the same result as the whole plan,
+	since filters don't depend on the order. This way, the sorts can be combined with a limit added later.
+	"""
+	n_head = len(plan)
+	while n_head and not isinstance(plan[n_head - 1], (ExtractStep, SelectStep, LimitStep)):
+		n_head -= 1
+	last_stage = plan[n_head:]
+	head = tuple(plan[:n_head]) + tuple(x for x in last_stage if not isinstance(x, SortStep))
+	return head, tuple(x for x in last_stage if isinstance(x, SortStep))
+
+
+def execute_plan(
+	stories: StoriesView, broken_stories: StoriesView, plan: _t.Iterable[PlanStep]
+) -> _t.Tuple[StoriesView, StoriesView]:
+	"""
+	Execute the given steps over the stories (both views are expected to be over the same index).
+	Returns new `stories` and `broken_stories` views (or the same ones, if they're unchanged).
+	"""
+	index = stories.index
+	ordinals, broken_ordinals = stories.ordinals, broken_stories.ordinals
+	stage: _t.List[_t.Union[FilterStep, SortStep]] = list()
+	for step in plan:
+		if not isinstance(step, (ExtractStep, SelectStep, LimitStep)):
+			stage.append(step)
+			continue
+
+		if isinstance(step, LimitStep):
+			ordinals = _executed_stage(ordinals, index, stage, limit=step)
+			stage = list()
+			continue
+		ordinals = _executed_stage(ordinals, index, stage)
+		stage = list()
+		if isinstance(step, SelectStep):
+			flags = list(step.are_selected_f(StoriesView(index, ordinals)))
+			ordinals = ordinals_array(compress(ordinals, flags))
+			continue
+
+		flags = list(step.are_extracted_f(list(map(index.story, ordinals))))
+		if any(flags):
+			broken_ordinals = _merged_by_id(index, broken_ordinals, ordinals_array(compress(ordinals, flags)))
+			ordinals = ordinals_array(compress(ordinals, map(not_, flags)))
+
+	ordinals = _executed_stage(ordinals, index, stage)
+	if ordinals is not stories.ordinals:
+		stories = StoriesView(index, ordinals)
+	if broken_ordinals is not broken_stories.ordinals:
+		broken_stories = StoriesView(index, broken_ordinals)
+	return stories, broken_stories
@@ -0,0 +1,716 @@
+# encoding: utf-8
+"""
+Index over stories, shared between a `DataSetDB` and all the DBs derived from it by filtering/sorting.
+
+Each story gets a persistent integer ordinal within the index, and any SET of stories is represented
+as a bitset: a python `int` with the bit at story's ordinal raised. Big-int bitwise operators are implemented in C
+and process 30 bits per machine operation, so set algebra over the entire dataset is nearly instant.
+
+Numeric story attributes are also kept as contiguous typed columns. If `numpy` is installed, range filters and sorting
+over them are vectorized. Otherwise, a pure-python fallback is used (still, without per-story attribute access).
+
+Keyword groups (see `DataSetDB.keyword_weights_min()`) are turned into a sparse incidence matrix,
+so hit counts and weighted scores of all the stories are computed at once.
+
+Stories per value of keywords, author and category are counted within any set of stories (e.g., for `keyword_hits`)
+as bitset intersections with the set and their popcounts, without going through the stories themselves.
+
+The index is also the only store of the stories themselves: a filtered/sorted DB keeps just a `StoriesView` -
+an array of ordinals (in the DB's order), exposed as a `{story_id: story}` mapping.
+"""
+
+import typing as _t
+
+from array import array
+from collections import Counter, deque
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from functools import partial
+import heapq
+from itertools import accumulate, chain, compress, islice, repeat
+from operator import attrgetter, is_, lt
+
+from ._data_objects import Story
+
+try:
+	import numpy as _np
+except ImportError:
+	_np = None
+
+# Story attribute -> `array` typecode:
+_numeric_columns: _t.Dict[str, str] = {
+	'rating': 'd',
+	'page_count': 'q',
+	'word_count': 'q',
+}
+
+
+# Single-valued story attributes with an inverted index (value -> stories), to count stories per value:
+_counted_attrs = ('author', 'category')
+
+# When stories are counted per value within a set, frequent values are counted as popcount of the bitsets intersection,
+# and the rest - by looking up each of their stories in the set. Frequent ones have at least 1/N of all the stories:
+_popcount_min_share = 64
+
+# Ordinals of a view are stored in a compact array, 4 bytes per story:
+_ordinals_typecode = 'I'
+
+# Top-N selection with a heap is used only when N is less than this share of all the keys:
+_max_heap_selection_share = 4
+
+# Keyword-group matrices are cached per group set. A few of them are enough to keep all the ones in use:
+_max_cached_matrices = 16
+
+_flags_to_digits = bytes.maketrans(b'\x00\x01', b'01')
+_digits_to_flags = bytes.maketrans(b'01', b'\x00\x01')
+
+# The conversions between bitsets and ordinals are done through a string of binary digits (one byte per story).
+# It's more memory than the bitset itself, but all the loops happen in C, without python-level iteration per story.
+
+
+def bits_from_ordinals(ordinals: _t.Iterable[int]) -> int:
+	"""Build a bitset from story ordinals."""
+	ordinals = ordinals if isinstance(ordinals, (list, tuple, array, range)) else list(ordinals)
+	if not ordinals:
+		return 0
+	flags = bytearray(max(ordinals) + 1)
+	deque(map(flags.__setitem__, ordinals, repeat(1)), maxlen=0)
+	# Binary digits are parsed by `int()` in linear time, and the most significant digit goes first:
+	return int(flags.translate(_flags_to_digits)[::-1], 2)
+
+
+def _flags_from_bits(bits: int) -> bytes:
+	"""One byte (0 or 1) per bit, up to the highest raised one."""
+	if bits <= 0:
+		return b''
+	# Reversed binary string has N-th character matching N-th bit:
+	return bin(bits)[:1:-1].encode('ascii').translate(_digits_to_flags)
+
+
+def _bits_count_fallback(bits: int) -> int:
+	return bin(bits).count('1')
+
+
+# Number of the raised bits (i.e., stories in the bitset). `int.bit_count()` is only there since python 3.10:
+_bits_count: _t.Callable[[int], int] = getattr(int, 'bit_count', _bits_count_fallback)
+
+
+def ordinals_from_bits(bits: int) -> _t.List[int]:
+	"""Story ordinals of all the raised bits, ascending."""
+	flags = _flags_from_bits(bits)
+	return list(compress(range(len(flags)), flags))
+
+
+def ordinals_array(ordinals: _t.Iterable[int]) -> array:
+	"""Story ordinals, in a compact array (the given one is returned as is, if it's already such)."""
+	if isinstance(ordinals, array) and ordinals.typecode == _ordinals_typecode:
+		return ordinals
+	return array(_ordinals_typecode, ordinals)
+
+
+def _bits_from_bool_mask(mask) -> int:
+	"""Bitset from a numpy boolean array."""
+	return int.from_bytes(_np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def sorted_positions(keys: _t.Sequence, reverse=False) -> _t.List[int]:
+	"""
+	Stable sorting permutation: positions of the given keys, in the order they'd be after `sorted(keys, reverse=...)`.
+	Numpy arrays are sorted with vectorized `argsort()`.
+	"""
+	if _np is not None and isinstance(keys, _np.ndarray):
+		if not reverse:
+			return _np.argsort(keys, kind='stable').tolist()
+		# Python's reversed sort is still stable (keeps the original order for equal keys), and so should be we.
+		# Sorting a reversed array and then reversing the result does exactly that:
+		n = len(keys)
+		return (n - 1 - _np.argsort(keys[::-1], kind='stable')[::-1]).tolist()
+	return sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+
+
+def top_positions(keys: _t.Sequence, n: int, reverse=False) -> _t.List[int]:
+	"""
+	The first `n` items of `sorted_positions()`, without sorting all the keys: O(len * log(n)).
+	Stories with equal keys keep their order, the same way they would with the full sort.
+	"""
+	n_keys = len(keys)
+	if n >= n_keys:
+		return sorted_positions(keys, reverse=reverse)
+	if n <= 0:
+		return []
+	if _np is not None and isinstance(keys, _np.ndarray):
+		# Partition finds the key at the boundary in linear time. Everything better than it is selected,
+		# and so are the ones equal to it - to choose between them by position, with a stable sort:
+		boundary_i = n_keys - n if reverse else n - 1
+		boundary_key = _np.partition(keys, boundary_i)[boundary_i]
+		candidates = _np.flatnonzero(keys >= boundary_key if reverse else keys <= boundary_key)
+		return candidates[sorted_positions(keys[candidates], reverse=reverse)[:n]].tolist()
+	if n * _max_heap_selection_share >= n_keys:
+		# Heap operations are python-level, so selecting most of the keys with them is slower than the full sort:
+		return sorted_positions(keys, reverse=reverse)[:n]
+	# Documented to be equivalent to `sorted(...)[:n]`, including the order of equal items:
+	select_f = heapq.nlargest if reverse else heapq.nsmallest
+	return select_f(n, range(n_keys), key=keys.__getitem__)
+
+
+def bit_sliced_counter(bitsets: _t.Iterable[int]) -> _t.List[int]:
+	"""
+	For the given bitsets, count how many of them have each bit raised.
+	The result is a bit-sliced counter: a list of "bit planes", where N-th bitset contains N-th bit of each count.
+	"""
+	planes: _t.List[int] = list()
+	for carry in bitsets:
+		for i, plane in enumerate(planes):
+			if not carry:
+				break
+			planes[i], carry = plane ^ carry, plane & carry
+		if carry:
+			planes.append(carry)
+	return planes
+
+
+def counter_at_least(planes: _t.List[int], n: int, full_bits: int) -> int:
+	"""From a bit-sliced counter, select bits (within `full_bits`) with the count of AT LEAST `n`."""
+	if n <= 0:
+		return full_bits
+	if n.bit_length() > len(planes):
+		return 0
+	greater = 0
+	equal = full_bits
+	for i in reversed(range(len(planes))):
+		plane = planes[i]
+		if (n >> i) & 1:
+			equal &= plane
+		else:
+			greater |= equal & plane
+			equal &= ~plane
+	return greater | equal
+
+
+class KeywordGroupsMatrix:
+	"""
+	Sparse incidence matrix: stories (by ordinal) × keyword groups, with each story/group pair present at most once.
+
+	It's stored group by group, in a compressed form (CSC): story ordinals of all the groups concatenated,
+	and the boundaries of each group within them. That's how it's built from the inverted index,
+	and the per-story sums don't need any particular order of entries anyway.
+	Then, hit counts or weighted scores of all the stories are a single sparse product, vectorized with `numpy`.
+	"""
+
+	def __init__(self, n_stories: int, ordinals_by_group: _t.List[_t.List[int]]):
+		self.n_stories = n_stories
+		self.n_groups = len(ordinals_by_group)
+		# `group_ends[i]` is where the ordinals of i-th group end:
+		self.group_ends = array('q', accumulate(map(len, ordinals_by_group)))
+		self.ordinals = array('q')
+		for group_ordinals in ordinals_by_group:
+			self.ordinals.extend(group_ordinals)
+
+	def hit_counts(self) -> _t.Sequence[int]:
+		"""For each story (by ordinal), the number of groups it hits."""
+		if _np is not None:
+			return _np.bincount(_np.frombuffer(self.ordinals, dtype=_np.int64), minlength=self.n_stories)
+		counts = [0] * self.n_stories
+		for ordinal in self.ordinals:
+			counts[ordinal] += 1
+		return counts
+
+	def weighted_sums(self, weights: _t.Sequence[_t.Union[int, float]]) -> _t.Sequence[_t.Union[int, float]]:
+		"""For each story (by ordinal), the sum of weights of the groups it hits. One weight per group is expected."""
+		if _np is not None:
+			group_sizes = _np.diff(_np.frombuffer(self.group_ends, dtype=_np.int64), prepend=0)
+			entry_weights = _np.repeat(_np.asarray(weights, dtype=_np.float64), group_sizes)
+			return _np.bincount(
+				_np.frombuffer(self.ordinals, dtype=_np.int64), weights=entry_weights, minlength=self.n_stories
+			)
+		sums = [0] * self.n_stories
+		ordinals = self.ordinals
+		start = 0
+		for end, weight in zip(self.group_ends, weights):
+			for ordinal in ordinals[start:end]:
+				sums[ordinal] += weight
+			start = end
+		return sums
+
+
+def values_at(values: _t.Sequence, ordinals: _t.List[int]) -> _t.Sequence:
+	"""Per-story values (a list or numpy array, indexed by ordinal) for the given stories."""
+	if _np is not None and isinstance(values, _np.ndarray):
+		return values[_np.asarray(ordinals, dtype=_np.int64)]
+	return [values[i] for i in ordinals]
+
+
+def values_range_bits(
+	values: _t.Sequence, min: _t.Union[int, float, None] = None, max: _t.Union[int, float, None] = None
+) -> int:
+	"""Stories (by ordinal) with their value in the range (both ends inclusive, `None` for unlimited)."""
+	if _np is not None and isinstance(values, _np.ndarray):
+		mask = _np.ones(len(values), dtype=bool)
+		if min is not None:
+			mask &= values >= min
+		if max is not None:
+			mask &= values <= max
+		return _bits_from_bool_mask(mask)
+	return bits_from_ordinals([
+		i for i, x in enumerate(values)
+		if (min is None or min <= x) and (max is None or x <= max)
+	])
+
+
+class StoryIndex:
+	"""
+	Ordinals of stories and keyword->stories inverted index.
+
+	Stories are registered lazily, whenever some DB using this index needs them.
+	A story is identified by its key in DB and the object itself: if it's replaced with another object,
+	the new one is registered under a new ordinal.
+
+	The index assumes story keywords, author, category and numeric attributes (rating, page/word count)
+	aren't modified in place.
+	"""
+
+	def __init__(self):
+		self._stories: _t.List[Story] = list()
+		self._ids: _t.List[str] = list()
+		# The latest ordinal for each ID. Earlier ones are kept by views created before the story was replaced:
+		self._ordinal_by_id: _t.Dict[str, int] = dict()
+		self._replaced_ids: _t.Set[str] = set()
+		self._ordinals_by_keyword: _t.Dict[str, array] = dict()
+		self._bits_by_keyword: _t.Dict[str, int] = dict()
+		self._n_keyword_ordinals = 0
+		# The same, for the other attributes stories are counted by:
+		self._ordinals_by_value: _t.Dict[str, _t.Dict[str, array]] = {attr_name: dict() for attr_name in _counted_attrs}
+		self._bits_by_value: _t.Dict[str, _t.Dict[str, int]] = {attr_name: dict() for attr_name in _counted_attrs}
+		self._columns: _t.Dict[str, array] = {
+			attr_name: array(typecode) for attr_name, typecode in _numeric_columns.items()
+		}
+		self._keyword_group_matrices: _t.Dict[_t.Tuple[_t.Tuple[str, ...], ...], KeywordGroupsMatrix] = dict()
+
+	def __len__(self):
+		return len(self._stories)
+
+	def story(self, ordinal: int) -> Story:
+		return self._stories[ordinal]
+
+	def story_id(self, ordinal: int) -> str:
+		return self._ids[ordinal]
+
+	def _register(self, story_id: str, story: Story) -> int:
+		ordinal = len(self._stories)
+		self._stories.append(story)
+		self._ids.append(story_id)
+		if story_id in self._ordinal_by_id:
+			self._replaced_ids.add(story_id)
+		self._ordinal_by_id[story_id] = ordinal
+		ordinals_by_keyword = self._ordinals_by_keyword
+		bits_by_keyword = self._bits_by_keyword
+		for kw in story.keywords:
+			kw_ordinals = ordinals_by_keyword.get(kw)
+			if kw_ordinals is None:
+				ordinals_by_keyword[kw] = kw_ordinals = array('L')
+			kw_ordinals.append(ordinal)
+			bits_by_keyword.pop(kw, None)
+		self._n_keyword_ordinals += len(story.keywords)
+		for attr_name in _counted_attrs:
+			value = getattr(story, attr_name)
+			value_ordinals = self._ordinals_by_value[attr_name].get(value)
+			if value_ordinals is None:
+				self._ordinals_by_value[attr_name][value] = value_ordinals = array('L')
+			value_ordinals.append(ordinal)
+			self._bits_by_value[attr_name].pop(value, None)
+		for attr_name, column in self._columns.items():
+			column.append(getattr(story, attr_name))
+		self._keyword_group_matrices.clear()
+		return ordinal
+
+	def ordinals(self, stories_dict: _t.Dict[str, Story]) -> _t.List[int]:
+		"""Ordinals of the stories in the given dict, in the same order. Unknown stories are registered."""
+		stories = self._stories
+		ordinal_by_id = self._ordinal_by_id
+
+		# Fast path, entirely in C: all the stories are already registered.
+		res: _t.List[_t.Optional[int]] = list(map(ordinal_by_id.get, stories_dict.keys()))
+		if None not in res and all(map(is_, map(stories.__getitem__, res), stories_dict.values())):
+			return res
+
+		res = list()
+		for story_id, story in stories_dict.items():
+			ordinal = ordinal_by_id.get(story_id)
+			if ordinal is None or stories[ordinal] is not story:
+				ordinal = self._register(story_id, story)
+			res.append(ordinal)
+		return res
+
+	def view(self, stories: _t.Union[_t.Dict[str, Story], 'StoriesView']) -> 'StoriesView':
+		"""The given stories as a view over this index. Stories from a plain dict are registered, if necessary."""
+		if isinstance(stories, StoriesView) and stories.index is self:
+			return stories
+		return StoriesView(self, self.ordinals(dict(stories.items()) if isinstance(stories, StoriesView) else stories))
+
+	def ids_bits(self, story_ids: _t.Iterable[str]) -> int:
+		"""Stories with the given IDs. Only the already registered ones are included."""
+		return bits_from_ordinals([x for x in map(self._ordinal_by_id.get, story_ids) if x is not None])
+
+	def keyword_bits(self, keyword: str) -> int:
+		bits = self._bits_by_keyword.get(keyword)
+		if bits is None:
+			kw_ordinals = self._ordinals_by_keyword.get(keyword)
+			bits = bits_from_ordinals(kw_ordinals) if kw_ordinals else 0
+			self._bits_by_keyword[keyword] = bits
+		return bits
+
+	def value_bits(self, attr_name: str, value: str) -> int:
+		"""Stories with the given value of the attribute (one of `_counted_attrs`)."""
+		bits_by_value = self._bits_by_value[attr_name]
+		bits = bits_by_value.get(value)
+		if bits is None:
+			value_ordinals = self._ordinals_by_value[attr_name].get(value)
+			bits = bits_from_ordinals(value_ordinals) if value_ordinals else 0
+			bits_by_value[value] = bits
+		return bits
+
+	def value_counts(self, attr_name: str, stories: 'StoriesView') -> _t.Dict[str, int]:
+		"""
+		Number of the given stories for each value of the attribute: `keywords` or one of `_counted_attrs`
+		(only the values with at least one story). The values are in the order of their first appearance
+		in the given stories, as if they were counted by going through them.
+
+		Unless the set of stories is small (or not in the index order), they're not iterated over.
+		Instead, each value's stories are intersected with the set: frequent values as bitsets,
+		and rare ones - story by story.
+		"""
+		if attr_name == 'keywords':
+			ordinals_by_value = self._ordinals_by_keyword
+			bits_f = self.keyword_bits
+			n_ordinals = self._n_keyword_ordinals
+		else:
+			ordinals_by_value = self._ordinals_by_value[attr_name]
+			bits_f = partial(self.value_bits, attr_name)
+			n_ordinals = len(self._stories)
+
+		n_stories = len(self._stories)
+		ordinals = stories.ordinals
+		if (
+			len(stories) * n_ordinals <= n_stories * len(ordinals_by_value)
+			or not all(map(lt, ordinals, islice(ordinals, 1, None)))
+		):
+			# Too few stories to go through all the values, or the order of the first appearance isn't the index one:
+			values = map(attrgetter(attr_name), stories.iter_stories())
+			if attr_name == 'keywords':
+				values = chain.from_iterable(values)
+			return dict(Counter(values))
+
+		stories_bits = stories.bits
+		flags = _flags_from_bits(stories_bits)
+		if flags.count(1) == n_stories:
+			# All the stories are in the set, and the values are registered in the order of their first appearance:
+			return {value: len(value_ordinals) for value, value_ordinals in ordinals_by_value.items()}
+		flags += bytes(n_stories - len(flags))
+		min_popcount_n = max(1, n_stories // _popcount_min_share)
+		res: _t.Dict[str, int] = dict()
+		first_ordinals: _t.Dict[str, int] = dict()
+		for value, value_ordinals in ordinals_by_value.items():
+			if len(value_ordinals) >= min_popcount_n:
+				value_bits = bits_f(value) & stories_bits
+				count = _bits_count(value_bits)
+				first_ordinal = (value_bits & -value_bits).bit_length() - 1
+			else:
+				value_flags = list(map(flags.__getitem__, value_ordinals))
+				count = sum(value_flags)
+				first_ordinal = next(compress(value_ordinals, value_flags), -1)
+			if count:
+				res[value] = count
+				first_ordinals[value] = first_ordinal
+
+		# A value might be registered earlier than another one (in a story not in the set), but come after it
+		# in the first story of the set having them both. So the order is restored explicitly:
+		if attr_name == 'keywords':
+			positions_by_ordinal: _t.Dict[int, _t.Dict[str, int]] = dict()
+
+			def first_appearance(value: str) -> _t.Tuple[int, int]:
+				first_ordinal = first_ordinals[value]
+				positions = positions_by_ordinal.get(first_ordinal)
+				if positions is None:
+					positions_by_ordinal[first_ordinal] = positions = {
+						kw: i for i, kw in enumerate(self._stories[first_ordinal].keywords)
+					}
+				return first_ordinal, positions[value]
+		else:
+			first_appearance = first_ordinals.__getitem__
+		return {value: res[value] for value in sorted(res, key=first_appearance)}
+
+	def any_keyword_bits(self, keywords: _t.Iterable[str]) -> int:
+		"""Stories marked with ANY of the given keywords."""
+		bits = 0
+		for kw in keywords:
+			bits |= self.keyword_bits(kw)
+		return bits
+
+	def all_keywords_bits(self, keywords: _t.Iterable[str], full_bits: int) -> int:
+		"""Stories (within `full_bits`) marked with ALL the given keywords."""
+		bits = full_bits
+		for kw in keywords:
+			if not bits:
+				break
+			bits &= self.keyword_bits(kw)
+		return bits
+
+	def keyword_groups_matrix(self, keyword_groups: _t.Tuple[_t.Tuple[str, ...], ...]) -> KeywordGroupsMatrix:
+		"""
+		Incidence matrix of all the registered stories × the given keyword groups (a story hits a group
+		if it's marked with ANY of the group's keywords). It's cached, so it's built once for the same groups
+		(until new stories are registered), no matter which weights it's used with.
+		"""
+		matrices = self._keyword_group_matrices
+		matrix = matrices.get(keyword_groups)
+		if matrix is None:
+			matrix = KeywordGroupsMatrix(len(self._stories), [
+				ordinals_from_bits(self.any_keyword_bits(group_keywords)) for group_keywords in keyword_groups
+			])
+			if len(matrices) >= _max_cached_matrices:
+				del matrices[next(iter(matrices))]
+			matrices[keyword_groups] = matrix
+		return matrix
+
+	def column_range_bits(
+		self, attr_name: str, min: _t.Union[int, float, None] = None, max: _t.Union[int, float, None] = None
+	) -> int:
+		"""Stories with the given numeric attribute within the range (both ends inclusive, `None` for unlimited)."""
+		column = self._columns[attr_name]
+		if _np is not None:
+			values = _np.frombuffer(column, dtype=_np.float64 if column.typecode == 'd' else _np.int64)
+			mask = _np.ones(len(values), dtype=bool)
+			if min is not None:
+				mask &= values >= min
+			if max is not None:
+				mask &= values <= max
+			# Release the buffer right away, so that the column is still resizable:
+			del values
+			return _bits_from_bool_mask(mask)
+
+		if min is None:
+			ordinals = [i for i, x in enumerate(column) if x <= max] if max is not None else range(len(column))
+		elif max is None:
+			ordinals = [i for i, x in enumerate(column) if min <= x]
+		else:
+			ordinals = [i for i, x in enumerate(column) if min <= x <= max]
+		return bits_from_ordinals(ordinals)
+
+	def column_value_counts(self, attr_name: str, ordinals: _t.Sequence[int], step: _t.Union[int, float]) -> _t.Dict[int, int]:
+		"""
+		Number of the given stories for each bucket of the numeric attribute's values: `{bucket: count}`.
+		A bucket is the value integer-quantized with the given step (see `column_values()`).
+		"""
+		values = self.column_values(attr_name, ordinals, step=step)
+		if _np is not None and isinstance(values, _np.ndarray):
+			buckets, counts = _np.unique(values, return_counts=True)
+			return dict(zip(buckets.tolist(), counts.tolist()))
+		return dict(Counter(values))
+
+	def column_values(self, attr_name: str, ordinals: _t.List[int], step: _t.Union[int, float, None] = None) -> _t.Sequence:
+		"""
+		Values of the given numeric attribute for the given stories, as a sequence suitable for `sorted_positions()`.
+		If `step` is provided, values within it are treated as equal (integer-quantized).
+		"""
+		column = self._columns[attr_name]
+		multiplier = None if step is None or step <= 0 else 1.0 / step
+		if _np is not None:
+			values = _np.frombuffer(column, dtype=_np.float64 if column.typecode == 'd' else _np.int64)
+			res = values[_np.asarray(ordinals, dtype=_np.int64)]
+			del values
+			if multiplier is not None:
+				# Casting to int truncates towards zero, the same way built-in `int()` does:
+				res = (res * multiplier).astype(_np.int64)
+			return res
+		if multiplier is None:
+			return [column[i] for i in ordinals]
+		return [int(column[i] * multiplier) for i in ordinals]
+
+
+class _StoriesValuesView(ValuesView):
+	__slots__ = ()
+
+	def __iter__(self) -> _t.Iterator[Story]:
+		return self._mapping.iter_stories()
+
+
+class _StoriesItemsView(ItemsView):
+	__slots__ = ()
+
+	def __iter__(self) -> _t.Iterator[_t.Tuple[str, Story]]:
+		view: StoriesView = self._mapping
+		return zip(view, view.iter_stories())
+
+
+class StoriesView(MutableMapping):
+	"""
+	`{story_id: story}` mapping over the stories of `StoryIndex`, given by their ordinals (in the view's order).
+	By itself, it takes only an array of ordinals, plus a bitset of them (built on the first lookup by ID).
+
+	Views can share the same ordinals array (see `copy()`). So the view can be modified the same way as a dict,
+	but the first modification copies the array: copy on write. An added/replaced story is registered in the index.
+	"""
+	__slots__ = ('_index', '_ordinals', '_bits', '_owns_ordinals', '_n_changes')
+
+	def __init__(self, index: StoryIndex, ordinals: _t.Iterable[int] = tuple()):
+		self._index = index
+		self._ordinals: array = ordinals_array(ordinals)
+		self._bits: _t.Optional[int] = None
+		# Whether the array can be modified in place. Never for a given one: it might be shared.
+		self._owns_ordinals = False
+		self._n_changes = 0
+
+	@property
+	def index(self) -> StoryIndex:
+		return self._index
+
+	@property
+	def ordinals(self) -> array:
+		"""Ordinals of the stories, in the view's order. Not supposed to be modified (use the view itself for that)."""
+		return self._ordinals
+
+	@property
+	def n_changes(self) -> int:
+		"""How many times the view has been modified. Anything computed for it is outdated when this changes."""
+		return self._n_changes
+
+	def copy(self) -> 'StoriesView':
+		"""A new view of the same stories. Both share the ordinals, until either one is modified."""
+		res = StoriesView(self._index, self._ordinals)
+		res._bits = self._bits
+		self._owns_ordinals = False
+		return res
+
+	def __own_ordinals(self) -> array:
+		"""The ordinals array, to be modified in place. Copied on the first call."""
+		if not self._owns_ordinals:
+			self._ordinals = array(_ordinals_typecode, self._ordinals)
+			self._owns_ordinals = True
+		self._n_changes += 1
+		return self._ordinals
+
+	@property
+	def bits(self) -> int:
+		bits = self._bits
+		if bits is None:
+			self._bits = bits = bits_from_ordinals(self._ordinals)
+		return bits
+
+	def __repr__(self):
+		return f"{self.__class__.__name__}({len(self._ordinals)} stories)"
+
+	def __len__(self):
+		return len(self._ordinals)
+
+	def __iter__(self) -> _t.Iterator[str]:
+		return map(self._index.story_id, self._ordinals)
+
+	def iter_stories(self) -> _t.Iterator[Story]:
+		return map(self._index.story, self._ordinals)
+
+	def values(self) -> _StoriesValuesView:
+		return _StoriesValuesView(self)
+
+	def items(self) -> _StoriesItemsView:
+		return _StoriesItemsView(self)
+
+	def _ordinal_of(self, story_id: str) -> _t.Optional[int]:
+		index = self._index
+		ordinal = index._ordinal_by_id.get(story_id)
+		if ordinal is None:
+			return None
+		if (self.bits >> ordinal) & 1:
+			return ordinal
+		if story_id in index._replaced_ids:
+			# The view might have an earlier version of the story:
+			ids = index._ids
+			return next((x for x in self._ordinals if ids[x] == story_id), None)
+		return None
+
+	def __contains__(self, story_id) -> bool:
+		return self._ordinal_of(story_id) is not None
+
+	def __getitem__(self, story_id: str) -> Story:
+		ordinal = self._ordinal_of(story_id)
+		if ordinal is None:
+			raise KeyError(story_id)
+		return self._index.story(ordinal)
+
+	def __setitem__(self, story_id: str, story: Story):
+		"""The same as in dict: a new story is appended, and a replaced one keeps its position."""
+		old_ordinal = self._ordinal_of(story_id)
+		ordinal = self._index.ordinals({story_id: story})[0]
+		if ordinal == old_ordinal:
+			return
+		bits = self.bits
+		ordinals = self.__own_ordinals()
+		if old_ordinal is None:
+			ordinals.append(ordinal)
+		else:
+			ordinals[ordinals.index(old_ordinal)] = ordinal
+			bits &= ~(1 << old_ordinal)
+		self._bits = bits | (1 << ordinal)
+
+	def __delitem__(self, story_id: str):
+		ordinal = self._ordinal_of(story_id)
+		if ordinal is None:
+			raise KeyError(story_id)
+		bits = self.bits
+		ordinals = self.__own_ordinals()
+		del ordinals[ordinals.index(ordinal)]
+		self._bits = bits & ~(1 << ordinal)
+
+	def clear(self):
+		if self._ordinals:
+			self._ordinals = array(_ordinals_typecode)
+			self._owns_ordinals = True
+			self._bits = 0
+			self._n_changes += 1
+
+	def selected(self, bits: int) -> 'StoriesView':
+		"""Only the stories within the given bitset, in the same order. If that's all of them, the view itself."""
+		all_bits = self.bits
+		bits &= all_bits
+		if bits == all_bits:
+			return self
+		if not bits:
+			return StoriesView(self._index)
+		kept_ordinals = set(ordinals_from_bits(bits))
+		ordinals = self._ordinals
+		return StoriesView(self._index, compress(ordinals, map(kept_ordinals.__contains__, ordinals)))
+
+	def _shared_bits(self, other: 'StoriesView') -> int:
+		"""
+		Stories of this view which are in the other one, too. Both views are expected to be over the same index.
+		Normally, it's just the bitsets intersection. But stories are matched by ID, and a replaced story
+		has different ordinals in views created before and after the replacement.
+		"""
+		bits = self.bits & other.bits
+		replaced_ids = self._index._replaced_ids
+		if replaced_ids:
+			ids = self._index._ids
+			bits |= bits_from_ordinals([
+				x for x in self._ordinals if ids[x] in replaced_ids and ids[x] in other
+			])
+		return bits
+
+	def union(self, other: 'StoriesView') -> 'StoriesView':
+		"""All the stories of this view, followed by the ones which are only in the other view (in their order)."""
+		added = other.selected(other.bits & ~other._shared_bits(self))
+		if not added:
+			return self
+		return StoriesView(self._index, self._ordinals + added._ordinals)
+
+	def intersection(self, other: 'StoriesView') -> 'StoriesView':
+		"""Stories of this view (in its order) which are in the other one, too."""
+		return self.selected(self._shared_bits(other))
+
+	def difference(self, other: 'StoriesView') -> 'StoriesView':
+		"""Stories of this view (in its order) which aren't in the other one."""
+		return self.selected(self.bits & ~self._shared_bits(other))
+
+	def __eq__(self, other):
+		if isinstance(other, StoriesView) and other._index is self._index and self._ordinals == other._ordinals:
+			return True
+		return super().__eq__(other)
+
+	__hash__ = None
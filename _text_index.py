@@ -0,0 +1,414 @@
+# encoding: utf-8
+"""
+Inverted indexes over story texts:
+- `TextIndex`: words, with BM25 ranking;
+- `TrigramIndex`: 3-character sequences, to narrow down candidates for a regex/phrase search.
+
+Each index is built once per dataset version and saved as a single file: a pickled header and vocabulary,
+followed by raw postings (matching stories, and whatever else the index keeps per story) of each term.
+On query, only the postings of the query terms are read from disk - so only the vocabulary is kept in memory,
+and a query takes time proportional to the number of stories matching it, not to the size of the dataset.
+"""
+
+import typing as _t
+
+from array import array
+from collections import Counter
+from io import BytesIO
+from math import log
+import os
+from pathlib import Path
+import pickle
+import re
+from sys import byteorder
+from threading import Lock
+
+try:
+	import numpy as _np
+except ImportError:
+	_np = None
+
+try:
+	from re import _parser as _re_parser
+except ImportError:  # python < 3.11
+	# noinspection PyUnresolvedReferences,PyDeprecation
+	import sre_parse as _re_parser
+
+# Bump it whenever the file layout changes, so that outdated index files are rebuilt:
+_index_format_version = 3
+
+_word_re = re.compile(r"[^\W_]+")
+# Only trigrams of word characters are indexed: whitespace/punctuation ones are too common to narrow anything down.
+# Lookahead makes the matches overlap:
+_trigram_re = re.compile(r"(?=([^\W_]{3}))")
+
+# Story number within the index / term frequency within the story:
+_doc_typecode = 'I'
+_tf_typecode = 'H'
+_max_tf = (1 << 16) - 1  # BM25 saturates long before that, so higher frequencies are just clipped
+
+# BM25 parameters, the commonly used defaults:
+bm25_k1 = 1.2
+bm25_b = 0.75
+
+_regex_repeat_ops = tuple(
+	getattr(_re_parser, x) for x in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(_re_parser, x)
+)
+_regex_atomic_group_op = getattr(_re_parser, 'ATOMIC_GROUP', None)
+
+
+def text_terms(text: str) -> _t.List[str]:
+	"""Split a text (or a query) into `TextIndex` terms: lowercase words."""
+	return _word_re.findall(text.lower())
+
+
+def _folded_case(text: str) -> str:
+	"""
+	Lowercase text, where all the characters `re.IGNORECASE` treats as equal are the same, too
+	(`str.lower()` alone keeps some of them distinct: "ſ" and "s", "ς" and "σ", "ᲀ" and "в"...).
+	"""
+	if text.isascii():
+		return text.lower()
+	# Upper-then-lower round trip unifies all of them, except for a couple, which are replaced explicitly:
+	return text.replace('\u0130', 'i').replace('\u1e9e', 'ss').upper().lower().replace('\u03c2', '\u03c3')
+
+
+def text_trigrams(text: str) -> _t.Set[str]:
+	"""All the distinct `TrigramIndex` terms in the text."""
+	return set(_trigram_re.findall(_folded_case(text)))
+
+
+class _PostingsIndex:
+	"""
+	Base for a read-only index stored as a pickled header + vocabulary, followed by raw postings.
+	Postings of each term are one or more arrays of the same length (one item per matching story), back-to-back.
+
+	Stories are identified by their IDs. The index reflects story texts as they were when it was built.
+	"""
+	# Typecodes of the arrays making the postings of each term:
+	_postings_typecodes: _t.Tuple[str, ...] = (_doc_typecode, )
+
+	def __init__(
+		self, story_ids: _t.List[str], terms: _t.Dict[str, _t.Tuple[int, int]], extra: _t.Any,
+		file_handle: _t.BinaryIO, postings_offset: int,
+	):
+		self.story_ids = story_ids
+		# Term -> (offset within postings, number of stories with the term):
+		self._terms = terms
+		self.__file_handle = file_handle
+		self.__postings_offset = postings_offset
+		self.__lock = Lock()
+
+	def __len__(self):
+		return len(self.story_ids)
+
+	@classmethod
+	def _file_header(cls) -> dict:
+		return dict(kind=cls.__name__, version=_index_format_version, byteorder=byteorder)
+
+	@classmethod
+	def _read_from(cls, file_handle: _t.BinaryIO):
+		"""Read the header and vocabulary from an open file. `None` if it's of an incompatible format."""
+		header: dict = pickle.load(file_handle)
+		if header != cls._file_header():
+			return None
+		story_ids, terms, extra = pickle.load(file_handle)
+		return cls(story_ids, terms, extra, file_handle, file_handle.tell())
+
+	@classmethod
+	def load(cls, file_path: _t.Union[str, Path]):
+		"""Open a previously saved index. `None` if the file is broken or of an incompatible format."""
+		# noinspection PyTypeChecker
+		file_handle: _t.BinaryIO = open(file_path, 'rb')
+		try:
+			loaded_index = cls._read_from(file_handle)
+		except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError) as e:
+			print(f"Index file is broken, ignoring it: {e}")
+			loaded_index = None
+		if loaded_index is None:
+			file_handle.close()
+		return loaded_index
+
+	def close(self):
+		with self.__lock:
+			self.__file_handle.close()
+
+	def _postings(self, term: str) -> _t.Tuple[array, ...]:
+		"""Postings of the term: story numbers within the index (and the other per-story arrays, if any)."""
+		postings = tuple(array(x) for x in self._postings_typecodes)
+		offset_and_size = self._terms.get(term)
+		if offset_and_size is None:
+			return postings
+		offset, n_docs = offset_and_size
+		# Seek + read pair isn't atomic, so a lock is necessary for a shared handle:
+		with self.__lock:
+			self.__file_handle.seek(self.__postings_offset + offset)
+			data = self.__file_handle.read(n_docs * sum(x.itemsize for x in postings))
+		start = 0
+		for x in postings:
+			end = start + n_docs * x.itemsize
+			x.frombytes(data[start:end])
+			start = end
+		return postings
+
+
+class TextIndex(_PostingsIndex):
+	"""Full-text index of words. Use `TextIndexBuilder` to create one."""
+	_postings_typecodes = (_doc_typecode, _tf_typecode)
+
+	def __init__(
+		self, story_ids: _t.List[str], terms: _t.Dict[str, _t.Tuple[int, int]], doc_lengths: array,
+		file_handle: _t.BinaryIO, postings_offset: int,
+	):
+		super().__init__(story_ids, terms, doc_lengths, file_handle, postings_offset)
+		self._doc_lengths = doc_lengths
+		# Per-story part of BM25 denominator, computed on first query:
+		self.__length_norms = None
+
+	def _length_norms(self):
+		"""`k1 * (1 - b + b * doc_length / avg_doc_length)` for each story."""
+		norms = self.__length_norms
+		if norms is None:
+			doc_lengths = self._doc_lengths
+			avg_length = (sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0) or 1.0
+			k = bm25_k1 / avg_length
+			if _np is not None:
+				norms = (1.0 - bm25_b) * bm25_k1 + bm25_b * k * _np.array(doc_lengths, dtype=_np.float64)
+			else:
+				norms = [(1.0 - bm25_b) * bm25_k1 + bm25_b * k * x for x in doc_lengths]
+			self.__length_norms = norms
+		return norms
+
+	def _idf(self, n_matching: int) -> float:
+		n_all = len(self.story_ids)
+		return log(1.0 + (n_all - n_matching + 0.5) / (n_matching + 0.5))
+
+	def scores(self, query: str) -> _t.Dict[str, float]:
+		"""
+		BM25 relevance of stories to the query: {story_id: score}, only the stories containing ANY of the query words.
+		The result is sorted by score, the most relevant first (equally relevant ones keep the dataset order).
+		"""
+		query_terms = Counter(text_terms(query))
+		story_ids = self.story_ids
+		norms = self._length_norms()
+
+		if _np is not None:
+			total = _np.zeros(len(story_ids), dtype=_np.float64)
+			for term, query_tf in query_terms.items():
+				docs, tfs = self._postings(term)
+				if not docs:
+					continue
+				weight = query_tf * self._idf(len(docs)) * (bm25_k1 + 1.0)
+				docs = _np.frombuffer(docs, dtype=_np.uint32).astype(_np.int64)
+				tfs = _np.frombuffer(tfs, dtype=_np.uint16).astype(_np.float64)
+				# Each story appears only once within a term's postings, so there are no repeated indices:
+				total[docs] += weight * tfs / (tfs + norms[docs])
+			matching = _np.flatnonzero(total)
+			matching = matching[_np.argsort(-total[matching], kind='stable')]
+			return dict(zip(map(story_ids.__getitem__, matching.tolist()), total[matching].tolist()))
+
+		total: _t.Dict[int, float] = dict()
+		for term, query_tf in query_terms.items():
+			docs, tfs = self._postings(term)
+			if not docs:
+				continue
+			weight = query_tf * self._idf(len(docs)) * (bm25_k1 + 1.0)
+			for doc, tf in zip(docs, tfs):
+				total[doc] = total.get(doc, 0.0) + weight * tf / (tf + norms[doc])
+		return {
+			story_ids[doc]: score
+			for doc, score in sorted(total.items(), key=lambda doc_score: (-doc_score[1], doc_score[0]))
+		}
+
+
+def _required_literals(parsed) -> _t.List[str]:
+	"""
+	Literal strings which have to be present in any text matched by the parsed regex.
+	Only the parts the regex can't match without are considered: alternatives and optional pieces are skipped.
+
+	Trigrams are case-folded the same way `re.IGNORECASE` matches characters, so the literals
+	are valid for case-insensitive matching, too.
+	"""
+	literals: _t.List[str] = list()
+	run: _t.List[str] = list()
+
+	def end_run():
+		if run:
+			literals.append(''.join(run))
+			run.clear()
+
+	for op, arg in parsed:
+		if op is _re_parser.LITERAL:
+			run.append(chr(arg))
+			continue
+		end_run()
+		if op is _re_parser.SUBPATTERN:
+			literals.extend(_required_literals(arg[-1]))
+		elif op in _regex_repeat_ops:
+			min_repeats, _, item = arg
+			if min_repeats > 0:
+				literals.extend(_required_literals(item))
+		elif op is _regex_atomic_group_op:
+			literals.extend(_required_literals(arg))
+	end_run()
+	return literals
+
+
+def regex_trigrams(pattern: str, flags: int = 0) -> _t.Set[str]:
+	"""
+	Trigrams which have to be present in any text matched by the regex.
+	An empty set means the regex can't be narrowed down by trigrams (all the stories are candidates).
+	"""
+	res: _t.Set[str] = set()
+	for literal in _required_literals(_re_parser.parse(pattern, flags)):
+		res.update(text_trigrams(literal))
+	return res
+
+
+class TrigramIndex(_PostingsIndex):
+	"""
+	Index of case-folded 3-character sequences. Use `TrigramIndexBuilder` to create one.
+	"""
+
+	def __init__(
+		self, story_ids: _t.List[str], terms: _t.Dict[str, _t.Tuple[int, int]], extra: _t.Any,
+		file_handle: _t.BinaryIO, postings_offset: int,
+	):
+		super().__init__(story_ids, terms, extra, file_handle, postings_offset)
+		# Built on first check:
+		self.__doc_by_story_id: _t.Optional[_t.Dict[str, int]] = None
+
+	def _doc_by_story_id(self) -> _t.Dict[str, int]:
+		doc_by_story_id = self.__doc_by_story_id
+		if doc_by_story_id is None:
+			self.__doc_by_story_id = doc_by_story_id = {story_id: doc for doc, story_id in enumerate(self.story_ids)}
+		return doc_by_story_id
+
+	def has_story(self, story_id: str) -> bool:
+		return story_id in self._doc_by_story_id()
+
+	def candidate_ids(self, trigrams: _t.Iterable[str]) -> _t.Optional[_t.List[str]]:
+		"""
+		Stories containing ALL the given trigrams (in the dataset order).
+		`None` if no trigrams are given, i.e. there's nothing to narrow the stories down with.
+		"""
+		# The rarest trigrams go first, to make the intersection small right away:
+		trigrams = sorted(trigrams, key=lambda x: self._terms.get(x, (0, 0))[1])
+		if not trigrams:
+			return None
+		docs: _t.Optional[_t.Set[int]] = None
+		for trigram in trigrams:
+			trigram_docs = self._postings(trigram)[0]
+			docs = set(trigram_docs) if docs is None else docs.intersection(trigram_docs)
+			if not docs:
+				return []
+		return list(map(self.story_ids.__getitem__, sorted(docs)))
+
+
+class _PostingsIndexBuilder:
+	"""Base for builders of `_PostingsIndex` subclasses. Repeated stories (by ID) are ignored."""
+	_index_class: _t.Type[_PostingsIndex] = _PostingsIndex
+
+	def __init__(self):
+		self._doc_by_story_id: _t.Dict[str, int] = dict()
+		self._postings: _t.Dict[str, _t.Tuple[array, ...]] = dict()
+
+	def __len__(self):
+		return len(self._doc_by_story_id)
+
+	def _new_doc(self, story_id: str) -> _t.Optional[int]:
+		"""Number of the added story within the index. `None` if it's already added."""
+		doc_by_story_id = self._doc_by_story_id
+		if story_id in doc_by_story_id:
+			return None
+		doc = len(doc_by_story_id)
+		doc_by_story_id[story_id] = doc
+		return doc
+
+	def _term_postings(self, term: str) -> _t.Tuple[array, ...]:
+		postings = self._postings
+		term_postings = postings.get(term)
+		if term_postings is None:
+			postings[term] = term_postings = tuple(array(x) for x in self._index_class._postings_typecodes)
+		return term_postings
+
+	def _extra(self) -> _t.Any:
+		"""Additional data saved together with the vocabulary."""
+		return None
+
+	def _dump(self, file_handle: _t.BinaryIO):
+		postings = self._postings
+		posting_size = sum(array(x).itemsize for x in self._index_class._postings_typecodes)
+		# Offsets are known beforehand, so the vocabulary can be written before the postings themselves:
+		terms: _t.Dict[str, _t.Tuple[int, int]] = dict()
+		offset = 0
+		for term, (docs, *_) in postings.items():
+			terms[term] = (offset, len(docs))
+			offset += len(docs) * posting_size
+
+		pickle.dump(self._index_class._file_header(), file_handle, protocol=pickle.HIGHEST_PROTOCOL)
+		pickle.dump(
+			(list(self._doc_by_story_id), terms, self._extra()), file_handle, protocol=pickle.HIGHEST_PROTOCOL
+		)
+		for term_postings in postings.values():
+			for x in term_postings:
+				file_handle.write(x.tobytes())
+
+	def save(self, file_path: _t.Union[str, Path]):
+		"""Save the index to a file and open it from there."""
+		file_path = Path(file_path)
+		tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+		try:
+			# noinspection PyTypeChecker
+			with open(tmp_path, 'wb') as file_handle:
+				self._dump(file_handle)
+		except BaseException:
+			tmp_path.unlink(missing_ok=True)
+			raise
+		# Atomic replacement: a half-written index should never be picked up by a parallel/interrupted process.
+		os.replace(tmp_path, file_path)
+		return self._index_class.load(file_path)
+
+	def build_in_memory(self):
+		"""An index without a file: the postings are kept in memory, in the same binary form."""
+		file_handle = BytesIO()
+		self._dump(file_handle)
+		file_handle.seek(0)
+		return self._index_class._read_from(file_handle)
+
+
+class TextIndexBuilder(_PostingsIndexBuilder):
+	"""Accumulates story texts for a new `TextIndex`."""
+	_index_class = TextIndex
+
+	def __init__(self):
+		super().__init__()
+		self._doc_lengths = array(_doc_typecode)
+
+	def _extra(self):
+		return self._doc_lengths
+
+	def add(self, story_id: str, text: str):
+		doc = self._new_doc(story_id)
+		if doc is None:
+			return
+		terms = text_terms(text)
+		self._doc_lengths.append(len(terms))
+		term_postings_f = self._term_postings
+		for term, tf in Counter(terms).items():
+			docs, tfs = term_postings_f(term)
+			docs.append(doc)
+			tfs.append(min(tf, _max_tf))
+
+
+class TrigramIndexBuilder(_PostingsIndexBuilder):
+	"""Accumulates story texts for a new `TrigramIndex`."""
+	_index_class = TrigramIndex
+
+	def add(self, story_id: str, text: str):
+		doc = self._new_doc(story_id)
+		if doc is None:
+			return
+		term_postings_f = self._term_postings
+		for trigram in text_trigrams(text):
+			term_postings_f(trigram)[0].append(doc)
@@ -0,0 +1,204 @@
+# encoding: utf-8
+"""
+Sidecar on-disk storage for story texts, used when the dataset is loaded without texts kept in memory.
+
+All the texts are written one after another into a single binary file, each one compressed on its own.
+So any text is read back in O(1): with a tiny `TextRef` handle (offset + length) kept by the story,
+or by the story ID, with the offset index stored at the end of the file.
+The file is memory-mapped: reading a text doesn't copy the rest of the file into memory
+and doesn't need a lock, so the store is shared by threads freely.
+
+File layout:
+- header (magic + format version);
+- compressed text blocks;
+- pickled index: `{story_id: (offset, length)}`;
+- the index offset, as the last 8 bytes (missing while the file is still being written).
+"""
+
+import typing as _t
+
+from attrs import define, field
+
+import mmap
+import os
+from pathlib import Path
+import pickle
+import struct
+from threading import Lock
+from weakref import WeakSet
+import zlib
+
+_text_encoding = 'utf-8'
+
+_store_magic = b'LitTexts'
+_store_format_version = 1
+_store_header = _store_magic + struct.pack('<I', _store_format_version)
+_index_offset_struct = struct.Struct('<Q')
+
+_default_compression_level = 6
+
+# All the stores alive in this process, to tell which files are still in use (see `store_paths_in_use()`):
+_alive_stores: 'WeakSet[TextStore]' = WeakSet()
+
+
+@define(eq=False)
+class TextStore:
+	"""A read-only file with compressed story texts. The file is mapped lazily and the mapping isn't pickled."""
+	path: Path = field(converter=Path)
+
+	__mapped: _t.Optional[mmap.mmap] = field(default=None, init=False, repr=False)
+	__index: _t.Optional[_t.Dict[str, _t.Tuple[int, int]]] = field(default=None, init=False, repr=False)
+	__lock: Lock = field(factory=Lock, init=False, repr=False)
+
+	def __attrs_post_init__(self):
+		_alive_stores.add(self)
+
+	def __reduce__(self):
+		return TextStore, (str(self.path), )
+
+	def __eq__(self, other):
+		if not isinstance(other, TextStore):
+			return NotImplemented
+		return self.path == other.path
+
+	def __hash__(self):
+		return hash(self.path)
+
+	def _mapped(self, min_size: int = 0) -> mmap.mmap:
+		"""
+		The mapped file. It's mapped again if it's smaller than `min_size`:
+		the file might have grown since it was mapped, while it's still being written.
+		"""
+		mapped = self.__mapped
+		if mapped is not None and len(mapped) >= min_size:
+			return mapped
+		with self.__lock:
+			mapped = self.__mapped
+			if mapped is None or len(mapped) < min_size:
+				# noinspection PyTypeChecker
+				with open(self.path, 'rb') as file_handle:
+					new_mapped = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+				if new_mapped[:len(_store_header)] != _store_header:
+					new_mapped.close()
+					raise ValueError(f"Not a text store (or an incompatible version of it): {self.path}")
+				# The previous mapping isn't closed: a concurrent reader might still be using it.
+				self.__mapped = mapped = new_mapped
+		return mapped
+
+	def read(self, offset: int, length: int) -> str:
+		end = offset + length
+		return zlib.decompress(self._mapped(end)[offset:end]).decode(_text_encoding)
+
+	def _index(self) -> _t.Dict[str, _t.Tuple[int, int]]:
+		index = self.__index
+		if index is None:
+			mapped = self._mapped()
+			index_offset_start = len(mapped) - _index_offset_struct.size
+			if index_offset_start < len(_store_header):
+				raise ValueError(f"Text store has no index (it's not finished): {self.path}")
+			index_offset, = _index_offset_struct.unpack_from(mapped, index_offset_start)
+			self.__index = index = pickle.loads(mapped[index_offset:index_offset_start])
+		return index
+
+	@property
+	def story_ids(self) -> _t.KeysView[str]:
+		return self._index().keys()
+
+	def ref(self, story_id: str) -> 'TextRef':
+		"""A lazy handle to the text of the story with the given ID. `KeyError` is raised if there's no such story."""
+		offset, length = self._index()[story_id]
+		return TextRef(self, offset, length)
+
+	def text(self, story_id: str) -> str:
+		return self.read(*self._index()[story_id])
+
+	def close(self):
+		with self.__lock:
+			if self.__mapped is not None:
+				self.__mapped.close()
+				self.__mapped = None
+			self.__index = None
+
+
+def store_paths_in_use() -> _t.Set[Path]:
+	"""Absolute paths of the stores still referenced by anything in this process (stories, `TextRef`s, loaders)."""
+	return {x.path.absolute() for x in list(_alive_stores)}
+
+
+@define(frozen=True)
+class TextRef:
+	"""A lazy handle to a single story text within `TextStore`."""
+	store: TextStore = field(repr=False)
+	offset: int = field()
+	length: int = field()
+
+	def resolve(self) -> str:
+		return self.store.read(self.offset, self.length)
+
+
+class TextStoreWriter:
+	"""
+	Context manager writing a new `TextStore` file.
+	The file is written under a temporary name and only renamed to the target one on successful exit.
+	An existing store is never overwritten: `TextRef`s to it might still be in use, and they'd read garbage then.
+
+	Until then, the store (and all the issued `TextRef`s) point to the temporary file, so the already added texts
+	can be read back after `flush()`.
+	"""
+
+	def __init__(self, path: _t.Union[str, Path], compression_level: int = _default_compression_level):
+		self._path = Path(path)
+		self._tmp_path = self._path.with_name(f"{self._path.name}.tmp")
+		self.store = TextStore(self._tmp_path)
+		self.compression_level = compression_level
+		self._file_handle: _t.Optional[_t.BinaryIO] = None
+		self._offset = 0
+		self._index: _t.Dict[str, _t.Tuple[int, int]] = dict()
+
+	def __enter__(self):
+		if self._path.exists():
+			raise FileExistsError(f"Text store already exists: {self._path}")
+		# noinspection PyTypeChecker
+		self._file_handle = open(self._tmp_path, 'wb')
+		self._file_handle.write(_store_header)
+		self._offset = len(_store_header)
+		self._index = dict()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		if exc_type is None:
+			self._file_handle.write(pickle.dumps(self._index, protocol=pickle.HIGHEST_PROTOCOL))
+			self._file_handle.write(_index_offset_struct.pack(self._offset))
+		self._file_handle.close()
+		self._file_handle = None
+		self.store.close()
+		if exc_type is not None:
+			self._tmp_path.unlink(missing_ok=True)
+			return
+		os.replace(self._tmp_path, self._path)
+		self.store.path = self._path
+
+	def __contains__(self, story_id: str):
+		return story_id in self._index
+
+	def flush(self):
+		self._file_handle.flush()
+
+	def ref(self, story_id: str) -> TextRef:
+		"""
+		A handle to the already added text of the story with the given ID.
+		The file is flushed, so the text can be read back right away.
+		"""
+		self.flush()
+		offset, length = self._index[story_id]
+		return TextRef(self.store, offset, length)
+
+	def add(self, text: str, story_id: _t.Optional[str] = None) -> TextRef:
+		"""Write the text. With `story_id`, it's also added to the index, so it can be found by the ID."""
+		data = zlib.compress(text.encode(_text_encoding), self.compression_level)
+		offset = self._offset
+		self._file_handle.write(data)
+		self._offset += len(data)
+		if story_id is not None:
+			self._index[story_id] = (offset, len(data))
+		return TextRef(self.store, offset, len(data))
@@ -13,7 +13,9 @@
 
 from itertools import chain
 
-from literotica import DataSetDB, Category, Story, DataSetLoader as _DataSetLoader, PathLike as _PathLike
+from literotica import (
+	DataSetDB, Category, KeywordGroups, Story, DataSetLoader as _DataSetLoader, PathLike as _PathLike
+)
 
 
 def main():
@@ -162,16 +164,24 @@ def main():
 	# 	kw: hit for kw, hit in keyword_hits.items()
 	# 	if kw in db.categories[category].keywords and kw not in already_used_keywords
 	# }
+	# The stats are computed once per DB, so feel free to look at them after each filtering step.
+	# Besides keywords, stories can be counted per author, category or rating:
+	# db.author_hits, db.category_hits, db.rating_hits(step=0.5)
+
+	# The same groups are used below by multiple filters and a sort. Compile them once:
+	# then, the per-story hits/weights are computed only once, too, and reused by all of them.
+	# Passing the raw dict (or the groups alone) to each method works just as well, only slower.
+	compiled_kw_groups = KeywordGroups(desired_kw_groups)
 
 	# With our keywords and their weights selection, let's filter out any story which has no such keywords
 	# OR their combined weight is less then 1:
 	db = db.keyword_hits_min(
-		# This function expects only groups and the hit count.
+		# This function uses only groups and the hit count.
 		# For more reasonable but also aggressive filtering, you might want at least two keyword-groups match,
 		# but I'm OK with just one:
-		1, *desired_kw_groups.keys()
+		1, compiled_kw_groups  # ... or, uncompiled: `*desired_kw_groups.keys()`
 	).keyword_weights_min(
-		1, desired_kw_groups  # This time, `1` means the weight the keyword-group selection must be the whole dict, too
+		1, compiled_kw_groups  # This time, `1` means the weight, which the compiled groups carry, too
 	)
 
 	# Finally, let's force-restore any stories with too hot tags, which might've been filtered out
@@ -180,20 +190,22 @@ def main():
 		kws for kws, weight in desired_kw_groups.items()
 		if weight > 2.95
 	)))
-	# No fancy magic here. Stories is just a dict, and any filtering creates
-	# just a new instance of the DB with another dict in it.
-	# So it's completely enough to update the desired dict with the items from another DB instance...
-	# or any filters performed manually on the dict itself:
-	db.stories.update(
-		db_pre_filters.with_keywords(*hottest_tags).stories
-	)
+	# Any filtering creates just a new instance of the DB, and all of them share the same stories.
+	# So, the DBs can be combined as sets: `|` (union), `&` (intersection) and `-` (difference).
+	# The union keeps the stories of the left DB in their order, and appends the new ones from the right one:
+	db = db | db_pre_filters.with_keywords(*hottest_tags)
+	# ... and if you need to do any filtering manually, on the stories dict itself, get a modifiable version of the DB:
+	# db = db.materialized()
+	# db.stories.update(...)
 
 	# After all the filtering is done, let's also exclude stories with garbage content:
 	db = db.filter_out_broken_stories()
 
 	# ... and sort the stories dict (works only on recent versions of Python) to see the most desired stories first:
-	# db = db.sorted_by_max_keyword_hits(*desired_kw_groups.keys())
-	db = db.sorted_by_max_keywords_weight(desired_kw_groups)
+	# db = db.sorted_by_max_keyword_hits(compiled_kw_groups)
+	db = db.sorted_by_max_keywords_weight(compiled_kw_groups)
+	# Need only the best ones? In lazy mode (see `db.lazy()`), limiting right after sorting is a partial sort:
+	# db = db.limited(5000)
 
 	# When everything is done, all that's left is to save the work into
 	db.dump_to_output_txt_file()  # saved to 'combined.txt'
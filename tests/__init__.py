@@ -0,0 +1,5 @@
+# encoding: utf-8
+"""
+Tests, comparing the optimized code paths against plain reference implementations (mostly - the original dict-based
+ones). They're a part of the package, to import it relatively: run `python -m pytest tests` from the repo root.
+"""
@@ -0,0 +1,75 @@
+# encoding: utf-8
+"""
+Reference implementations: the original dict-based filtering/sorting of `DataSetDB`, story by story.
+Each optimized code path is expected to give exactly the same stories, in exactly the same order.
+"""
+
+import typing as _t
+
+from .._data_objects import Story
+
+StoriesDict = _t.Dict[str, Story]
+
+
+def filtered(stories: _t.Mapping[str, Story], ok_f: _t.Callable[[Story], bool]) -> StoriesDict:
+	return {k: v for k, v in stories.items() if ok_f(v)}
+
+
+def sorted_stories(stories: _t.Mapping[str, Story], key: _t.Callable[[Story], _t.Any], reverse=False) -> StoriesDict:
+	return {story.id: story for story in sorted(stories.values(), key=key, reverse=reverse)}
+
+
+def _group_names(keyword_synonym_groups: _t.Iterable) -> _t.Dict[str, str]:
+	group_name_by_keyword: _t.Dict[str, str] = dict()
+	for kw_group in keyword_synonym_groups:
+		if isinstance(kw_group, str):
+			kw_group = [kw_group]
+		kw_group = list(kw_group)
+		for kw in kw_group:
+			group_name_by_keyword[kw] = kw_group[0]
+	return group_name_by_keyword
+
+
+def keyword_group_hits_f(*keyword_synonym_groups) -> _t.Callable[[Story], int]:
+	group_name_by_keyword = _group_names(keyword_synonym_groups)
+
+	def n_group_hits_f(story: Story):
+		return len({group_name_by_keyword[kw] for kw in story.keywords if kw in group_name_by_keyword})
+
+	return n_group_hits_f
+
+
+def keyword_group_weight_f(weights_by_group: _t.Dict[_t.Any, _t.Union[int, float]]) -> _t.Callable[[Story], float]:
+	group_name_by_keyword = _group_names(weights_by_group)
+	group_weights = {
+		([x] if isinstance(x, str) else list(x))[0]: weight
+		for x, weight in weights_by_group.items()
+	}
+
+	def keywords_weight_f(story: Story):
+		group_hits = {group_name_by_keyword[kw] for kw in story.keywords if kw in group_name_by_keyword}
+		return sum(group_weights[x] for x in group_hits)
+
+	return keywords_weight_f
+
+
+def value_hits(stories: _t.Mapping[str, Story], attr_name: str) -> _t.Dict[str, int]:
+	"""Like `keyword_hits`: counts in the order of the first appearance, then stably sorted by count."""
+	counts: _t.Dict[str, int] = dict()
+	for story in stories.values():
+		values = story.keywords if attr_name == 'keywords' else [getattr(story, attr_name)]
+		for value in values:
+			counts[value] = counts.get(value, 0) + 1
+	return dict(sorted(counts.items(), key=lambda k_v: k_v[1], reverse=True))
+
+
+def output_text(stories: _t.Mapping[str, Story], max_stories: _t.Optional[int] = -1) -> _t.List[str]:
+	"""The original `dumped_as_output_text()`: each story formatted, prefixed with the separator (except the first one)."""
+	if max_stories is not None and max_stories < 0:
+		max_stories = max(0, len(stories) + max_stories)
+	res = [
+		f"[ Title: {story.title.strip()};\nTags: {', '.join(story.keywords)} ]\n***\n{story.text.strip()}"
+		for story in stories.values()
+	]
+	res[1:] = [f"\n\n----\n\n{x}" for x in res[1:]]
+	return res[:max_stories]
@@ -0,0 +1,111 @@
+# encoding: utf-8
+"""
+Synthetic stories and datasets: small, but with all the kinds of overlaps the real dataset has
+(shared keywords and authors, equal ratings, the same story in several categories, broken stories).
+"""
+
+import typing as _t
+
+import json
+import os
+from pathlib import Path
+import random
+
+from .._data_objects import Category, Story
+
+category_names = ('Gay Male', 'Sci-Fi & Fantasy', 'Incest/Taboo', 'Group Sex')
+keywords = tuple(f'kw{i}' for i in range(24)) + ('brother', 'twins', 'orgy', 'threesome')
+authors = tuple(f'author{i}' for i in range(12))
+
+_words = 'the quick brown fox jumps over the lazy dog and then some more words happen here brother'.split()
+# The ones case-insensitive regex matching treats specially (see `_text_index._folded_case()`):
+_tricky_words = ('ſtreſs', 'STRESS', 'ΟΔΟΣ', 'οδος', 'ᲀᲀᲀ', 'ВВВ', 'KELVIN', 'İstanbul', 'ẞtraße', 'ﬅop')
+_broken_suffix = '\n<script>var x;</script> COVID-19 RESOURCES  \n'
+
+dataset_repo_subdir = 'dataset_repo'
+dataset_name = 'LitEroticaV2JSON'
+
+
+def story_dicts_by_category(n: int = 300, seed: int = 0) -> _t.Dict[str, _t.Dict[str, dict]]:
+	"""Raw story dicts, as they're in the dataset's JSON files: `{category: {story_id: story_dict}}`."""
+	rnd = random.Random(seed)
+	res: _t.Dict[str, _t.Dict[str, dict]] = {x: dict() for x in category_names}
+	for i in range(n):
+		category = rnd.choice(category_names)
+		story_id = f'story-{i}'
+		text_words = [rnd.choice(_words) for _ in range(rnd.randint(5, 60))]
+		if i % 7 == 0:
+			text_words.insert(rnd.randint(0, len(text_words)), rnd.choice(_tricky_words))
+		text = ' '.join(text_words)
+		if i % 37 == 0:
+			text += _broken_suffix
+		story_dict = dict(
+			id=story_id, title=f'Title {i}', url=f'http://x/{story_id}', category=category,
+			# Rounded coarsely, so that there are plenty of ties:
+			rating=round(rnd.uniform(1, 5), 1), description='desc',
+			keywords=sorted(rnd.sample(keywords, rnd.randint(0, 8))), text=text,
+			page_count=rnd.randint(1, 5), word_count=rnd.randint(1, 9000),
+			author=rnd.choice(authors), date_approved='2020',
+		)
+		res[category][story_id] = story_dict
+		if i % 50 == 0:
+			other_category = rnd.choice([x for x in category_names if x != category])
+			res[other_category][story_id] = story_dict
+	return res
+
+
+def stories(n: int = 300, seed: int = 0) -> _t.Dict[str, Story]:
+	"""The same stories as `story_dicts_by_category()`, as objects: the first occurrence of each one."""
+	res: _t.Dict[str, Story] = dict()
+	for category_stories in story_dicts_by_category(n, seed).values():
+		for story_id, story_dict in category_stories.items():
+			if story_id not in res:
+				res[story_id] = Story.deserialize_json_dict(**story_dict)
+	return res
+
+
+def categories(stories_dict: _t.Dict[str, Story]) -> _t.Dict[str, Category]:
+	res = {x: Category(category=x, description='d', url='u') for x in category_names}
+	for story_id, story in stories_dict.items():
+		cat = res[story.category]
+		cat.stories.add(story_id)
+		for kw in story.keywords:
+			cat.stories_by_keyword.setdefault(kw, set()).add(story_id)
+	return res
+
+
+def write_dataset(root_dir: Path, n: int = 300, seed: int = 0) -> Path:
+	"""Unpacked dataset JSON files, at the same place under the root dir as the loader expects. Returns the dir."""
+	dataset_dir = root_dir / dataset_repo_subdir / dataset_name
+	dataset_dir.mkdir(parents=True, exist_ok=True)
+	by_category = story_dicts_by_category(n, seed)
+
+	def dump(file_name: str, data):
+		with open(dataset_dir / file_name, 'w', encoding='utf-8') as file_handle:
+			json.dump(data, file_handle)
+
+	dump('categories.json', {x: dict(category=x, description='d', url='u', page_links=['b', 'a']) for x in by_category})
+	dump('story_list_by_category.json', {x: list(x_stories) for x, x_stories in by_category.items()})
+	for category, category_stories in by_category.items():
+		keywords_file_name, stories_file_name = Category.json_filenames_of(category)
+		story_ids_by_keyword: _t.Dict[str, _t.List[str]] = dict()
+		for story_id, story_dict in category_stories.items():
+			for kw in story_dict['keywords']:
+				story_ids_by_keyword.setdefault(kw, list()).append(story_id)
+		dump(keywords_file_name, story_ids_by_keyword)
+		dump(stories_file_name, category_stories)
+	return dataset_dir
+
+
+def write_archive(dataset_dir: Path, volume_size: int = 200000) -> _t.List[Path]:
+	"""Pack the dataset JSON files into a multi-volume archive, the same way the original one is. Returns the volumes."""
+	import multivolumefile
+	from py7zr import SevenZipFile
+
+	repo_dir = dataset_dir.parent
+	archive_path = repo_dir / f'{dataset_name}.7z'
+	with multivolumefile.open(archive_path, 'wb', volume=volume_size) as volume:
+		with SevenZipFile(volume, 'w') as archive:
+			for file_name in sorted(os.listdir(dataset_dir)):
+				archive.write(dataset_dir / file_name, file_name)
+	return sorted(repo_dir.glob(f'{dataset_name}.7z.*'))
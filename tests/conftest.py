@@ -0,0 +1,25 @@
+# encoding: utf-8
+
+import pytest
+
+from .. import DataSetDB
+from . import _synthetic
+
+
+@pytest.fixture
+def stories():
+	"""Fresh story objects for each test: some tests modify them."""
+	return _synthetic.stories()
+
+
+@pytest.fixture
+def db(stories) -> DataSetDB:
+	"""A DB not loaded from a dataset: with plain dicts, as the original code had."""
+	return DataSetDB(_synthetic.categories(stories), stories)
+
+
+@pytest.fixture
+def dataset_root(tmp_path):
+	"""A root dir with the unpacked dataset in it."""
+	_synthetic.write_dataset(tmp_path)
+	return tmp_path
@@ -0,0 +1,140 @@
+# encoding: utf-8
+"""Bitset and ordinal algebra of the story index against brute force, with and without numpy."""
+
+from array import array
+import random
+
+import pytest
+
+from .. import _story_index
+from .._story_index import (
+	bit_sliced_counter, bits_from_ordinals, counter_at_least, KeywordGroupsMatrix, ordinals_from_bits,
+	sorted_positions, top_positions, values_range_bits,
+)
+
+
+@pytest.fixture(params=['numpy', 'no-numpy'])
+def np(request, monkeypatch):
+	"""Numpy module, or `None` - with the index code made to fall back to the pure-python paths."""
+	if request.param == 'numpy':
+		return pytest.importorskip('numpy')
+	monkeypatch.setattr(_story_index, '_np', None)
+	return None
+
+
+def _random_ordinal_sets(n_sets=40, seed=0):
+	rnd = random.Random(seed)
+	res = [[], [0], [5], [0, 1, 2, 3], list(range(0, 200, 3))]
+	for _ in range(n_sets):
+		res.append(sorted(rnd.sample(range(300), rnd.randint(0, 120))))
+	return res
+
+
+def _keys(np, values):
+	return np.asarray(values) if np is not None else values
+
+
+def test_bits_and_ordinals_roundtrip():
+	for ordinals in _random_ordinal_sets():
+		bits = bits_from_ordinals(ordinals)
+		assert bits == sum(1 << x for x in ordinals)
+		assert ordinals_from_bits(bits) == ordinals
+		# Any iterable and any order, the duplicates included:
+		assert bits_from_ordinals(iter(ordinals[::-1] + ordinals)) == bits
+		assert bits_from_ordinals(array('q', ordinals)) == bits
+		assert _story_index._bits_count(bits) == len(ordinals) == _story_index._bits_count_fallback(bits)
+	assert ordinals_from_bits(0) == []
+
+
+def test_set_algebra_on_bits():
+	sets = _random_ordinal_sets(10)
+	for a in sets:
+		for b in sets:
+			a_bits, b_bits = bits_from_ordinals(a), bits_from_ordinals(b)
+			assert ordinals_from_bits(a_bits & b_bits) == sorted(set(a) & set(b))
+			assert ordinals_from_bits(a_bits | b_bits) == sorted(set(a) | set(b))
+			assert ordinals_from_bits(a_bits & ~b_bits) == sorted(set(a) - set(b))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_counter_at_least_matches_brute_force(seed):
+	rnd = random.Random(seed)
+	n_bits = 150
+	full_bits = (1 << n_bits) - 1
+	bitsets = [bits_from_ordinals(rnd.sample(range(n_bits), rnd.randint(0, n_bits))) for _ in range(rnd.randint(0, 13))]
+	planes = bit_sliced_counter(bitsets)
+	counts = [sum((x >> i) & 1 for x in bitsets) for i in range(n_bits)]
+	# The planes are the counts, bit by bit:
+	assert [sum(((plane >> i) & 1) << j for j, plane in enumerate(planes)) for i in range(n_bits)] == counts
+	for n in range(-1, len(bitsets) + 3):
+		expected = bits_from_ordinals([i for i, x in enumerate(counts) if x >= n])
+		assert counter_at_least(planes, n, full_bits) == expected, n
+
+
+def _random_keys(rnd: random.Random, n: int, floats: bool):
+	# Plenty of ties: the order of equal keys is what's easy to get wrong.
+	if floats:
+		return [round(rnd.uniform(0, 3), 1) for _ in range(n)]
+	return [rnd.randint(0, 5) for _ in range(n)]
+
+
+@pytest.mark.parametrize('floats', [False, True])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_sorted_positions_are_a_stable_sort(np, floats, reverse):
+	rnd = random.Random(1)
+	for n in (0, 1, 2, 10, 257):
+		values = _random_keys(rnd, n, floats)
+		expected = sorted(range(n), key=values.__getitem__, reverse=reverse)
+		assert sorted_positions(_keys(np, values), reverse=reverse) == expected
+
+
+@pytest.mark.parametrize('floats', [False, True])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_top_positions_are_the_head_of_the_full_sort(np, floats, reverse):
+	rnd = random.Random(2)
+	for n_keys in (0, 1, 30, 500):
+		values = _random_keys(rnd, n_keys, floats)
+		expected = sorted(range(n_keys), key=values.__getitem__, reverse=reverse)
+		for n in (-1, 0, 1, 2, 5, n_keys // 10, n_keys // 2, n_keys - 1, n_keys, n_keys + 5):
+			assert top_positions(_keys(np, values), n, reverse=reverse) == expected[:max(n, 0)], n
+
+
+def test_values_range_bits(np):
+	values = _random_keys(random.Random(3), 200, floats=True)
+	for min_value, max_value in ((None, None), (1, None), (None, 1.5), (0.5, 2.5), (2, 1)):
+		expected = bits_from_ordinals([
+			i for i, x in enumerate(values)
+			if (min_value is None or min_value <= x) and (max_value is None or x <= max_value)
+		])
+		assert values_range_bits(_keys(np, values), min_value, max_value) == expected
+
+
+def test_keyword_groups_matrix(np):
+	rnd = random.Random(4)
+	n_stories = 100
+	ordinals_by_group = [sorted(rnd.sample(range(n_stories), rnd.randint(0, 40))) for _ in range(7)]
+	weights = [rnd.choice([-2, 0.5, 1, 3]) for _ in ordinals_by_group]
+	matrix = KeywordGroupsMatrix(n_stories, ordinals_by_group)
+	assert list(matrix.hit_counts()) == [sum(i in x for x in ordinals_by_group) for i in range(n_stories)]
+	expected_sums = [sum(w for x, w in zip(ordinals_by_group, weights) if i in x) for i in range(n_stories)]
+	assert list(matrix.weighted_sums(weights)) == pytest.approx(expected_sums)
+
+
+def test_index_columns_and_bits(np, db):
+	index = db.rating_min(0).stories.index
+	stories = [index.story(i) for i in range(len(index))]
+	all_ordinals = list(range(len(index)))
+	full_bits = bits_from_ordinals(all_ordinals)
+	for kw in ('kw1', 'orgy', 'no-such-keyword'):
+		assert ordinals_from_bits(index.keyword_bits(kw)) == [i for i, s in enumerate(stories) if kw in s.keywords]
+	assert ordinals_from_bits(index.all_keywords_bits(['kw1', 'kw2'], full_bits)) == [
+		i for i, s in enumerate(stories) if {'kw1', 'kw2'} <= set(s.keywords)
+	]
+	assert ordinals_from_bits(index.value_bits('author', 'author2')) == [
+		i for i, s in enumerate(stories) if s.author == 'author2'
+	]
+	assert ordinals_from_bits(index.column_range_bits('rating', 2, 3.5)) == [
+		i for i, s in enumerate(stories) if 2 <= s.rating <= 3.5
+	]
+	assert list(index.column_values('rating', all_ordinals, step=0.5)) == [int(s.rating * 2.0) for s in stories]
+	assert list(index.column_values('word_count', all_ordinals)) == [s.word_count for s in stories]
@@ -0,0 +1,115 @@
+# encoding: utf-8
+"""Streamed and sharded output against the original all-at-once formatting of the story pool."""
+
+import json
+import random
+
+import pytest
+
+from .. import DataSetDB
+from .._dataset_db import _output_stories_separator, _split_to_capped_shards, _split_to_n_shards
+from . import _reference as ref
+
+
+def _read(file_path) -> str:
+	with open(file_path, 'r', encoding='utf-8', newline='\n') as file_handle:
+		return file_handle.read()
+
+
+@pytest.mark.parametrize('max_stories', [-1, -5, 0, 1, 10, None, 10000])
+def test_output_text_matches_reference(db, max_stories):
+	for variant in (db, db.sorted_by_rating(), db.lazy().sorted_by_rating().pages_min(2)):
+		expected = ref.output_text(variant.stories, max_stories)
+		assert variant.dumped_as_output_text(max_stories) == expected
+		assert list(variant.iter_output_text(max_stories)) == expected
+
+
+def test_output_file_matches_reference(db, tmp_path):
+	file_path = tmp_path / 'out.txt'
+	db.dump_to_output_txt_file(file_path, 20)
+	assert _read(file_path) == ''.join(ref.output_text(db.stories, 20))
+	db.with_keywords('no-such-keyword').dump_to_output_txt_file(file_path)
+	assert _read(file_path) == ''
+
+
+@pytest.mark.parametrize('limit_name', ['max_chars', 'max_bytes', 'max_words'])
+def test_size_limits_never_cut_stories(db, limit_name):
+	pieces = ref.output_text(db.stories, max_stories=None)
+	measure_f = {
+		'max_chars': len, 'max_bytes': lambda x: len(x.encode('utf-8')), 'max_words': lambda x: len(x.split()),
+	}[limit_name]
+	for limit in (0, measure_f(pieces[0]) - 1, measure_f(pieces[0]), 1000, 10 ** 9):
+		expected = list()
+		total = 0
+		for piece in pieces:
+			total += measure_f(piece)
+			if total > limit:
+				break
+			expected.append(piece)
+		assert list(db.iter_output_text(None, **{limit_name: limit})) == expected, limit
+
+
+def _random_stories(db: DataSetDB, n: int, seed: int):
+	stories = list(db.stories.values())
+	return random.Random(seed).sample(stories, min(n, len(stories)))
+
+
+@pytest.mark.parametrize('n_shards', [1, 2, 3, 7, 299, 1000])
+def test_split_to_n_shards(db, n_shards):
+	for n_stories in (0, 1, 5, 300):
+		stories = _random_stories(db, n_stories, seed=n_shards)
+		shards = _split_to_n_shards(stories, n_shards)
+		assert [x for shard in shards for x in shard] == stories
+		assert all(shards)
+		assert len(shards) <= min(n_shards, max(n_stories, 1))
+		if n_stories >= n_shards * 10:
+			# Roughly equal by word count: no shard is more than twice as big as the average one, plus a story.
+			total_words = sum(x.word_count for x in stories)
+			max_story_words = max(x.word_count for x in stories)
+			for shard in shards:
+				assert sum(x.word_count for x in shard) <= 2 * total_words / n_shards + max_story_words
+
+
+@pytest.mark.parametrize('max_shard_bytes', [1, 100, 5000, 50000, 10 ** 9])
+def test_split_to_capped_shards(db, max_shard_bytes):
+	separator_size = len(_output_stories_separator.encode('utf-8'))
+	rnd = random.Random(max_shard_bytes)
+	stories = _random_stories(db, 300, seed=0)
+	sizes = [rnd.randint(1, 3000) for _ in stories]
+	shards = _split_to_capped_shards(stories, sizes, max_shard_bytes)
+	assert [x for shard in shards for x in shard] == stories
+
+	size_by_story = dict(zip(map(id, stories), sizes))
+	shard_sizes = [
+		sum(size_by_story[id(x)] for x in shard) + separator_size * (len(shard) - 1) for shard in shards
+	]
+	for shard, shard_size in zip(shards, shard_sizes):
+		assert shard_size <= max_shard_bytes or len(shard) == 1
+	# Greedy: no shard could take the next story in.
+	for shard_size, next_shard in zip(shard_sizes, shards[1:]):
+		assert shard_size + separator_size + size_by_story[id(next_shard[0])] > max_shard_bytes
+
+
+# Only a couple of cases in worker processes: they're slow to start.
+@pytest.mark.parametrize('shards, max_shard_bytes, workers', [
+	(1, None, 1), (4, None, 1), (1000, None, 1), (None, 3000, 1), (None, 1, 1), (4, None, 2), (None, 3000, 2),
+])
+def test_shards_concatenation_matches_the_whole_output(db, tmp_path, shards, max_shard_bytes, workers):
+	db = db.sorted_by_rating()
+	file_path = tmp_path / 'combined.txt'
+	shard_paths = db.dump_to_output_txt_shards(file_path, shards=shards, max_shard_bytes=max_shard_bytes, workers=workers)
+	shard_texts = [_read(x) for x in shard_paths]
+	assert _output_stories_separator.join(shard_texts) == ''.join(ref.output_text(db.stories, max_stories=None))
+	if max_shard_bytes is not None:
+		assert all(len(x.encode('utf-8')) <= max_shard_bytes or _output_stories_separator not in x for x in shard_texts)
+
+	with open(tmp_path / 'combined.manifest.json', 'r', encoding='utf-8') as manifest_file:
+		manifest = json.load(manifest_file)
+	assert [x['file'] for x in manifest['shards']] == [x.name for x in shard_paths]
+	assert [x['bytes'] for x in manifest['shards']] == [x.stat().st_size for x in shard_paths]
+	assert [story_id for x in manifest['shards'] for story_id in x['stories']] == list(db.stories)
+
+
+def test_shards_and_size_are_exclusive(db, tmp_path):
+	with pytest.raises(ValueError):
+		db.dump_to_output_txt_shards(tmp_path / 'x.txt', shards=2, max_shard_bytes=100)
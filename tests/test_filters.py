@@ -0,0 +1,148 @@
+# encoding: utf-8
+"""Index-backed filters, sorts and stats against the original dict-based ones."""
+
+import pytest
+
+from .. import DataSetDB, KeywordGroups
+from . import _reference as ref
+from . import _synthetic
+
+_groups = (('kw1', 'kw2'), 'kw3', ['brother', 'twins', 'kw4'], ('orgy', ))
+_weights = {('kw1', 'kw2'): 2, 'kw3': -1.5, ('brother', 'twins'): 0.5, 'kw5': 3}
+
+_hits_f = ref.keyword_group_hits_f(*_groups)
+_weight_f = ref.keyword_group_weight_f(_weights)
+_from_categories = ('Gay Male', 'Group Sex')
+
+# (method name, args, the original filter):
+_filters = [
+	('with_authors', ('author1', 'author3'), lambda s: s.author in ('author1', 'author3')),
+	('not_authors', ('author1', 'author3'), lambda s: s.author not in ('author1', 'author3')),
+	('with_categories', ('Gay Male', ), lambda s: s.category == 'Gay Male'),
+	('not_categories', ('Gay Male', 'Incest/Taboo'), lambda s: s.category not in ('Gay Male', 'Incest/Taboo')),
+	('with_keywords', ('kw1', ), lambda s: 'kw1' in s.keywords),
+	('with_keywords', ('kw1', 'kw2'), lambda s: {'kw1', 'kw2'} <= set(s.keywords)),
+	('with_keywords', ('no-such-keyword', ), lambda s: False),
+	('not_keywords', ('kw1', 'kw2'), lambda s: not {'kw1', 'kw2'} & set(s.keywords)),
+	('keyword_hits_min', (2, *_groups), lambda s: _hits_f(s) >= 2),
+	('keyword_hits_max', (1, *_groups), lambda s: _hits_f(s) <= 1),
+	('keyword_hits_range', (1, 2, *_groups), lambda s: 1 <= _hits_f(s) <= 2),
+	('keyword_weights_min', (1.5, _weights), lambda s: _weight_f(s) >= 1.5),
+	('keyword_weights_max', (0, _weights), lambda s: _weight_f(s) <= 0),
+	('keyword_weights_range', (-1, 2, _weights), lambda s: -1 <= _weight_f(s) <= 2),
+	('rating_min', (3.5, ), lambda s: s.rating >= 3.5),
+	('rating_max', (2.0, ), lambda s: s.rating <= 2.0),
+	('rating_range', (2.5, 4), lambda s: 2.5 <= s.rating <= 4),
+	('pages_min', (3, ), lambda s: s.page_count >= 3),
+	('pages_max', (2, ), lambda s: s.page_count <= 2),
+	('pages_range', (2, 4), lambda s: 2 <= s.page_count <= 4),
+	('words_min', (4500, ), lambda s: s.word_count >= 4500),
+	('words_max', (1000.5, ), lambda s: s.word_count <= 1000.5),
+	('words_range', (100, 5000), lambda s: 100 <= s.word_count <= 5000),
+]
+
+
+def _keywords_from_categories(db: DataSetDB):
+	return {kw for x in _from_categories for kw in db.categories[x].keywords}
+
+
+def _db_variants(db: DataSetDB):
+	"""The same stories: as given, re-ordered, as views over the index, and lazy."""
+	return {
+		'dict': db,
+		'sorted': db.sorted_by_rating(),
+		'view': db.rating_min(0),
+		'lazy': db.lazy(),
+	}
+
+
+@pytest.mark.parametrize('method_name, args, ok_f', _filters, ids=[f'{x[0]}-{i}' for i, x in enumerate(_filters)])
+def test_filter_matches_reference(db, method_name, args, ok_f):
+	for variant_name, variant in _db_variants(db).items():
+		expected = ref.filtered(variant.stories, ok_f)
+		result = getattr(variant, method_name)(*args)
+		assert list(result.stories) == list(expected), variant_name
+
+
+def test_keywords_from_categories(db):
+	keywords = _keywords_from_categories(db)
+	for variant_name, variant in _db_variants(db).items():
+		with_kw = variant.with_keywords_from_categories(*_from_categories)
+		assert list(with_kw.stories) == list(ref.filtered(variant.stories, lambda s: bool(keywords & set(s.keywords))))
+		not_kw = variant.not_keywords_from_categories(*_from_categories)
+		assert list(not_kw.stories) == list(ref.filtered(variant.stories, lambda s: not keywords & set(s.keywords)))
+
+
+def test_chained_filters(db):
+	expected = ref.filtered(
+		db.stories, lambda s: s.rating >= 2 and 'kw1' not in s.keywords and _hits_f(s) >= 1 and s.page_count <= 4
+	)
+	result = db.rating_min(2).not_keywords('kw1').keyword_hits_min(1, *_groups).pages_max(4)
+	assert list(result.stories) == list(expected)
+
+
+def test_compiled_keyword_groups_match_raw_ones(db):
+	groups = KeywordGroups(_groups)
+	assert list(db.keyword_hits_min(2, groups).stories) == list(db.keyword_hits_min(2, *_groups).stories)
+	assert list(db.sorted_by_max_keyword_hits(groups).stories) == list(db.sorted_by_max_keyword_hits(*_groups).stories)
+	weights = KeywordGroups(_weights)
+	assert list(db.keyword_weights_min(1.5, weights).stories) == list(db.keyword_weights_min(1.5, _weights).stories)
+	assert (
+		list(db.sorted_by_max_keywords_weight(weights).stories) == list(db.sorted_by_max_keywords_weight(_weights).stories)
+	)
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_sorts_match_reference(db, descending):
+	cases = [
+		(db.sorted_by_rating(descending=descending), lambda s: s.rating),
+		(db.sorted_by_rating(step=0.5, descending=descending), lambda s: int(s.rating * 2.0)),
+		(db.sorted_by_max_keyword_hits(*_groups, descending=descending), _hits_f),
+		(db.sorted_by_max_keywords_weight(_weights, descending=descending), _weight_f),
+	]
+	for result, key in cases:
+		assert list(result.stories) == list(ref.sorted_stories(db.stories, key, reverse=descending))
+
+
+@pytest.mark.parametrize('top', [0, 1, 7, 299, 1000])
+def test_top_matches_full_sort(db, top):
+	"""Partial sort keeps exactly the first stories of the full (stable) sort."""
+	for variant in (db, db.lazy()):
+		assert list(variant.sorted_by_rating(top=top).stories) == list(variant.sorted_by_rating().stories)[:top]
+		assert (
+			list(variant.sorted_by_max_keywords_weight(_weights, descending=False, top=top).stories)
+			== list(variant.sorted_by_max_keywords_weight(_weights, descending=False).stories)[:top]
+		)
+
+
+def test_sort_then_limit_in_dump_matches_full_sort(db):
+	full = db.sorted_by_max_keyword_hits(*_groups).dumped_as_output_text(10)
+	assert db.lazy().sorted_by_max_keyword_hits(*_groups).dumped_as_output_text(10) == full
+
+
+def test_stats_match_reference(db):
+	for variant_name, variant in _db_variants(db).items():
+		for filtered_db in (variant, variant.rating_min(3.5), variant.with_keywords('kw1')):
+			assert list(filtered_db.keyword_hits.items()) == list(ref.value_hits(filtered_db.stories, 'keywords').items())
+			assert list(filtered_db.author_hits.items()) == list(ref.value_hits(filtered_db.stories, 'author').items())
+			assert list(filtered_db.category_hits.items()) == list(ref.value_hits(filtered_db.stories, 'category').items())
+
+
+def test_stats_follow_modifications(db):
+	view = db.rating_min(0)
+	assert view.keyword_hits == ref.value_hits(view.stories, 'keywords')
+	story_id = next(iter(view.stories))
+	del view.stories[story_id]
+	assert list(view.keyword_hits.items()) == list(ref.value_hits(view.stories, 'keywords').items())
+
+
+def test_compact_stories_give_the_same_results():
+	stories = _synthetic.stories()
+	compact_stories = _synthetic.stories()
+	for story in compact_stories.values():
+		story.compact()
+	db = DataSetDB(_synthetic.categories(stories), stories)
+	compact_db = DataSetDB(_synthetic.categories(compact_stories), compact_stories)
+	for method_name, args, _ in _filters:
+		assert list(getattr(compact_db, method_name)(*args).stories) == list(getattr(db, method_name)(*args).stories)
+	assert compact_db.keyword_hits == db.keyword_hits
@@ -0,0 +1,177 @@
+# encoding: utf-8
+"""Lazy plans against eager step-by-step execution, and the fusion of steps within a plan."""
+
+import random
+
+import pytest
+
+from .. import DataSetDB
+from .._query_plan import (
+	cost_column_bits, cost_predicate, execute_plan, FilterStep, LimitStep, SelectStep, SortStep, split_trailing_sorts,
+)
+from .._story_index import ordinals_from_bits, StoryIndex
+from . import _reference as ref
+
+_groups = (('kw1', 'kw2'), 'kw3', ('brother', 'twins'))
+_hits_f = ref.keyword_group_hits_f(*_groups)
+
+# (name, DB method call, the original step over a stories dict):
+_steps = [
+	('rating_min', lambda db: db.rating_min(2.5), lambda s: ref.filtered(s, lambda x: x.rating >= 2.5)),
+	('pages_max', lambda db: db.pages_max(3), lambda s: ref.filtered(s, lambda x: x.page_count <= 3)),
+	('not_keywords', lambda db: db.not_keywords('kw4'), lambda s: ref.filtered(s, lambda x: 'kw4' not in x.keywords)),
+	('not_authors', lambda db: db.not_authors('author0'), lambda s: ref.filtered(s, lambda x: x.author != 'author0')),
+	('hits_min', lambda db: db.keyword_hits_min(1, *_groups), lambda s: ref.filtered(s, lambda x: _hits_f(x) >= 1)),
+	('by_rating', lambda db: db.sorted_by_rating(), lambda s: ref.sorted_stories(s, lambda x: x.rating, reverse=True)),
+	(
+		'by_rating_step', lambda db: db.sorted_by_rating(step=1, descending=False),
+		lambda s: ref.sorted_stories(s, lambda x: int(x.rating)),
+	),
+	(
+		'by_hits', lambda db: db.sorted_by_max_keyword_hits(*_groups),
+		lambda s: ref.sorted_stories(s, _hits_f, reverse=True),
+	),
+	('limited', lambda db: db.limited(120), lambda s: dict(list(s.items())[:120])),
+	('limited_negative', lambda db: db.limited(-10), lambda s: dict(list(s.items())[:-10])),
+	(
+		'top', lambda db: db.sorted_by_rating(descending=False, top=50),
+		lambda s: dict(list(ref.sorted_stories(s, lambda x: x.rating).items())[:50]),
+	),
+]
+
+
+def _random_chains(n_chains=60, seed=0):
+	rnd = random.Random(seed)
+	return [[rnd.choice(_steps) for _ in range(rnd.randint(1, 6))] for _ in range(n_chains)]
+
+
+def _chain_id(chain):
+	return '+'.join(x[0] for x in chain)
+
+
+@pytest.mark.parametrize('chain', _random_chains(), ids=_chain_id)
+def test_lazy_and_eager_chains_match_reference(db, chain):
+	expected = dict(db.stories)
+	eager, lazy = db, db.lazy()
+	for _, db_f, ref_f in chain:
+		expected = ref_f(expected)
+		eager, lazy = db_f(eager), db_f(lazy)
+	assert lazy.is_lazy and not eager.is_lazy
+	assert list(eager.stories) == list(expected)
+	assert list(lazy.stories) == list(expected)
+	# Once executed, the plan is gone, and the DB stays lazy:
+	assert list(lazy.rating_min(0).stories) == list(expected)
+
+
+@pytest.mark.parametrize('chain', _random_chains(20, seed=1), ids=_chain_id)
+@pytest.mark.parametrize('max_stories', [0, 1, 25, 1000])
+def test_lazy_dump_limit_matches_eager_one(db, chain, max_stories):
+	eager, lazy = db, db.lazy()
+	for _, db_f, _ in chain:
+		eager, lazy = db_f(eager), db_f(lazy)
+	assert lazy.dumped_as_output_text(max_stories) == eager.dumped_as_output_text(max_stories)
+
+
+def test_barriers_keep_their_place_in_lazy_plan(db):
+	"""Near-duplicates selection and broken stories extraction depend on the steps before them."""
+	for db_f in (
+		lambda x: x.sorted_by_rating(descending=False).without_near_duplicates(0.5).limited(40).pages_min(2),
+		lambda x: x.limited(100).filter_out_broken_stories().rating_min(2).sorted_by_rating(),
+		lambda x: x.rating_min(2).filter_out_broken_stories().limited(-5).without_near_duplicates(),
+	):
+		eager, lazy = db_f(db), db_f(db.lazy())
+		assert list(lazy.stories) == list(eager.stories)
+		assert list(lazy.broken_stories) == list(eager.broken_stories)
+
+
+def test_broken_stories_are_extracted(db):
+	expected_broken = ref.filtered(db.stories, lambda s: s.text.rstrip().endswith('COVID-19 RESOURCES'))
+	assert expected_broken
+	for result in (db.filter_out_broken_stories(), db.lazy().filter_out_broken_stories()):
+		assert list(result.broken_stories) == list(expected_broken)
+		assert list(result.stories) == [x for x in db.stories if x not in expected_broken]
+	# Extracted again after a re-sort: they're merged by ID, in place.
+	twice = db.filter_out_broken_stories().union(db).sorted_by_rating().filter_out_broken_stories()
+	assert list(twice.broken_stories) == list(expected_broken)
+
+
+def _counting(f, calls: list):
+	def counting_f(*args):
+		calls.append(args)
+		return f(*args)
+
+	return counting_f
+
+
+def test_filters_are_fused_cheapest_first(db):
+	index = StoryIndex()
+	stories = index.view(db.stories)
+	predicate_calls, sort_calls = list(), list()
+	plan = (
+		# A predicate given first is still evaluated only for the stories left after the cheaper filters:
+		FilterStep(ok_f=_counting(lambda s: s.author != 'author1', predicate_calls)),
+		SortStep(key_f=_counting(lambda s: s.word_count, sort_calls)),
+		FilterStep(bits_f=lambda i, bits: i.column_range_bits('rating', 3, None) & bits, cost=cost_column_bits),
+		FilterStep(bits_f=lambda i, bits: i.keyword_bits('kw1') & bits, cost=0),
+	)
+	result, broken = execute_plan(stories, index.view(dict()), plan)
+	expected = ref.sorted_stories(
+		ref.filtered(db.stories, lambda s: s.rating >= 3 and 'kw1' in s.keywords and s.author != 'author1'),
+		lambda s: s.word_count,
+	)
+	assert list(result) == list(expected)
+	assert not broken
+	n_after_bits = len(ref.filtered(db.stories, lambda s: s.rating >= 3 and 'kw1' in s.keywords))
+	assert len(predicate_calls) == n_after_bits
+	# The sort is done after all the filters, and its key is evaluated once per story:
+	assert len(sort_calls) == len(expected)
+
+
+def test_limit_after_sort_is_a_partial_sort(db):
+	index = StoryIndex()
+	stories = index.view(db.stories)
+	empty = index.view(dict())
+	sort_step = SortStep(key_f=lambda s: s.rating, reverse=True)
+	full, _ = execute_plan(stories, empty, (sort_step, ))
+	for n in (0, 1, 10, -10, 10000):
+		limited, _ = execute_plan(stories, empty, (sort_step, LimitStep(n)))
+		expected = list(full)[:n] if n >= 0 else list(full)[:max(0, len(full) + n)]
+		assert list(limited) == expected
+
+
+def test_split_trailing_sorts():
+	f1, f2 = FilterStep(ok_f=bool), FilterStep(bits_f=lambda i, bits: bits, cost=cost_column_bits)
+	s1, s2 = SortStep(key_f=id), SortStep(key_f=hash, reverse=True)
+	limit, select = LimitStep(5), SelectStep(lambda stories: [True] * len(stories))
+	assert split_trailing_sorts(()) == ((), ())
+	assert split_trailing_sorts((f1, s1, f2, s2)) == ((f1, f2), (s1, s2))
+	assert split_trailing_sorts((s1, limit, f1, s2)) == ((s1, limit, f1), (s2, ))
+	assert split_trailing_sorts((s1, select)) == ((s1, select), ())
+	assert split_trailing_sorts((f1, s1, limit)) == ((f1, s1, limit), ())
+
+
+def test_split_plan_gives_the_same_result(db):
+	index = StoryIndex()
+	stories, empty = index.view(db.stories), index.view(dict())
+	plan = (
+		FilterStep(ok_f=lambda s: s.page_count > 1, cost=cost_predicate),
+		SortStep(key_f=lambda s: s.author),
+		LimitStep(200),
+		SortStep(key_f=lambda s: s.rating, reverse=True),
+		FilterStep(bits_f=lambda i, bits: bits & ~i.keyword_bits('kw2')),
+		SortStep(key_f=lambda s: len(s.keywords)),
+	)
+	head, sorts = split_trailing_sorts(plan)
+	whole, _ = execute_plan(stories, empty, plan)
+	split, _ = execute_plan(*execute_plan(stories, empty, head), sorts)
+	assert list(split) == list(whole)
+	assert ordinals_from_bits(whole.bits) == sorted(whole.ordinals)
+
+
+def test_eager_and_lazy_conversions(db):
+	lazy = db.lazy().rating_min(3)
+	assert lazy.is_lazy
+	eager = lazy.eager()
+	assert not eager.is_lazy
+	assert list(eager.stories) == list(db.rating_min(3).stories)
+	assert isinstance(eager, DataSetDB) and eager.lazy().is_lazy
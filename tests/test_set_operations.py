@@ -0,0 +1,118 @@
+# encoding: utf-8
+"""Set operations on DBs against the same operations on plain dicts, matched by story ID."""
+
+from attrs import evolve
+import pytest
+
+from .. import DataSetDB
+from . import _synthetic
+
+
+def _ref_union(a: dict, b: dict) -> dict:
+	return {**a, **{k: v for k, v in b.items() if k not in a}}
+
+
+def _ref_intersection(a: dict, b: dict) -> dict:
+	return {k: v for k, v in a.items() if k in b}
+
+
+def _ref_difference(a: dict, b: dict) -> dict:
+	return {k: v for k, v in a.items() if k not in b}
+
+
+_operations = [
+	('union', DataSetDB.union, DataSetDB.__or__, _ref_union),
+	('intersection', DataSetDB.intersection, DataSetDB.__and__, _ref_intersection),
+	('difference', DataSetDB.difference, DataSetDB.__sub__, _ref_difference),
+]
+
+
+def _operands(db: DataSetDB):
+	"""Overlapping DBs, in different orders: `{name: DB}`."""
+	return {
+		'high': db.rating_min(3).sorted_by_rating(),
+		'low': db.rating_max(3.5),
+		'kw1': db.with_keywords('kw1').sorted_by_rating(descending=False),
+		'lazy_pages': db.lazy().pages_min(3),
+		'empty': db.with_keywords('no-such-keyword'),
+		'all': db,
+	}
+
+
+def _items(stories) -> list:
+	return [(k, id(v)) for k, v in stories.items()]
+
+
+@pytest.mark.parametrize('name, method, operator, ref_f', _operations, ids=[x[0] for x in _operations])
+def test_matches_dict_semantics(db, name, method, operator, ref_f):
+	operands = _operands(db)
+	for a_name, a in operands.items():
+		for b_name, b in operands.items():
+			expected = ref_f(dict(a.stories), dict(b.stories))
+			for result in (method(a, b), operator(a, b)):
+				assert _items(result.stories) == _items(expected), (a_name, b_name)
+
+
+@pytest.mark.parametrize('name, method, operator, ref_f', _operations, ids=[x[0] for x in _operations])
+def test_several_others(db, name, method, operator, ref_f):
+	a, b, c = db.rating_min(2), db.with_keywords('kw2'), db.sorted_by_rating().limited(100)
+	expected = ref_f(ref_f(dict(a.stories), dict(b.stories)), dict(c.stories))
+	assert _items(method(a, b, c).stories) == _items(expected)
+	assert _items(operator(operator(a, b), c).stories) == _items(expected)
+
+
+def test_replaced_stories_are_matched_by_id(db):
+	a = db.rating_min(2)
+	b = db.rating_max(4)
+	shared_id = next(x for x in a.stories if x in b.stories)
+	only_a_id = next(x for x in a.stories if x not in b.stories)
+	# After the replacement, `a` has a new version of the story, while `b` still has the old one:
+	new_story = evolve(a.stories[shared_id], title='New')
+	a.stories[shared_id] = new_story
+	b.stories[only_a_id] = evolve(a.stories[only_a_id])
+	a_dict, b_dict = dict(a.stories), dict(b.stories)
+	for method, ref_f in ((DataSetDB.union, _ref_union), (DataSetDB.intersection, _ref_intersection)):
+		assert _items(method(a, b).stories) == _items(ref_f(a_dict, b_dict))
+		assert _items(method(b, a).stories) == _items(ref_f(b_dict, a_dict))
+	assert _items((a - b).stories) == _items(_ref_difference(a_dict, b_dict))
+	assert _items((b - a).stories) == _items(_ref_difference(b_dict, a_dict))
+	assert (a | b).stories[shared_id] is new_story
+	assert (a & b).stories[shared_id] is new_story
+	assert (b & a).stories[shared_id] is not new_story
+
+
+def test_dbs_with_different_indexes(db):
+	other_stories = _synthetic.stories(n=100, seed=1)
+	other_stories['extra-story'] = evolve(next(iter(other_stories.values())), id='extra-story')
+	other = DataSetDB(_synthetic.categories(other_stories), other_stories).rating_min(1)
+	a = db.rating_min(2)
+	a_dict, other_dict = dict(a.stories), dict(other.stories)
+	assert _items((a | other).stories) == _items(_ref_union(a_dict, other_dict))
+	assert _items((other | a).stories) == _items(_ref_union(other_dict, a_dict))
+	assert _items((a & other).stories) == _items(_ref_intersection(a_dict, other_dict))
+	assert _items((a - other).stories) == _items(_ref_difference(a_dict, other_dict))
+
+
+def test_broken_stories_and_categories(db):
+	a = db.rating_min(2).filter_out_broken_stories()
+	b = db.limited(150).filter_out_broken_stories()
+	a_broken, b_broken = dict(a.broken_stories), dict(b.broken_stories)
+	assert _items((a | b).broken_stories) == _items(_ref_union(a_broken, b_broken))
+	assert _items((a & b).broken_stories) == _items(_ref_union(a_broken, b_broken))
+	assert _items((a - b).broken_stories) == _items(a_broken)
+	assert list((a | b).categories) == list(db.categories)
+
+
+def test_operands_are_not_modified(db):
+	a, b = db.rating_min(2), db.rating_max(3)
+	a_items, b_items = _items(a.stories), _items(b.stories)
+	result = a | b
+	del result.stories[next(iter(result.stories))]
+	result.stories['new-story'] = next(iter(db.stories.values()))
+	assert _items(a.stories) == a_items
+	assert _items(b.stories) == b_items
+
+
+def test_non_db_operands():
+	with pytest.raises(TypeError):
+		DataSetDB(dict(), dict()) | dict()
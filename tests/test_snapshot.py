@@ -0,0 +1,195 @@
+# encoding: utf-8
+"""Binary snapshots and the other caches derived from the dataset: the same data as parsed JSON, and invalidation."""
+
+import typing as _t
+
+import gc
+import json
+import os
+from pathlib import Path
+import time
+
+import pytest
+
+from .. import Category, DataSetDB, DataSetLoader, Story
+from . import _synthetic
+
+_story_fields = (
+	'id', 'title', 'url', 'category', 'rating', 'description', 'text', 'page_count', 'word_count', 'author',
+	'date_approved',
+)
+_snapshots_pattern = '*.snapshot.pickle'
+_text_stores_pattern = '*.texts.*.bin'
+
+
+def _story_data(story: Story) -> tuple:
+	return (*(getattr(story, x) for x in _story_fields), tuple(sorted(story.keywords)))
+
+
+def _loaded_data(loader: DataSetLoader) -> tuple:
+	categories, stories = loader.load_all()
+	return categories, [(story_id, _story_data(story)) for story_id, story in stories.items()]
+
+
+def _parsed_json_data(dataset_root: Path, **loader_kwargs) -> tuple:
+	return _loaded_data(DataSetLoader(root_dir=dataset_root, use_snapshot=False, **loader_kwargs))
+
+
+def _files(dataset_root: Path, pattern: str) -> _t.List[str]:
+	return sorted(x.name for x in (dataset_root / _synthetic.dataset_repo_subdir).glob(pattern))
+
+
+def _modified_story_file(dataset_root: Path, category: str, **changes) -> str:
+	"""
+	Change the stories in the category's JSON file, making it newer than any cache. Returns the file name.
+	The ones which are in other categories, too, are left as they are: their copies have to be the same.
+	"""
+	dataset_dir = dataset_root / _synthetic.dataset_repo_subdir / _synthetic.dataset_name
+	file_name = Category.json_filenames_of(category)[1]
+	file_path = dataset_dir / file_name
+	with open(file_path, 'r', encoding='utf-8') as file_handle:
+		stories = json.load(file_handle)
+	with open(dataset_dir / 'story_list_by_category.json', 'r', encoding='utf-8') as file_handle:
+		shared_ids = {
+			story_id for other_category, story_ids in json.load(file_handle).items() if other_category != category
+			for story_id in story_ids
+		}
+	for story_id, story_dict in stories.items():
+		if story_id not in shared_ids:
+			story_dict.update(changes)
+	with open(file_path, 'w', encoding='utf-8') as file_handle:
+		json.dump(stories, file_handle)
+	future_time = time.time() + 10
+	os.utime(file_path, (future_time, future_time))
+	return file_name
+
+
+_loading_modes = {
+	'default': dict(),
+	'lazy_text': dict(lazy_text=True),
+	'compact': dict(compact=True),
+	'lazy_compact': dict(lazy_text=True, compact=True),
+	'subset': dict(categories=['Gay Male', 'Group Sex']),
+	'subset_lazy': dict(categories=['Incest/Taboo'], lazy_text=True),
+}
+
+
+@pytest.mark.parametrize('mode', _loading_modes)
+def test_snapshot_matches_parsed_json(dataset_root, mode):
+	loader_kwargs = _loading_modes[mode]
+	expected = _parsed_json_data(dataset_root, **loader_kwargs)
+	built = _loaded_data(DataSetLoader(root_dir=dataset_root, **loader_kwargs))
+	assert len(_files(dataset_root, _snapshots_pattern)) == 1
+	loaded = _loaded_data(DataSetLoader(root_dir=dataset_root, **loader_kwargs))
+	assert built == expected
+	assert loaded == expected
+
+
+def test_each_mode_has_its_own_snapshot(dataset_root):
+	for loader_kwargs in _loading_modes.values():
+		DataSetLoader(root_dir=dataset_root, **loader_kwargs).load_all()
+	assert len(_files(dataset_root, _snapshots_pattern)) == len(_loading_modes)
+	for loader_kwargs in _loading_modes.values():
+		assert _loaded_data(DataSetLoader(root_dir=dataset_root, **loader_kwargs)) == _parsed_json_data(
+			dataset_root, **loader_kwargs
+		)
+
+
+@pytest.mark.parametrize('mode', ['default', 'lazy_text'])
+def test_modified_json_rebuilds_caches(dataset_root, mode):
+	loader_kwargs = _loading_modes[mode]
+	db = DataSetDB.load(root_dir=dataset_root, **loader_kwargs)
+	assert db.with_text_phrase('zzqx').stories == dict()
+	db.without_near_duplicates()
+
+	_modified_story_file(dataset_root, 'Group Sex', title='Modified', text='zzqx modified text')
+	expected = _parsed_json_data(dataset_root, **loader_kwargs)
+	new_db = DataSetDB.load(root_dir=dataset_root, **loader_kwargs)
+	assert _loaded_data(DataSetLoader(root_dir=dataset_root, **loader_kwargs)) == expected
+	assert [(k, _story_data(v)) for k, v in new_db.stories.items()] == expected[1]
+	modified_ids = [story_id for story_id, story in new_db.stories.items() if story.title == 'Modified']
+	assert modified_ids
+	# The text indexes are rebuilt, too:
+	assert list(new_db.with_text_phrase('zzqx').stories) == modified_ids
+	assert set(new_db.text_relevance('zzqx')) == set(modified_ids)
+	# The stories loaded before still have their texts:
+	assert all(not story.text.startswith('zzqx') for story in db.stories.values())
+
+
+def test_broken_snapshot_is_rebuilt(dataset_root):
+	expected = _parsed_json_data(dataset_root)
+	DataSetLoader(root_dir=dataset_root).load_all()
+	(snapshot_name, ) = _files(dataset_root, _snapshots_pattern)
+	snapshot_path = dataset_root / _synthetic.dataset_repo_subdir / snapshot_name
+	snapshot_path.write_bytes(snapshot_path.read_bytes()[:100])
+	assert _loaded_data(DataSetLoader(root_dir=dataset_root)) == expected
+	assert _loaded_data(DataSetLoader(root_dir=dataset_root)) == expected
+
+
+def test_missing_text_store_rebuilds_snapshot(dataset_root):
+	expected = _parsed_json_data(dataset_root, lazy_text=True)
+	DataSetLoader(root_dir=dataset_root, lazy_text=True).load_all()
+	gc.collect()
+	(text_store_name, ) = _files(dataset_root, _text_stores_pattern)
+	(dataset_root / _synthetic.dataset_repo_subdir / text_store_name).unlink()
+	assert _loaded_data(DataSetLoader(root_dir=dataset_root, lazy_text=True)) == expected
+
+
+def test_remove_snapshot(dataset_root):
+	db = DataSetDB.load(root_dir=dataset_root, lazy_text=True)
+	db.with_text_phrase('fox')
+	db.text_relevance('fox')
+	DataSetLoader(root_dir=dataset_root, categories=['Gay Male']).load_all()
+	assert len(_files(dataset_root, _snapshots_pattern)) == 2
+	assert _files(dataset_root, '*.trigrams.bin') and _files(dataset_root, '*.fulltext.bin')
+	DataSetLoader(root_dir=dataset_root).remove_snapshot()
+	assert _files(dataset_root, '*.pickle') == _files(dataset_root, '*.trigrams.bin') == []
+	assert _files(dataset_root, '*.fulltext.bin') == []
+	# Stories loaded before still read their texts from the store:
+	assert all(story.text for story in db.stories.values())
+	assert _loaded_data(DataSetLoader(root_dir=dataset_root, lazy_text=True)) == _parsed_json_data(
+		dataset_root, lazy_text=True
+	)
+
+
+def test_unpacked_files_invalidate_only_their_caches(dataset_root):
+	subsets = (['Gay Male'], ['Incest/Taboo', 'Group Sex'])
+	for categories in (None, *subsets):
+		loader = DataSetLoader(root_dir=dataset_root, categories=categories)
+		loader.load_all()
+		loader.load_trigram_index()
+	snapshots = _files(dataset_root, _snapshots_pattern)
+	assert len(snapshots) == 3
+
+	# Not a stories file of any subset: only the full dataset's caches are affected.
+	loader = DataSetLoader(root_dir=dataset_root)
+	loader._remove_unpacked_caches([Category.json_filenames_of('Sci-Fi & Fantasy')[1]])
+	assert len(_files(dataset_root, _snapshots_pattern)) == len(_files(dataset_root, '*.trigrams.bin')) == 2
+	assert all('.cats-' in x for x in _files(dataset_root, _snapshots_pattern))
+
+	loader._remove_unpacked_caches([Category.json_filenames_of('Group Sex')[0]])
+	(left_snapshot, ) = _files(dataset_root, _snapshots_pattern)
+	assert left_snapshot == DataSetLoader(root_dir=dataset_root, categories=subsets[0])._snapshot_file_path.name
+
+	loader._remove_unpacked_caches()
+	assert _files(dataset_root, _snapshots_pattern) == _files(dataset_root, '*.trigrams.bin') == []
+
+
+def test_superseded_text_stores_are_removed(dataset_root):
+	db = DataSetDB.load(root_dir=dataset_root, lazy_text=True)
+	assert len(_files(dataset_root, _text_stores_pattern)) == 1
+
+	# The first store is still in use by the stories loaded from it:
+	_modified_story_file(dataset_root, 'Gay Male', title='Modified')
+	new_db = DataSetDB.load(root_dir=dataset_root, lazy_text=True)
+	assert len(_files(dataset_root, _text_stores_pattern)) == 2
+	assert all(story.text for story in db.stories.values())
+
+	del db
+	gc.collect()
+	_modified_story_file(dataset_root, 'Gay Male', title='Modified again')
+	newest_db = DataSetDB.load(root_dir=dataset_root, lazy_text=True)
+	# The first one is gone, the second one is used by the stories of the second load:
+	assert len(_files(dataset_root, _text_stores_pattern)) == 2
+	assert all(story.text for story in new_db.stories.values())
+	assert [(k, _story_data(v)) for k, v in newest_db.stories.items()] == _parsed_json_data(dataset_root)[1]
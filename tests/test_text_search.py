@@ -0,0 +1,111 @@
+# encoding: utf-8
+"""Regex/phrase filters, pre-selected with the trigram index, against a brute-force scan of all the texts."""
+
+import random
+import re
+
+import pytest
+
+from attrs import evolve
+
+from .. import DataSetDB
+from .._data_objects import Story
+from .._text_index import regex_trigrams, text_trigrams
+from . import _synthetic
+
+_patterns = [
+	r'quick brown', r'lazy\s+dog', r'(?:fox|dog) jumps', r'br(?:o|a)ther', r'words?\b happen', r'^the', r'here$',
+	r'[a-z]+ over the', r'(?i)THE QUICK', r'x{2,}', r'a', r'o.e', r'twins', r'the (quick|lazy) (brown|dog)',
+	r'COVID-19 RESOURCES', r'(?s)script>.*RESOURCES', r'(?:some )+more', r'\bthen\b', r'(?>some) more',
+	*map(re.escape, _synthetic._tricky_words),
+]
+
+
+def _brute_force(stories, pattern, flags=0) -> list:
+	return [story_id for story_id, story in stories.items() if re.search(pattern, story.text, flags)]
+
+
+def _case_variants(word: str):
+	return {word, word.lower(), word.upper(), word.swapcase(), word.casefold(), word.title()}
+
+
+@pytest.mark.parametrize('flags', [0, re.IGNORECASE])
+@pytest.mark.parametrize('pattern', _patterns)
+def test_regex_matches_brute_force(db, pattern, flags):
+	expected = _brute_force(db.stories, pattern, flags)
+	assert list(db.with_text_regex(pattern, flags).stories) == expected
+	assert list(db.with_text_regex(re.compile(pattern, flags)).stories) == expected
+	assert list(db.not_text_regex(pattern, flags).stories) == [x for x in db.stories if x not in expected]
+
+
+def test_case_folding_matches_ignorecase(db):
+	"""Characters `re.IGNORECASE` treats as equal, while `str.lower()` doesn't: they're to be found anyway."""
+	for word in _synthetic._tricky_words:
+		for variant in _case_variants(word):
+			for phrase in (variant, f'{variant} ', variant[1:]):
+				expected = _brute_force(db.stories, re.escape(phrase), re.IGNORECASE)
+				assert list(db.with_text_phrase(phrase, ignore_case=True).stories) == expected, phrase
+				expected = _brute_force(db.stories, re.escape(phrase))
+				assert list(db.with_text_phrase(phrase).stories) == expected, phrase
+
+
+def test_regex_trigrams_are_in_every_match():
+	"""The trigrams required by a regex are a subset of the ones of any text it matches: no match is ruled out."""
+	rnd = random.Random(0)
+	texts = [story.text for story in _synthetic.stories(n=100).values()]
+	for _ in range(500):
+		text = rnd.choice(texts)
+		start = rnd.randrange(len(text))
+		phrase = text[start:start + rnd.randint(1, 12)]
+		phrase = ''.join(rnd.choice(sorted(_case_variants(x))) for x in phrase)
+		flags = rnd.choice([0, re.IGNORECASE])
+		pattern = re.escape(phrase)
+		for other_text in texts:
+			if re.search(pattern, other_text, flags):
+				assert regex_trigrams(pattern, flags) <= text_trigrams(other_text), (pattern, other_text)
+
+
+@pytest.fixture(params=[False, True], ids=['text-in-memory', 'lazy-text'])
+def loaded_db(dataset_root, request) -> DataSetDB:
+	return DataSetDB.load(root_dir=dataset_root, lazy_text=request.param)
+
+
+def test_loaded_db_matches_brute_force(loaded_db):
+	for pattern in _patterns[::3]:
+		for flags in (0, re.IGNORECASE):
+			expected = _brute_force(loaded_db.stories, pattern, flags)
+			assert list(loaded_db.with_text_regex(pattern, flags).stories) == expected, pattern
+			assert list(loaded_db.lazy().with_text_regex(pattern, flags).stories) == expected, pattern
+
+
+def test_edited_and_new_stories_are_searched(loaded_db):
+	"""The trigram index reflects the original texts: the edited and the new ones are searched through."""
+	story_ids = list(loaded_db.stories)
+	edited_story = loaded_db.stories[story_ids[3]]
+	original_word = edited_story.text.split()[0]
+	edited_story.text = 'zzqx marker'
+	loaded_db.stories['new-story'] = Story(
+		id='new-story', title='n', category='Gay Male', url='u', description='d', rating=1.0, text='new ZZQX',
+	)
+	# A replaced story (a new object under the same ID):
+	loaded_db.stories[story_ids[5]] = evolve(loaded_db.stories[story_ids[5]], text='ZzQx again')
+	assert not edited_story.is_text_original
+	assert all(loaded_db.stories[x].is_text_original for x in story_ids if x not in story_ids[3:6:2])
+	assert list(loaded_db.with_text_phrase('zzqx').stories) == [story_ids[3]]
+	assert list(loaded_db.with_text_phrase('zzqx', ignore_case=True).stories) == [story_ids[3], story_ids[5], 'new-story']
+	# The edited one no longer has its original text, which is still in the index:
+	assert story_ids[3] not in loaded_db.with_text_phrase(original_word).stories
+	assert list(loaded_db.with_text_phrase(original_word).stories) == _brute_force(loaded_db.stories, original_word)
+
+
+def test_text_relevance(db):
+	"""Ranked search: only the stories with any of the query terms are scored, and the sort puts them first."""
+	scores = db.text_relevance('brother twins')
+	assert set(scores) == {
+		story_id for story_id, story in db.stories.items()
+		if {'brother', 'twins'} & set(re.findall(r'\w+', story.text.lower()))
+	}
+	sorted_ids = list(db.sorted_by_text_relevance('brother twins').stories)
+	assert set(sorted_ids[:len(scores)]) == set(scores)
+	sorted_scores = [scores[x] for x in sorted_ids[:len(scores)]]
+	assert sorted_scores == sorted(sorted_scores, reverse=True)
@@ -0,0 +1,195 @@
+# encoding: utf-8
+"""Incremental extraction from the archive, against the archived files themselves and a full re-extraction."""
+
+import typing as _t
+
+import json
+from pathlib import Path
+from shutil import rmtree
+
+import pytest
+from py7zr import SevenZipFile
+
+from .. import Category, DataSetDB, DataSetLoader
+from . import _synthetic
+
+_modified_category = 'Group Sex'
+_subset = ['Gay Male']
+
+
+def _dataset_dir(root: Path) -> Path:
+	return root / _synthetic.dataset_repo_subdir / _synthetic.dataset_name
+
+
+def _archived(root: Path, n: int = 300, seed: int = 0) -> _t.Dict[str, bytes]:
+	"""Write the dataset and (re-)pack it into the archive, with no unpacked files left. Returns the archived files."""
+	dataset_dir = _dataset_dir(root)
+	if dataset_dir.exists():
+		rmtree(dataset_dir)
+	for volume_path in dataset_dir.parent.glob(f'{_synthetic.dataset_name}.7z.*'):
+		volume_path.unlink()
+	_synthetic.write_dataset(root, n, seed)
+	_synthetic.write_archive(dataset_dir)
+	files = {x.name: x.read_bytes() for x in dataset_dir.iterdir()}
+	rmtree(dataset_dir)
+	return files
+
+
+def _rewritten_category(
+	archived_files: _t.Dict[str, bytes], root: Path, category: str, description: str = 'changed'
+) -> _t.Dict[str, bytes]:
+	"""
+	Re-pack the archive with one category's stories file changed: the description of its stories
+	(except for the ones in other categories, too, since their copies have to be the same). Returns the archived files.
+	"""
+	dataset_dir = _dataset_dir(root)
+	stories_file_name = Category.json_filenames_of(category)[1]
+	shared_ids = {
+		story_id for other_category, story_ids in json.loads(archived_files['story_list_by_category.json']).items()
+		if other_category != category for story_id in story_ids
+	}
+	stories = json.loads(archived_files[stories_file_name])
+	for story_id, story_dict in stories.items():
+		if story_id not in shared_ids:
+			story_dict['description'] = description
+	new_files = dict(archived_files)
+	new_files[stories_file_name] = json.dumps(stories).encode('utf-8')
+	assert new_files[stories_file_name] != archived_files[stories_file_name]
+
+	tmp_root = root / 'tmp'
+	tmp_dir = _dataset_dir(tmp_root)
+	tmp_dir.mkdir(parents=True)
+	for file_name, data in new_files.items():
+		(tmp_dir / file_name).write_bytes(data)
+	for volume_path in dataset_dir.parent.glob(f'{_synthetic.dataset_name}.7z.*'):
+		volume_path.unlink()
+	for volume_path in _synthetic.write_archive(tmp_dir):
+		volume_path.rename(dataset_dir.parent / volume_path.name)
+	rmtree(tmp_root)
+	return new_files
+
+
+def _unpacked_files(root: Path) -> _t.Dict[str, bytes]:
+	return {x.name: x.read_bytes() for x in _dataset_dir(root).iterdir()}
+
+
+@pytest.fixture
+def extracted(monkeypatch) -> _t.List[str]:
+	"""The names of all the files extracted from the archive, as they're extracted."""
+	res: _t.List[str] = list()
+	extract_f, extractall_f = SevenZipFile.extract, SevenZipFile.extractall
+
+	def extract(self, path=None, targets=None, **kwargs):
+		res.extend(targets)
+		return extract_f(self, path=path, targets=targets, **kwargs)
+
+	def extractall(self, path=None, **kwargs):
+		res.extend(self.getnames())
+		return extractall_f(self, path=path, **kwargs)
+
+	monkeypatch.setattr(SevenZipFile, 'extract', extract)
+	monkeypatch.setattr(SevenZipFile, 'extractall', extractall)
+	return res
+
+
+def test_unpack_is_incremental(tmp_path, extracted):
+	archived_files = _archived(tmp_path)
+	loader = DataSetLoader(root_dir=tmp_path)
+	loader.unpack()
+	assert sorted(extracted) == sorted(archived_files)
+	assert _unpacked_files(tmp_path) == archived_files
+
+	extracted.clear()
+	loader.unpack()
+	assert extracted == []
+
+	new_files = _rewritten_category(archived_files, tmp_path, _modified_category)
+	DataSetLoader(root_dir=tmp_path).unpack()
+	assert extracted == [Category.json_filenames_of(_modified_category)[1]]
+	assert _unpacked_files(tmp_path) == new_files
+
+	# A deleted file is extracted again, and only it:
+	extracted.clear()
+	deleted_file = Category.json_filenames_of('Gay Male')[0]
+	(_dataset_dir(tmp_path) / deleted_file).unlink()
+	DataSetLoader(root_dir=tmp_path).unpack()
+	assert extracted == [deleted_file]
+	assert _unpacked_files(tmp_path) == new_files
+
+	# Forced unpacking extracts everything, with the same result:
+	extracted.clear()
+	DataSetLoader(root_dir=tmp_path).unpack(force=True)
+	assert sorted(extracted) == sorted(new_files)
+	assert _unpacked_files(tmp_path) == new_files
+
+
+def test_locally_modified_files_are_kept(tmp_path, extracted):
+	archived_files = _archived(tmp_path)
+	DataSetLoader(root_dir=tmp_path).unpack()
+	modified_file = Category.json_filenames_of(_modified_category)[1]
+	local_data = archived_files[modified_file].replace(b'"desc"', b'"local"')
+	(_dataset_dir(tmp_path) / modified_file).write_bytes(local_data)
+
+	# Neither when the archive is the same, nor when the same file is updated there:
+	for i in range(2):
+		extracted.clear()
+		DataSetLoader(root_dir=tmp_path).unpack()
+		assert modified_file not in extracted
+		assert (_dataset_dir(tmp_path) / modified_file).read_bytes() == local_data
+		archived_files = _rewritten_category(archived_files, tmp_path, _modified_category, f'changed {i}')
+
+	# Deleted, it's extracted again:
+	(_dataset_dir(tmp_path) / modified_file).unlink()
+	DataSetLoader(root_dir=tmp_path).unpack()
+	assert _unpacked_files(tmp_path) == archived_files
+
+
+def test_changed_files_invalidate_the_loaded_data(tmp_path):
+	archived_files = _archived(tmp_path)
+	loader = DataSetLoader(root_dir=tmp_path)
+	loader.unpack()
+	db = DataSetDB.load(root_dir=tmp_path)
+	assert all(story.description == 'desc' for story in db.stories.values())
+
+	_rewritten_category(archived_files, tmp_path, _modified_category)
+	loader.unpack()
+	# The extracted file keeps its in-archive modification time, so it's the unpacking that removes the snapshot:
+	new_db = DataSetDB.load(root_dir=tmp_path)
+	expected = DataSetDB.load(root_dir=tmp_path, use_snapshot=False)
+	assert [(k, v.description) for k, v in new_db.stories.items()] == [
+		(k, v.description) for k, v in expected.stories.items()
+	]
+	assert any(story.description == 'changed' for story in new_db.stories.values())
+
+
+def test_subset_is_extracted_on_demand(tmp_path, extracted):
+	archived_files = _archived(tmp_path)
+	subset_loader = DataSetLoader(root_dir=tmp_path, categories=_subset)
+	subset_loader.unpack()
+	wanted = subset_loader._wanted_files()
+	assert sorted(extracted) == sorted(x for x in archived_files if x in wanted)
+
+	subset_db = DataSetDB.load(root_dir=tmp_path, categories=_subset)
+	assert set(subset_db.categories) == set(_subset)
+	assert set(subset_db.stories) == subset_db.categories[_subset[0]].stories
+
+	# The full dataset is extracted once it's loaded, in a single pass:
+	extracted.clear()
+	full_db = DataSetDB.load(root_dir=tmp_path)
+	assert sorted(extracted) == sorted(x for x in archived_files if x not in wanted)
+	assert _unpacked_files(tmp_path) == archived_files
+	assert list(full_db.stories) == list(DataSetDB.load(root_dir=tmp_path, use_snapshot=False).stories)
+
+
+def test_read_from_archive_matches_unpacked(tmp_path):
+	_archived(tmp_path)
+	DataSetLoader(root_dir=tmp_path).unpack()
+	for categories in (None, _subset):
+		from_archive = DataSetLoader(root_dir=tmp_path, read_from_archive=True, categories=categories).load_all()
+		unpacked = DataSetLoader(root_dir=tmp_path, categories=categories).load_all()
+		assert from_archive == unpacked
+	# Unpacking doesn't affect the caches built straight from the archive:
+	archive_snapshots = sorted(x.name for x in tmp_path.rglob('*.archive*.snapshot.pickle'))
+	assert len(archive_snapshots) == 2
+	DataSetLoader(root_dir=tmp_path).unpack(force=True)
+	assert sorted(x.name for x in tmp_path.rglob('*.archive*.snapshot.pickle')) == archive_snapshots
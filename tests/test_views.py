@@ -0,0 +1,115 @@
+# encoding: utf-8
+"""Stories views against plain dicts under the same modifications, and copy-on-write isolation between DBs."""
+
+import random
+
+from attrs import evolve
+
+from .._story_index import StoriesView, StoryIndex
+
+
+def _assert_same(view: StoriesView, expected: dict):
+	assert len(view) == len(expected)
+	assert list(view) == list(expected)
+	assert [id(x) for x in view.values()] == [id(x) for x in expected.values()]
+	assert [(k, id(v)) for k, v in view.items()] == [(k, id(v)) for k, v in expected.items()]
+	assert view == expected
+	for story_id, story in expected.items():
+		assert story_id in view
+		assert view[story_id] is story
+
+
+def test_modifications_match_dict(stories):
+	rnd = random.Random(0)
+	index = StoryIndex()
+	story_list = list(stories.values())
+	view = index.view(dict(list(stories.items())[:100]))
+	expected = dict(list(stories.items())[:100])
+	for step in range(600):
+		action = rnd.random()
+		story = rnd.choice(story_list)
+		if action < 0.35:
+			# Add a story (or set the same one again: an existing ID keeps its position):
+			view[story.id] = story
+			expected[story.id] = story
+		elif action < 0.55:
+			# A new version of the story:
+			new_story = evolve(story, title=f'Title v{step}')
+			view[story.id] = new_story
+			expected[story.id] = new_story
+		elif action < 0.85:
+			if story.id in expected:
+				del view[story.id]
+				del expected[story.id]
+			else:
+				assert story.id not in view
+		elif action < 0.9:
+			assert view.pop(story.id, None) is expected.pop(story.id, None)
+		elif action < 0.95:
+			# Views taken before the modifications still see the old versions:
+			snapshot, snapshot_expected = view.copy(), dict(expected)
+			view['new-' + story.id] = story
+			expected['new-' + story.id] = story
+			_assert_same(snapshot, snapshot_expected)
+		else:
+			view.update({story.id: story})
+			expected.update({story.id: story})
+		_assert_same(view, expected)
+	view.clear()
+	expected.clear()
+	_assert_same(view, expected)
+
+
+def test_views_after_replacements(stories):
+	"""A view taken before a story is replaced keeps the old version of it, and it's found by ID."""
+	index = StoryIndex()
+	view = index.view(stories)
+	old_view = view.copy()
+	story_id, story = next(iter(stories.items()))
+	new_story = evolve(story, title='New')
+	view[story_id] = new_story
+	assert view[story_id] is new_story
+	assert old_view[story_id] is story
+	assert story_id in old_view and story_id in view
+	assert list(old_view) == list(view)
+	# An unrelated view over the same index doesn't get the story from either one:
+	other_view = index.view(dict(list(stories.items())[1:]))
+	assert story_id not in other_view
+
+
+def test_copy_on_write_between_dbs(db):
+	base = db.rating_min(0)
+	derived = base.sorted_by_rating()
+	base_items, derived_items = list(base.stories.items()), list(derived.stories.items())
+	first_id, first_story = base_items[0]
+	other_id = base_items[1][0]
+
+	del base.stories[first_id]
+	base.stories[other_id] = evolve(first_story, id=other_id)
+	assert list(derived.stories.items()) == derived_items
+	assert first_id in derived.stories
+
+	derived.stories['new-story'] = first_story
+	assert 'new-story' not in base.stories
+	assert list(db.stories.items())[:2] == base_items[:2]
+
+
+def test_materialized_db_is_a_plain_dict(db):
+	view_db = db.rating_min(2)
+	materialized = view_db.materialized()
+	assert type(materialized.stories) is dict
+	assert list(materialized.stories.items()) == list(view_db.stories.items())
+	materialized.stories.clear()
+	assert len(view_db.stories) > 0
+	# A DB derived from it is a view again, over the stories it has then:
+	materialized.stories.update(list(view_db.stories.items())[:10])
+	assert list(materialized.rating_min(0).stories) == list(view_db.stories)[:10]
+
+
+def test_lazy_db_modifications(db):
+	lazy = db.lazy().rating_min(3)
+	story_id = next(iter(lazy.stories))
+	del lazy.stories[story_id]
+	assert story_id not in lazy.stories
+	assert story_id in db.stories
+	assert story_id not in lazy.sorted_by_rating().stories